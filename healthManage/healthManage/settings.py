@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'cloudinary',
     'cloudinary_storage',
     'corsheaders',
+    'channels',
 ]
 
 REST_FRAMEWORK = {
@@ -60,7 +62,83 @@ REST_FRAMEWORK = {
 
 CKEDITOR_UPLOAD_PATH = "ckeditors/lessons/"
 
+# Cache trong tiến trình; khi chạy nhiều tiến trình nên dùng django_redis.cache.RedisCache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Thời gian (giây) lưu danh sách học viên của huấn luyện viên trong cache
+COACH_CLIENTS_CACHE_TIMEOUT = 600
+
+# Trang admin managements-stats đọc snapshot; snapshot cũ hơn TTL (giây) được tính lại ở nền
+MANAGEMENTS_STATS_TTL = 300
+MANAGEMENTS_STATS_TOP_N = 10
+MANAGEMENTS_STATS_DEFAULT_DAYS = 30
+# Khoảng thống kê dài nhất (ngày) và số snapshot được giữ lại
+MANAGEMENTS_STATS_MAX_DAYS = 366
+MANAGEMENTS_STATS_MAX_SNAPSHOTS = 200
+
+# Cache access token OAuth2 trong từng tiến trình: số token tối đa và thời gian sống (giây)
+OAUTH2_TOKEN_CACHE_SIZE = 10000
+OAUTH2_TOKEN_CACHE_TTL = 60
+
+# Số dòng đọc mỗi lần khi xuất dữ liệu sức khoẻ (/users/export/)
+EXPORT_CHUNK_SIZE = 2000
+
+# Thời gian (giây) giữ response đã cache của danh mục Activity; bị vô hiệu ngay khi danh mục đổi
+RESPONSE_CACHE_TIMEOUT = 3600
+
+# Ảnh tải lên được ghi tạm vào MEDIA_STAGING_DIR rồi do MEDIA_UPLOAD_WORKERS luồng nền resize và đẩy
+# lên MEDIA_REMOTE_STORE (0 luồng: xử lý ngay trong request)
+MEDIA_STAGING_DIR = BASE_DIR / 'media_staging'
+MEDIA_UPLOAD_WORKERS = 2
+MEDIA_MAX_DIMENSION = 1024
+MEDIA_REMOTE_STORE = 'managements.uploads.CloudinaryStore'
+MEDIA_LOCAL_STORE_DIR = BASE_DIR / 'media_store'
+MEDIA_LOCAL_STORE_URL = '/media/'
+# Ảnh nhập từ URL: chỉ https từ các máy chủ này, tối đa MEDIA_DOWNLOAD_MAX_BYTES byte và MEDIA_DOWNLOAD_TIMEOUT giây
+MEDIA_REMOTE_HOSTS = ['res.cloudinary.com']
+MEDIA_DOWNLOAD_MAX_BYTES = 10 * 1024 * 1024
+MEDIA_DOWNLOAD_TIMEOUT = 30
+
+# Cân bằng năng lượng (/energy-balance/): thời gian (giây) giữ số liệu của mỗi ngày trong cache và
+# số ngày tối đa của một lần truy vấn
+ENERGY_BALANCE_CACHE_TIMEOUT = 86400
+ENERGY_BALANCE_MAX_DAYS = 366
+
+# Dự báo tiến độ mục tiêu cân nặng (lệnh project_goals): số ngày số liệu được dùng, chu kỳ bán rã (ngày) của
+# trọng số, số số liệu và khoảng ngày tối thiểu để dự báo, số người dùng mỗi lô
+GOAL_PROJECTION_WINDOW_DAYS = 90
+GOAL_PROJECTION_HALF_LIFE_DAYS = 21
+GOAL_PROJECTION_MIN_SAMPLES = 3
+GOAL_PROJECTION_MIN_SPAN_DAYS = 3
+GOAL_PROJECTION_BATCH_SIZE = 1000
+
+# Phát hiện bất thường heart_rate/steps (lệnh detect_anomalies): số số liệu liền trước làm mức nền, số số liệu
+# tối thiểu trước khi chấm điểm, ngưỡng điểm z bền vững, số người dùng mỗi lô (chế độ lô) và số số liệu mới
+# mỗi lần đọc (chế độ tăng dần)
+ANOMALY_WINDOW = 30
+ANOMALY_MIN_HISTORY = 10
+ANOMALY_THRESHOLD = 3.5
+ANOMALY_BATCH_USERS = 500
+ANOMALY_CHUNK_ROWS = 200000
+
+# Chuyển dữ liệu cũ sang bảng lưu trữ (lệnh archive_data): tuổi (ngày) của HealthRecord và tin nhắn đã đọc được
+# chuyển đi, số dòng mỗi transaction, số giây nghỉ giữa hai phần và giữa hai lần chạy ở chế độ --schedule
+ARCHIVE_HEALTHRECORD_DAYS = 365
+ARCHIVE_CHATMESSAGE_DAYS = 180
+ARCHIVE_CHUNK_SIZE = 1000
+ARCHIVE_CHUNK_PAUSE = 0.05
+ARCHIVE_INTERVAL = 3600
+
+# Đo số query, thời gian DB/serialize/render và kích thước response của từng request API
+# (header Server-Timing và histogram tại /metrics/)
+REQUEST_METRICS_ENABLED = True
+
 MIDDLEWARE = [
+    'managements.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +171,14 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'healthManage.wsgi.application'
+ASGI_APPLICATION = 'healthManage.asgi.application'
+
+# Channel layer trong tiến trình; khi chạy nhiều tiến trình dùng channels_redis.core.RedisChannelLayer
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -107,6 +193,13 @@ DATABASES = {
     }
 }
 
+# Chạy test và benchmark offline bằng SQLite, không cần MySQL
+if 'test' in sys.argv or 'benchmark' in sys.argv:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
 AUTH_USER_MODEL = 'managements.User'
 
 import pymysql
@@ -168,6 +261,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 OAUTH2_PROVIDER = {
     'SCOPES': {'read': 'Read access', 'write': 'Write access'},
     'GRANT_TYPES': ['password', 'authorization_code', 'refresh_token', 'client_credentials'], # Đảm bảo 'password' ở đây
+    'OAUTH2_VALIDATOR_CLASS': 'managements.tokens.CachedOAuth2Validator',
     # ... các cấu hình khác
 }
 
@@ -0,0 +1,63 @@
+"""
+Quyền xem dữ liệu sức khoẻ: người dùng xem dữ liệu của chính mình, huấn luyện viên xem thêm
+dữ liệu của các học viên có UserConnection 'accepted', quản trị viên (Role.Admin như AdminPermission,
+hoặc is_staff) xem toàn bộ.
+
+Danh sách học viên của mỗi huấn luyện viên được lưu trong cache và bị xoá khi một
+UserConnection của huấn luyện viên đó thay đổi (xem UserConnection.save/delete).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from managements.models import Role, UserConnection
+
+CLIENTS_CACHE_TIMEOUT = getattr(settings, 'COACH_CLIENTS_CACHE_TIMEOUT', 600)
+
+
+def _cache_key(coach_id):
+    return f'coach-clients:{coach_id}'
+
+
+def get_client_ids(coach_id):
+    """
+    Tập id học viên đã được huấn luyện viên chấp nhận.
+    """
+    client_ids = cache.get(_cache_key(coach_id))
+    if client_ids is None:
+        client_ids = frozenset(UserConnection.objects.filter(
+            coach_id=coach_id, status='accepted', active=True).values_list('user_id', flat=True))
+        cache.set(_cache_key(coach_id), client_ids, CLIENTS_CACHE_TIMEOUT)
+    return client_ids
+
+
+def invalidate_client_ids(*coach_ids):
+    cache.delete_many([_cache_key(coach_id) for coach_id in coach_ids if coach_id])
+
+
+def is_admin(user):
+    return user.is_authenticated and (user.role == Role.Admin or user.is_staff)
+
+
+def is_coach(user):
+    return user.is_authenticated and user.role == Role.Coach
+
+
+def can_view_user(viewer, user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return False
+    if is_admin(viewer) or viewer.id == user_id:
+        return True
+    return is_coach(viewer) and user_id in get_client_ids(viewer.id)
+
+
+def filter_visible(queryset, viewer, field='user'):
+    """
+    Giới hạn queryset theo những người dùng mà viewer được xem.
+    """
+    if is_admin(viewer):
+        return queryset
+    if is_coach(viewer):
+        return queryset.filter(**{f'{field}_id__in': {viewer.id, *get_client_ids(viewer.id)}})
+    return queryset.filter(**{field: viewer})
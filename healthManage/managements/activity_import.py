@@ -0,0 +1,124 @@
+"""
+Nhập hàng loạt danh mục Activity từ CSV/JSON.
+
+Các dòng được kiểm tra theo lô, ghi bằng bulk_create(update_conflicts=True) theo name (cập nhật
+activity đã có cùng tên, chỉ các cột dòng nhập có giá trị), lập chỉ mục tìm kiếm cho cả lô và xếp
+hàng tải ảnh qua managements.uploads.
+Kết quả gồm số dòng tạo mới/cập nhật, tốc độ nhập và lỗi của từng dòng.
+"""
+import csv
+import io
+import json
+import time
+
+from django.core.files import File
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from managements import search, uploads
+from managements.models import Activity
+from managements.serializers import ActivityImportSerializer
+
+IMPORT_MAX_ROWS = 20000
+IMPORT_BATCH_SIZE = 500
+IMPORT_FORMATS = ('csv', 'json')
+# Cột được ghi đè khi activity đã tồn tại, nếu dòng nhập có giá trị cho cột đó
+DATA_FIELDS = ['description', 'calories_burned', 'time']
+
+
+def parse_rows(content, file_format):
+    """
+    Đọc nội dung file (str hoặc bytes) thành danh sách dict; ô CSV trống được coi là không có giá trị.
+    File hỏng (JSON/CSV sai cú pháp) báo ValueError.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    if file_format == 'json':
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = data.get('activities')
+        if not isinstance(data, list):
+            raise ValueError("JSON phải là một mảng hoặc {\"activities\": [...]}.")
+        return data
+    if file_format == 'csv':
+        try:
+            return [{key: value if value != '' else None for key, value in row.items()}
+                    for row in csv.DictReader(io.StringIO(content))]
+        except csv.Error as ex:
+            raise ValueError(f"CSV không hợp lệ: {ex}")
+    raise ValueError("Định dạng phải là csv hoặc json.")
+
+
+def validate_rows(rows, offset=0, allow_local_images=False):
+    """
+    Trả về (danh sách dữ liệu hợp lệ kèm vị trí, danh sách lỗi kèm vị trí).
+    """
+    child = ActivityImportSerializer(context={'allow_local_images': allow_local_images})
+    valid, errors = [], []
+    for index, item in enumerate(rows, start=offset):
+        try:
+            valid.append((index, child.run_validation(item)))
+        except ValidationError as ex:
+            errors.append({"index": index, "errors": ex.detail})
+    return valid, errors
+
+
+def _upsert_batch(valid):
+    # Trong một lô, giá trị của dòng sau cùng một tên thắng; ô trống/thiếu giữ giá trị đã có
+    latest = {}
+    for _, data in valid:
+        latest.setdefault(data['name'], {}).update({key: value for key, value in data.items() if value is not None})
+    images = {name: data.pop('image', None) for name, data in latest.items()}
+    activities = [Activity(active=True, **data) for data in latest.values()]
+    existing = set(Activity.objects.filter(name__in=latest).values_list('name', flat=True))
+
+    # Mỗi nhóm dòng có cùng tập cột được ghi bằng một bulk_create chỉ cập nhật các cột đó
+    groups = {}
+    for activity, data in zip(activities, latest.values()):
+        groups.setdefault(tuple(field for field in DATA_FIELDS if field in data), []).append(activity)
+
+    with transaction.atomic():
+        for fields, group in groups.items():
+            Activity.objects.bulk_create(group, update_conflicts=True, unique_fields=['name'],
+                                         update_fields=[*fields, 'active', 'updated_date'])
+        # MySQL không trả về id sau ON DUPLICATE KEY UPDATE nên đọc lại theo name
+        ids = dict(Activity.objects.filter(name__in=latest).values_list('name', 'id'))
+        folded = {name.casefold(): pk for name, pk in ids.items()}
+        for activity in activities:
+            activity.pk = ids.get(activity.name) or folded.get(activity.name.casefold())
+        search.index_activities(activities)
+        for activity in activities:
+            source = images[activity.name]
+            if source:
+                if not uploads.is_remote(source):
+                    with open(source, 'rb') as f:
+                        source = uploads.stage_file(File(f, name=source))
+                uploads.enqueue_source(activity, 'image', source)
+    created = sum(1 for name in latest if name not in existing)
+    return created, len(latest) - created
+
+
+def import_activities(rows, batch_size=IMPORT_BATCH_SIZE, allow_local_images=False):
+    started = time.perf_counter()
+    created = updated = 0
+    errors = []
+    for offset in range(0, len(rows), batch_size):
+        valid, batch_errors = validate_rows(rows[offset:offset + batch_size], offset, allow_local_images)
+        errors += batch_errors
+        if valid:
+            batch_created, batch_updated = _upsert_batch(valid)
+            created += batch_created
+            updated += batch_updated
+    if created or updated:
+        Activity.invalidate_catalog()
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": len(rows),
+        "created": created,
+        "updated": updated,
+        "failed": len(errors),
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(len(rows) / seconds, 1) if seconds else None,
+        "errors": errors,
+    }
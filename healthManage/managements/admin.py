@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count
 from django.template.response import TemplateResponse
 from django.urls import path
+from managements import activity_import, stats
 from managements.models import *
 
 from oauth2_provider.models import AccessToken, Application
@@ -10,30 +10,42 @@ class MyAdminSite(admin.AdminSite):
     site_header = 'Health Management Administration'
 
     def get_urls(self):
-        return [path('managements-stats/', self.managements_stats)] + super().get_urls()
+        return [path('managements-stats/', self.admin_view(self.managements_stats)),
+                path('activity-import/', self.admin_view(self.activity_import))] + super().get_urls()
 
     def managements_stats(self, request):
-        stats = Activity.objects.annotate(activity_count=Count('active')).values('name', 'activity_count')
-        stat = HealthRecord.objects.annotate(re_count=Count('active')).values('bmi', 're_count', 'water_intake','height', 'weight', 'heart_rate', 'steps','date')
-
-        # Thêm thống kê số lượng mục tiêu theo loại
-        goal_stats = UserGoal.objects.values('goal_type').annotate(goal_count=Count('id')).order_by()
-
-        # Thêm thống kê số lượng nhật ký sức khỏe của mỗi người dùng
-        diary_stats = HealthDiary.objects.values('user__username').annotate(diary_count=Count('id')).order_by()
-
-        # Thêm thống kê số lượng hoạt động
-        activity_stats = Activity.objects.annotate(activity_count=Count('workoutplan')).values('name',
-                                                                                               'activity_count').order_by()
-
+        """
+        Hiển thị thống kê từ snapshot đã tính sẵn (xem managements.stats), lọc theo ?from=&to=&top=.
+        """
+        start, end = stats.parse_range(request.GET.get('from'), request.GET.get('to'))
+        try:
+            top = min(max(int(request.GET.get('top', stats.STATS_TOP_N)), 1), 100)
+        except ValueError:
+            top = stats.STATS_TOP_N
+
+        snapshot = stats.get_snapshot(start, end, top)
         return TemplateResponse(request, 'admin/managements-stats.html', {
-            'stats': stats,
-            'stat': stat,
-            'goal_stats': goal_stats,
-            'diary_stats': diary_stats,
-            'activity_stats': activity_stats,  # Thêm dòng này
+            **snapshot.data,
+            'generated_at': snapshot.generated_at,
         })
 
+    def activity_import(self, request):
+        """
+        Nhập danh mục activity từ file CSV/JSON (xem managements.activity_import).
+        """
+        context = {**self.each_context(request), 'title': 'Nhập danh mục hoạt động'}
+        upload = request.FILES.get('file') if request.method == 'POST' else None
+        if upload is not None:
+            try:
+                rows = activity_import.parse_rows(upload.read(), upload.name.rsplit('.', 1)[-1].lower())
+                if len(rows) > activity_import.IMPORT_MAX_ROWS:
+                    raise ValueError(f"Tối đa {activity_import.IMPORT_MAX_ROWS} dòng mỗi lần nhập.")
+            except ValueError as ex:
+                context['error'] = str(ex)
+            else:
+                context['result'] = activity_import.import_activities(rows)
+        return TemplateResponse(request, 'admin/activity-import.html', context)
+
 class UserAdmin(admin.ModelAdmin):
     list_display = ("username", "email", "role", "is_staff", "is_active")
     list_filter = ("role", "is_staff", "is_active")
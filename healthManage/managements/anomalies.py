@@ -0,0 +1,196 @@
+"""
+Phát hiện số liệu bất thường của heart_rate và steps.
+
+Mỗi số liệu được so với ANOMALY_WINDOW số liệu liền trước của cùng người dùng: mức nền là trung vị,
+độ phân tán là MAD (trung vị độ lệch tuyệt đối). Điểm z bền vững 0.6745 * (x - trung vị) / MAD có trị
+tuyệt đối vượt ANOMALY_THRESHOLD (Iglewicz-Hoaglin) thì tạo AnomalyEvent; số liệu có ít hơn
+ANOMALY_MIN_HISTORY số liệu trước đó chưa được chấm điểm. MAD nhỏ hơn MIN_DEVIATION của chỉ số được
+nâng lên mức đó để chuỗi gần như không đổi không bị báo động vì thay đổi rất nhỏ.
+
+HealthRecord được đọc bằng values_list thành mảng NumPy (không tạo model instance) theo lô người dùng;
+cửa sổ trượt của mọi người dùng trong lô được tính cùng lúc bằng sliding_window_view, trung vị lấy
+bằng sắp xếp theo hàng. Có hai chế độ:
+- detect_all: tính lại toàn bộ (hoặc một số người dùng), thay các sự kiện cũ của họ (trừ sự kiện của
+  số liệu đã chuyển sang HealthRecordArchive).
+- detect_new: chỉ chấm điểm số liệu có id lớn hơn AnomalyCheckpoint, mỗi người dùng đọc kèm
+  ANOMALY_WINDOW số liệu cũ gần nhất làm mức nền; số liệu mới được coi là nối tiếp sau số liệu cũ.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from numpy.lib.stride_tricks import sliding_window_view
+
+from managements.models import AnomalyCheckpoint, AnomalyEvent, HealthRecord, HealthRecordArchive
+
+WINDOW = getattr(settings, 'ANOMALY_WINDOW', 30)
+MIN_HISTORY = getattr(settings, 'ANOMALY_MIN_HISTORY', 10)
+THRESHOLD = getattr(settings, 'ANOMALY_THRESHOLD', 3.5)
+BATCH_USERS = getattr(settings, 'ANOMALY_BATCH_USERS', 500)
+CHUNK_ROWS = getattr(settings, 'ANOMALY_CHUNK_ROWS', 200000)
+# Số hàng cửa sổ được sắp xếp mỗi lần (mỗi hàng WINDOW số thực)
+SCORE_CHUNK_ROWS = 50000
+# Chỉ số được theo dõi và MAD tối thiểu của từng chỉ số
+MIN_DEVIATION = {'heart_rate': 2.0, 'steps': 200.0}
+METRICS = list(MIN_DEVIATION)
+CHECKPOINT_KEY = 'healthrecord'
+
+COLUMNS = ['id', 'user_id', 'date', *METRICS]
+
+
+def _row_median(sorted_rows, counts):
+    # Các hàng đã sắp xếp tăng dần, NaN dồn về cuối; counts là số phần tử hợp lệ của từng hàng
+    rows = np.arange(len(sorted_rows))
+    low = sorted_rows[rows, (counts - 1) // 2]
+    high = sorted_rows[rows, counts // 2]
+    return (low + high) / 2
+
+
+def rolling_scores(owners, values, window=WINDOW, min_history=MIN_HISTORY, min_deviation=1.0,
+                   chunk_rows=SCORE_CHUNK_ROWS):
+    """
+    Trung vị, MAD và điểm z bền vững của từng số liệu so với tối đa window số liệu liền trước cùng người dùng.
+
+    owners và values đã sắp xếp theo (người dùng, thời gian). Trả về ba mảng cùng độ dài values;
+    phần tử là NaN nếu số liệu có ít hơn min_history số liệu trước đó.
+    """
+    size = len(values)
+    baseline, deviation = np.full(size, np.nan), np.full(size, np.nan)
+    if not size:
+        return baseline, deviation, np.full(size, np.nan)
+
+    positions = np.arange(size)
+    starts = np.r_[True, owners[1:] != owners[:-1]]
+    history = positions - np.maximum.accumulate(np.where(starts, positions, 0))
+    # Hàng i của windows là values[i - window:i]; các ô trước số liệu đầu tiên của người dùng bị che bằng NaN
+    windows = sliding_window_view(np.concatenate([np.full(window, np.nan), values.astype(float)]), window)
+    columns = np.arange(window)
+
+    scored = np.flatnonzero(history >= min_history)
+    for offset in range(0, len(scored), chunk_rows):
+        rows = scored[offset:offset + chunk_rows]
+        counts = np.minimum(history[rows], window)
+        block = np.where(columns >= window - counts[:, None], windows[rows], np.nan)
+        median = _row_median(np.sort(block, axis=1), counts)
+        mad = _row_median(np.sort(np.abs(block - median[:, None]), axis=1), counts)
+        baseline[rows], deviation[rows] = median, mad
+
+    with np.errstate(invalid='ignore'):
+        score = 0.6745 * (values - baseline) / np.maximum(deviation, min_deviation)
+    return baseline, deviation, score
+
+
+def _load(queryset):
+    rows = list(queryset.values_list(*COLUMNS))
+    arrays = {'id': np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+              'user_id': np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))}
+    for k, metric in enumerate(METRICS, start=3):
+        arrays[metric] = np.fromiter((np.nan if r[k] is None else r[k] for r in rows), dtype=float, count=len(rows))
+    return arrays, [r[2] for r in rows]
+
+
+def find_events(arrays, dates, scored_from=0):
+    """
+    AnomalyEvent (chưa lưu) của các số liệu có id > scored_from; arrays sắp xếp theo (người dùng, thời gian).
+    """
+    events = []
+    for metric in METRICS:
+        present = np.flatnonzero(~np.isnan(arrays[metric]))
+        values = arrays[metric][present]
+        baseline, deviation, score = rolling_scores(arrays['user_id'][present], values,
+                                                    min_deviation=MIN_DEVIATION[metric])
+        with np.errstate(invalid='ignore'):
+            flagged = np.flatnonzero((np.abs(score) > THRESHOLD) & (arrays['id'][present] > scored_from))
+        for i in flagged:
+            row = present[i]
+            events.append(AnomalyEvent(
+                user_id=int(arrays['user_id'][row]), record_id=int(arrays['id'][row]), metric=metric,
+                recorded_at=dates[row], value=float(values[i]), baseline=float(baseline[i]),
+                deviation=float(deviation[i]), score=round(float(score[i]), 3)))
+    return events
+
+
+def _readings():
+    return (HealthRecord.objects.filter(active=True)
+            .filter(Q(**{f'{METRICS[0]}__isnull': False}) | Q(**{f'{METRICS[1]}__isnull': False})))
+
+
+def _set_checkpoint(last_record_id):
+    AnomalyCheckpoint.objects.update_or_create(key=CHECKPOINT_KEY, defaults={'last_record_id': last_record_id})
+
+
+def detect_all(user_ids=None, batch_users=BATCH_USERS):
+    """
+    Chế độ lô: chấm điểm lại toàn bộ số liệu trong bảng chính (của user_ids nếu có) và thay các sự kiện cũ
+    của chúng.
+    """
+    started = time.perf_counter()
+    last_id = HealthRecord.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    readings = _readings().filter(id__lte=last_id)
+    if user_ids:
+        readings = readings.filter(user_id__in=user_ids)
+    users = list(readings.order_by('user_id').values_list('user_id', flat=True).distinct())
+
+    summary = {"mode": "full", "users": len(users), "readings": 0, "events": 0}
+    for offset in range(0, len(users), batch_users):
+        batch = users[offset:offset + batch_users]
+        arrays, dates = _load(readings.filter(user_id__in=batch).order_by('user_id', 'date', 'id'))
+        events = find_events(arrays, dates)
+        # Số liệu đã chuyển sang bảng lưu trữ không được chấm lại nên giữ nguyên sự kiện của chúng
+        archived = HealthRecordArchive.objects.filter(user_id__in=batch).values('id')
+        with transaction.atomic():
+            AnomalyEvent.objects.filter(user_id__in=batch).exclude(record_id__in=archived).delete()
+            AnomalyEvent.objects.bulk_create(events, batch_size=1000)
+        summary['readings'] += len(dates)
+        summary['events'] += len(events)
+    if not user_ids:
+        _set_checkpoint(last_id)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def detect_new(chunk_rows=CHUNK_ROWS):
+    """
+    Chế độ tăng dần: chấm điểm các số liệu mới sau checkpoint, mỗi lần tối đa chunk_rows số liệu.
+    """
+    started = time.perf_counter()
+    checkpoint = AnomalyCheckpoint.objects.filter(key=CHECKPOINT_KEY).first()
+    last_id = checkpoint.last_record_id if checkpoint else 0
+    summary = {"mode": "incremental", "readings": 0, "events": 0}
+    while True:
+        # id của số liệu thứ chunk_rows sau checkpoint, None nếu còn ít hơn chunk_rows số liệu
+        chunk_end = next(iter(_readings().filter(id__gt=last_id).order_by('id')
+                              .values_list('id', flat=True)[chunk_rows - 1:chunk_rows]), None)
+        new = _readings().filter(id__gt=last_id)
+        if chunk_end is not None:
+            new = new.filter(id__lte=chunk_end)
+        arrays, dates = _load(new.order_by('user_id', 'date', 'id'))
+        if not dates:
+            break
+
+        # WINDOW số liệu cũ gần nhất của từng người dùng làm mức nền
+        history = (_readings().filter(user_id__in=new.values('user_id'), id__lte=last_id)
+                   .annotate(recent=Window(RowNumber(), partition_by=[F('user_id')],
+                                           order_by=[F('date').desc(), F('id').desc()]))
+                   .filter(recent__lte=WINDOW).order_by('user_id', 'date', 'id'))
+        old, old_dates = _load(history)
+        # Số liệu mới luôn đứng sau số liệu cũ của cùng người dùng (lexsort giữ nguyên thứ tự còn lại)
+        merged = {name: np.concatenate([old[name], arrays[name]]) for name in arrays}
+        order = np.lexsort((merged['id'] > last_id, merged['user_id']))
+        merged = {name: column[order] for name, column in merged.items()}
+        merged_dates = old_dates + dates
+        events = find_events(merged, [merged_dates[i] for i in order], scored_from=last_id)
+
+        last_id = int(arrays['id'].max())
+        with transaction.atomic():
+            AnomalyEvent.objects.bulk_create(events, batch_size=1000, ignore_conflicts=True)
+            _set_checkpoint(last_id)
+        summary['readings'] += len(dates)
+        summary['events'] += len(events)
+        if chunk_end is None:
+            break
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
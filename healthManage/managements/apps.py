@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ManagementsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'managements'
+
+    def ready(self):
+        # Đăng ký signal xoá cache token khi AccessToken bị thu hồi/sửa
+        from managements import tokens  # noqa: F401
+        # Xoá cache cân bằng năng lượng khi danh sách activity của WorkoutPlan đổi
+        from managements import energy  # noqa: F401
@@ -0,0 +1,182 @@
+"""
+Chuyển dữ liệu không còn dùng thường xuyên của HealthRecord và ChatMessage sang bảng lưu trữ.
+
+Dòng đã xoá mềm (active=False) và dòng cũ hơn ARCHIVE_HEALTHRECORD_DAYS / ARCHIVE_CHATMESSAGE_DAYS ngày
+(với tin nhắn: chỉ tin đã đọc) được chép sang HealthRecordArchive / ChatMessageArchive, giữ nguyên id,
+rồi xoá khỏi bảng chính. Mỗi phần ARCHIVE_CHUNK_SIZE dòng nằm trong một transaction ngắn và giữa hai
+phần nghỉ ARCHIVE_CHUNK_PAUSE giây nên không khoá bảng lâu. Việc xoá dùng QuerySet.delete() nên
+HealthRecord.delete() không chạy: bảng tổng hợp giữ nguyên số liệu của các ngày đã chuyển.
+
+Đọc: ArchiveChain trộn bảng chính với bảng lưu trữ (và các nhánh của một điều kiện OR) theo thứ tự sắp xếp
+cho list/retrieve của API;
+danh sách cuộc trò chuyện, rollups và export cũng đọc thêm bảng lưu trữ khi dữ liệu cần có thể đã bị chuyển.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from managements.models import ChatMessage, ChatMessageArchive, HealthRecord, HealthRecordArchive
+
+HEALTHRECORD_DAYS = getattr(settings, 'ARCHIVE_HEALTHRECORD_DAYS', 365)
+CHATMESSAGE_DAYS = getattr(settings, 'ARCHIVE_CHATMESSAGE_DAYS', 180)
+CHUNK_SIZE = getattr(settings, 'ARCHIVE_CHUNK_SIZE', 1000)
+CHUNK_PAUSE = getattr(settings, 'ARCHIVE_CHUNK_PAUSE', 0.05)
+INTERVAL = getattr(settings, 'ARCHIVE_INTERVAL', 3600)
+
+# nguồn: (bảng chính, bảng lưu trữ, trường thời gian, số ngày, điều kiện thêm cho dòng cũ)
+ARCHIVE_SOURCES = {
+    'healthrecord': (HealthRecord, HealthRecordArchive, 'date', HEALTHRECORD_DAYS, Q()),
+    'chatmessage': (ChatMessage, ChatMessageArchive, 'timestamp', CHATMESSAGE_DAYS, Q(is_read=True)),
+}
+
+
+def cutoff(source, now=None):
+    """
+    Mốc thời gian của source: dòng cũ hơn mốc có thể đã nằm trong bảng lưu trữ.
+    """
+    days = ARCHIVE_SOURCES[source][3]
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_condition(source, now=None):
+    _, _, field, _, extra = ARCHIVE_SOURCES[source]
+    return Q(active=False) | (Q(**{f'{field}__lt': cutoff(source, now)}) & extra)
+
+
+def archive_source(source, chunk_size=CHUNK_SIZE, pause=CHUNK_PAUSE, now=None, dry_run=False):
+    """
+    Chuyển các dòng thoả archive_condition của source sang bảng lưu trữ, mỗi transaction chunk_size dòng.
+    Trả về thống kê của lần chạy; dry_run chỉ đếm.
+    """
+    started = time.perf_counter()
+    model, archive_model, _, _, _ = ARCHIVE_SOURCES[source]
+    now = now or timezone.now()
+    condition = archive_condition(source, now)
+    candidates = model._base_manager.filter(condition)
+    summary = {"source": source, "moved": 0, "chunks": 0}
+    if dry_run:
+        summary['moved'] = candidates.count()
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        return summary
+
+    columns = [field.attname for field in model._meta.concrete_fields]
+    last_id = 0
+    while True:
+        ids = list(candidates.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            break
+        with transaction.atomic():
+            # Khoá và đọc lại trong transaction: dòng vừa được sửa (vd. khôi phục active) không bị chuyển nhầm
+            rows = list(model._base_manager.select_for_update().filter(condition, id__in=ids).values(*columns))
+            archive_model.objects.bulk_create([archive_model(**row, archived_at=now) for row in rows])
+            model._base_manager.filter(id__in=[row['id'] for row in rows]).delete()
+        summary['moved'] += len(rows)
+        summary['chunks'] += 1
+        last_id = ids[-1]
+        if len(ids) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def archive_all(sources=None, chunk_size=CHUNK_SIZE, pause=CHUNK_PAUSE, now=None, dry_run=False):
+    return [archive_source(source, chunk_size, pause, now, dry_run) for source in sources or ARCHIVE_SOURCES]
+
+
+class ArchiveChain:
+    """
+    Nhiều queryset (bảng chính, bảng lưu trữ, hoặc từng nhánh của một điều kiện OR) đọc như một queryset
+    (chỉ đọc). Các phần không được trùng dòng. filter/order_by/only/... áp dụng cho mọi phần; kết quả được
+    trộn theo các trường ORDER BY (tên trường, có thể có '-') nên đúng thứ tự cả khi bảng chính còn dòng cũ
+    hơn dòng đã lưu trữ (vd. tin nhắn cũ chưa đọc).
+
+    Với một lát [start:stop], trước hết đọc (pk, các trường sắp xếp) của tối đa stop dòng đầu mỗi phần,
+    trộn lại, rồi chỉ tải đầy đủ các dòng nằm trong lát: mỗi phần là một lần quét chỉ mục có thứ tự kèm
+    LIMIT. Chỉ một phần có dòng phù hợp (hoặc đã biết các phần khác rỗng sau count() của phân trang theo
+    trang) thì lát được đọc thẳng từ phần đó như queryset thường.
+    """
+    CHAINED = ('all', 'filter', 'exclude', 'order_by', 'select_related', 'prefetch_related', 'only', 'defer')
+
+    def __init__(self, *parts):
+        self.parts = parts
+        self.model = parts[0].model
+        self._counts = None
+
+    def __getattr__(self, name):
+        if name not in self.CHAINED:
+            raise AttributeError(name)
+
+        def chained(*args, **kwargs):
+            return ArchiveChain(*(getattr(part, name)(*args, **kwargs) for part in self.parts))
+        return chained
+
+    @property
+    def ordered(self):
+        return self.parts[0].ordered
+
+    def _ordering(self):
+        ordering = self.parts[0].query.order_by or self.model._meta.ordering
+        return [(str(item).lstrip('-'), str(item).startswith('-')) for item in ordering]
+
+    def _sorted(self, rows, value):
+        # Sắp xếp ổn định lần lượt từ trường có độ ưu tiên thấp nhất; value(dòng, vị trí trường)
+        for position, (_, descending) in reversed(list(enumerate(self._ordering()))):
+            rows.sort(key=lambda row: value(row, position), reverse=descending)
+        return rows
+
+    def count(self):
+        self._counts = [part.count() for part in self.parts]
+        return sum(self._counts)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        names = [name for name, _ in self._ordering()]
+        rows = [row for part in self.parts for row in part]
+        return iter(self._sorted(rows, lambda row, i: getattr(row, names[i])))
+
+    def get(self, *args, **kwargs):
+        for part in self.parts:
+            try:
+                return part.get(*args, **kwargs)
+            except part.model.DoesNotExist:
+                pass
+        raise self.model.DoesNotExist(f'{self.model._meta.object_name} matching query does not exist.')
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            rows = self[key:key + 1]
+            if not rows:
+                raise IndexError(key)
+            return rows[0]
+        start, stop = key.start or 0, key.stop
+        if stop is None:
+            return list(self)[start:]
+        if self._counts is not None and sum(1 for count in self._counts if count) <= 1:
+            part = next((part for part, count in zip(self.parts, self._counts) if count), self.parts[0])
+            return list(part[start:stop])
+
+        names = [name for name, _ in self._ordering()]
+        keys = []
+        for index, part in enumerate(self.parts):
+            if self._counts is None or self._counts[index]:
+                keys += [(index, *row) for row in part.values_list('pk', *names)[:stop]]
+        if len({row[0] for row in keys}) <= 1:
+            part = self.parts[keys[0][0]] if keys else self.parts[0]
+            return list(part[start:stop])
+        window = self._sorted(keys, lambda row, i: row[2 + i])[start:stop]
+
+        loaded = {}
+        for index, part in enumerate(self.parts):
+            wanted = [row[1] for row in window if row[0] == index]
+            if wanted:
+                loaded.update({(index, obj.pk): obj for obj in part.filter(pk__in=wanted).order_by()})
+        return [loaded[row[0], row[1]] for row in window]
@@ -0,0 +1,940 @@
+"""
+Bộ đo hiệu năng, chạy bằng: python manage.py benchmark [tên ...]
+
+Mỗi benchmark nhận options của lệnh và trả về danh sách kết quả (dict). Lệnh benchmark luôn
+chạy trên một CSDL SQLite tạm nên không ảnh hưởng dữ liệu thật. Kết quả có thể lưu làm baseline
+(--save-baseline, file benchmark_baselines.json) để so sánh ở lần chạy sau (--compare, --max-regression).
+"""
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Mod
+from django.test import override_settings
+from django.urls import resolve
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from PIL import Image
+from rest_framework.test import APIClient
+
+from managements import anomalies, archive, httpcache, instrumentation, projection, rollups, search, tokens, uploads
+from managements.models import (Activity, AnomalyEvent, ChatMessage, GoalProgress, HealthDiary, HealthRecord,
+                                HealthRecordArchive, MealPlan, MediaUpload, Role, Tag, User, UserConnection, UserGoal,
+                                WorkoutPlan)
+from managements.serializers import UserSerializer
+from managements.urls import router
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(label, rows, func):
+    """
+    Chạy func() một lần và trả về kết quả gồm thời gian và số dòng/giây.
+    """
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    return {
+        "name": label,
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+    }
+
+
+def percentiles(samples):
+    """
+    p50/p95/p99 (mili giây) của danh sách thời gian tính bằng giây.
+    """
+    if len(samples) < 2:
+        samples = samples * 2
+    cuts = statistics.quantiles([s * 1000 for s in samples], n=100, method='inclusive')
+    return {"p50_ms": round(cuts[49], 3), "p95_ms": round(cuts[94], 3), "p99_ms": round(cuts[98], 3)}
+
+
+def latencies(label, calls, func):
+    """
+    Gọi func(arg) với từng phần tử của calls và trả về phân vị độ trễ.
+    """
+    samples = []
+    for arg in calls:
+        started = time.perf_counter()
+        func(arg)
+        samples.append(time.perf_counter() - started)
+    return {"name": label, "calls": len(samples), **percentiles(samples)}
+
+
+def bench_user(username='bench', role=Role.Exerciser_Self_Help):
+    user, _ = User.objects.get_or_create(username=username, defaults={
+        'email': f'{username}@example.com',
+        'role': role,
+    })
+    return user
+
+
+def authenticated_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def sample_readings(rows):
+    return [{
+        "steps": 100 + i % 900,
+        "heart_rate": 60 + i % 40,
+        "height": 160 + i % 30,
+        "weight": 50 + i % 40,
+        "water_intake": 0.25,
+    } for i in range(rows)]
+
+
+@benchmark('ingest')
+def bench_ingest(options):
+    """
+    So sánh POST từng số liệu qua /healthrecord/ với một lần POST /healthrecord/bulk/.
+    """
+    rows = options['rows']
+    single_rows = min(rows, 500)
+    client = authenticated_client(bench_user())
+    readings = sample_readings(rows)
+
+    def post_each():
+        for reading in readings[:single_rows]:
+            client.post('/healthrecord/', reading, format='json')
+
+    def post_bulk():
+        response = client.post('/healthrecord/bulk/', {"records": readings}, format='json')
+        assert response.data['created'] == rows, response.data
+
+    results = [
+        measure('healthrecord create (từng dòng)', single_rows, post_each),
+        measure('healthrecord bulk', rows, post_bulk),
+    ]
+    assert HealthRecord.objects.count() == single_rows + rows
+    return results
+
+
+WORDS = ['squat', 'chạy', 'bộ', 'nhảy', 'dây', 'đạp', 'xe', 'bơi', 'yoga', 'plank', 'gập', 'bụng', 'tay',
+         'chân', 'vai', 'lưng', 'cardio', 'giãn', 'cơ', 'hít', 'đất', 'tạ', 'đơn', 'kéo', 'xà', 'leo', 'núi']
+
+
+@benchmark('activity_search')
+def bench_activity_search(options):
+    """
+    Độ trễ tìm kiếm Activity qua chỉ mục token so với name__icontains trên danh mục lớn.
+    """
+    size = options['catalog_size']
+    rng = random.Random(42)
+    vocabulary = [f'{word}{variant}' for word in WORDS for variant in range(100)]
+    batch = []
+    started = time.perf_counter()
+    for i in range(size):
+        name = ' '.join(rng.sample(vocabulary, 3)) + f' {i}'
+        batch.append(Activity(name=name, description=f"<p>{' '.join(rng.sample(vocabulary, 8))}</p>"))
+        if len(batch) == 5000 or i == size - 1:
+            search.index_activities(Activity.objects.bulk_create(batch))
+            batch = []
+    build = {"name": "lập chỉ mục", "rows": size, "seconds": round(time.perf_counter() - started, 2)}
+
+    queries = [rng.choice(vocabulary) for _ in range(100)]
+    queries += [' '.join(rng.sample(vocabulary, 2)) for _ in range(100)]
+    prefixes = [rng.choice(vocabulary)[:-1] for _ in range(100)]
+    activities = Activity.objects.filter(active=True)
+    return [
+        build,
+        latencies('name__icontains', queries,
+                  lambda q: list(activities.filter(name__icontains=q)[:20])),
+        latencies('search_activities', queries,
+                  lambda q: list(search.search_activities(activities, q)[:20])),
+        latencies('search_activities (tiền tố)', prefixes,
+                  lambda q: list(search.search_activities(activities, q, names_only=True).values('id', 'name')[:10])),
+    ]
+
+
+@benchmark('serializers')
+def bench_serializers(options):
+    """
+    Thời gian CPU của UserSerializer khi đọc URL ảnh đã lưu so với dựng URL Cloudinary cho từng dòng.
+    """
+    rows = options['rows']
+    User.objects.bulk_create([User(username=f'avatar{i}', email=f'avatar{i}@example.com',
+                                   avatar=f'image/upload/v1712/avatar/user{i}.jpg') for i in range(rows)])
+    for user in User.objects.filter(username__startswith='avatar'):
+        user.save()
+    users = list(User.objects.filter(username__startswith='avatar'))
+
+    class ComputedUrlSerializer(UserSerializer):
+        def get_avatar_url(self, user):
+            return user.avatar.url if user.avatar else None
+
+        def get_avatar_thumbnail_url(self, user):
+            return user.avatar.build_url(width=200, height=200, crop='fill') if user.avatar else None
+
+    def serialize(serializer_class):
+        return lambda: serializer_class(users, many=True).data
+
+    return [
+        measure('UserSerializer, dựng URL mỗi dòng', rows, serialize(ComputedUrlSerializer)),
+        measure('UserSerializer, URL lưu sẵn', rows, serialize(UserSerializer)),
+    ]
+
+
+@benchmark('uploads')
+def bench_uploads(options):
+    """
+    Độ trễ PATCH /users/update-info/ kèm avatar khi resize và tải lên ngay trong request so với
+    khi chỉ ghi tạm rồi để worker xử lý (kho LocalFileStore thay cho Cloudinary).
+    """
+    calls = 30
+    buffer = BytesIO()
+    Image.new('RGB', (2400, 1600), 'red').save(buffer, format='JPEG')
+    photo = buffer.getvalue()
+    client = authenticated_client(bench_user())
+
+    def upload(_):
+        avatar = SimpleUploadedFile('avatar.jpg', photo, content_type='image/jpeg')
+        response = client.patch('/users/update-info/', {'avatar': avatar}, format='multipart')
+        assert response.status_code == 200, response.data
+
+    with tempfile.TemporaryDirectory() as tmp, override_settings(
+            MEDIA_STAGING_DIR=f'{tmp}/staging', MEDIA_LOCAL_STORE_DIR=f'{tmp}/store',
+            MEDIA_REMOTE_STORE='managements.uploads.LocalFileStore'):
+        with mock.patch.object(uploads, 'UPLOAD_WORKERS', 0):
+            inline = latencies('update-info, tải lên trong request', range(calls), upload)
+        queued = []
+        with mock.patch.object(uploads, 'submit', queued.append):
+            staged = latencies('update-info, ghi tạm + worker', range(calls), upload)
+        worker = measure('worker resize + tải lên', len(queued), lambda: [uploads.process_upload(pk) for pk in queued])
+    assert MediaUpload.objects.filter(status='done').count() == 2 * calls
+    return [inline, staged, worker]
+
+
+@benchmark('activity_catalog')
+def bench_activity_catalog(options):
+    """
+    Độ trễ GET /activity/ và /activity/<id>/ khi không có cache, khi đọc từ cache và khi trả 304.
+    """
+    rows = options['rows']
+    activities = Activity.objects.bulk_create(
+        [Activity(name=f'Activity {i}', description=f'<p>Bài tập số {i}</p>', calories_burned=i % 500)
+         for i in range(rows)])
+    client = APIClient()
+    urls = [f'/activity/?page={page}' for page in range(1, 101)] + [f'/activity/{a.pk}/' for a in activities[:100]]
+
+    def uncached(url):
+        httpcache.bump_version('activity')
+        client.get(url)
+
+    cache.clear()
+    results = [latencies('không cache', urls, uncached)]
+    etags = {url: client.get(url)['ETag'] for url in urls}
+    results.append(latencies('đọc từ cache', urls, client.get))
+    results.append(latencies('If-None-Match (304)', urls,
+                             lambda url: client.get(url, HTTP_IF_NONE_MATCH=etags[url])))
+    return results
+
+
+@benchmark('sparse_fields')
+def bench_sparse_fields(options):
+    """
+    Độ trễ và kích thước JSON của /workoutplan/my-plans/ khi lồng đầy đủ (?expand=user,activities,
+    như trước đây), khi trả về id (mặc định) và khi chỉ chọn ?fields=id,name,date.
+    """
+    rows = min(options['rows'], 1000)
+    user = bench_user()
+    activities = Activity.objects.bulk_create(
+        [Activity(name=f'Activity {i}', description='<p>' + 'Mô tả bài tập. ' * 40 + '</p>') for i in range(20)])
+    plans = WorkoutPlan.objects.bulk_create(
+        [WorkoutPlan(user=user, name=f'Plan {i}', date='2025-01-01', description='Kế hoạch ' * 20) for i in range(rows)])
+    through = WorkoutPlan.activities.through
+    through.objects.bulk_create([through(workoutplan_id=plan.pk, activity_id=activities[(plan.pk + k) % 20].pk)
+                                 for plan in plans for k in range(3)])
+    client = authenticated_client(user)
+
+    results = []
+    for label, query in [('expand=user,activities', '?expand=user,activities'),
+                         ('mặc định (id)', ''),
+                         ('fields=id,name,date', '?fields=id,name,date')]:
+        url = '/workoutplan/my-plans/' + query
+        size = len(client.get(url).content)
+        results.append({**latencies(label, range(20), lambda _: client.get(url)), "bytes": size})
+    return results
+
+
+@benchmark('token_cache')
+def bench_token_cache(options):
+    """
+    Số request/giây của GET /users/current/ xác thực bằng access token OAuth2, có và không có cache token.
+    """
+    calls = 500
+    user = bench_user()
+    application = Application.objects.create(name='bench', client_type=Application.CLIENT_CONFIDENTIAL,
+                                             authorization_grant_type=Application.GRANT_PASSWORD)
+    AccessToken.objects.create(user=user, application=application, token='bench-token', scope='read write',
+                               expires=timezone.now() + timedelta(hours=1))
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Bearer bench-token')
+
+    def run():
+        for _ in range(calls):
+            assert client.get('/users/current/').status_code == 200
+
+    tokens.token_cache.clear()
+    with mock.patch.object(tokens.token_cache, 'maxsize', 0):
+        uncached = measure('không cache token', calls, run)
+    cached = measure('cache token', calls, run)
+    return [uncached, cached]
+
+
+@benchmark('export')
+def bench_export(options):
+    """
+    Tốc độ và bộ nhớ đỉnh (tracemalloc) khi tải /users/export/ dạng CSV, NDJSON và CSV gzip.
+    Bộ nhớ đỉnh gần như không đổi khi số dòng tăng.
+    """
+    user = bench_user()
+    client = authenticated_client(user)
+    results = []
+    total = 0
+    for rows in (options['rows'] * 10, options['rows'] * 50):
+        HealthRecord.objects.bulk_create(
+            [HealthRecord(user=user, **reading) for reading in sample_readings(rows - total)], batch_size=2000)
+        total = rows
+        for label, query in [('csv', ''), ('ndjson', '?output=ndjson'), ('csv gzip', '?gzip=1')]:
+            size = 0
+            tracemalloc.start()
+            started = time.perf_counter()
+            for chunk in client.get('/users/export/' + query).streaming_content:
+                size += len(chunk)
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({"name": label, "rows": rows, "seconds": round(seconds, 3),
+                            "rows_per_sec": round(rows / seconds, 1), "bytes": size,
+                            "peak_kb": round(peak / 1024)})
+    return results
+
+
+@benchmark('activity_import')
+def bench_activity_import(options):
+    """
+    So sánh POST /activity/ từng activity với một lần POST /activity/import/ (tạo mới rồi cập nhật lại
+    toàn bộ danh mục theo tên).
+    """
+    rows = options['rows']
+    single_rows = min(rows, 300)
+    client = authenticated_client(bench_user('bench-coach', Role.Coach))
+    catalog = [{"name": f"{random.choice(WORDS)} {random.choice(WORDS)} {i}", "description": "Bài tập mẫu",
+                "calories_burned": 5 + i % 300, "time": 1 + i % 60} for i in range(rows)]
+
+    def post_each():
+        for item in catalog[:single_rows]:
+            client.post('/activity/', {**item, "name": f"single {item['name']}"}, format='json')
+
+    def post_import():
+        response = client.post('/activity/import/', {"activities": catalog}, format='json')
+        assert response.data['failed'] == 0, response.data
+
+    results = [
+        measure('activity create (từng dòng)', single_rows, post_each),
+        measure('activity import (tạo mới)', rows, post_import),
+        measure('activity import (cập nhật)', rows, post_import),
+    ]
+    assert Activity.objects.count() == single_rows + rows
+    return results
+
+
+@benchmark('instrumentation')
+def bench_instrumentation(options):
+    """
+    Độ trễ của vài route khi bật và tắt RequestMetricsMiddleware (Server-Timing và histogram /metrics/).
+    """
+    calls = 500
+    user = bench_user()
+    HealthRecord.objects.bulk_create([HealthRecord(user=user, **reading) for reading in sample_readings(200)])
+    client = authenticated_client(user)
+    results = []
+    for url in ('/users/current/', '/healthrecord/', '/healthrecord/?fields=id,date,steps'):
+        for label, enabled in (('tắt đo', False), ('bật đo', True)):
+            with mock.patch.object(instrumentation, 'METRICS_ENABLED', enabled):
+                client.get(url)
+                results.append(latencies(f'{url} ({label})', range(calls), lambda _: client.get(url)))
+    instrumentation.registry.reset()
+    return results
+
+
+@benchmark('coach_dashboard')
+def bench_coach_dashboard(options):
+    """
+    GET /connection/dashboard/ khi huấn luyện viên có 20, 100 và 200 học viên (số query không đổi), so với
+    gọi plans-by-user lần lượt cho 200 học viên.
+    """
+    coach = bench_user('bench-coach', Role.Coach)
+    client = authenticated_client(coach)
+    today = timezone.now().date()
+    results = []
+    total = 0
+    for clients in (20, 100, 200):
+        users = User.objects.bulk_create([
+            User(username=f'bench-client{i}', email=f'bench-client{i}@example.com', role=Role.Exerciser_With_Coach)
+            for i in range(total, clients)])
+        UserConnection.objects.bulk_create([UserConnection(user=user, coach=coach, status='accepted')
+                                            for user in users])
+        HealthRecord.objects.bulk_create([HealthRecord(user=user, **reading) for user in users
+                                          for reading in sample_readings(20)])
+        WorkoutPlan.objects.bulk_create([WorkoutPlan(user=user, name=f'Buổi {k}', date=today - timedelta(days=k))
+                                         for user in users for k in range(10)])
+        UserGoal.objects.bulk_create([UserGoal(user=user, goal_type='Giảm cân', target_weight=60) for user in users])
+        cache.clear()
+        total = clients
+
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            assert len(client.get('/connection/dashboard/').data['clients']) == clients
+        result = latencies(f'dashboard ({clients} học viên)', range(50), lambda _: client.get('/connection/dashboard/'))
+        results.append({**result, "queries": queries})
+
+    user_ids = list(UserConnection.objects.filter(coach=coach).values_list('user_id', flat=True))
+
+    def per_client():
+        for user_id in user_ids:
+            client.get(f'/workoutplan/plans-by-user/{user_id}/')
+
+    results.append(measure(f'plans-by-user từng học viên ({len(user_ids)} request)', len(user_ids), per_client))
+    return results
+
+
+@benchmark('goal_projection')
+def bench_goal_projection(options):
+    """
+    project_goals (hồi quy gộp theo lô bằng np.bincount) so với hồi quy np.polyfit cho từng người dùng,
+    trên options['rows'] // 2 người dùng, mỗi người 60 số liệu cân nặng.
+    """
+    users = max(options['rows'] // 2, 1)
+    now = timezone.now()
+    rng = random.Random(42)
+    members = User.objects.bulk_create([User(username=f'bench-goal{i}', email=f'bench-goal{i}@example.com',
+                                             role=Role.Exerciser_Self_Help) for i in range(users)])
+    # Không cần bảng tổng hợp nên bỏ qua HealthRecordManager
+    HealthRecord._base_manager.bulk_create([
+        HealthRecord(user=user, date=now - timedelta(days=k * 1.5), weight=70 + k * rng.uniform(-0.1, 0.1))
+        for user in members for k in range(60)], batch_size=SEED_BATCH_SIZE)
+    UserGoal.objects.bulk_create([UserGoal(user=user, goal_type='Cân nặng', target_weight=65,
+                                           target_date=now.date() + timedelta(days=60)) for user in members])
+    records = users * 60
+
+    def per_user():
+        since = now - timedelta(days=projection.WINDOW_DAYS)
+        for user in members:
+            rows = list(HealthRecord.objects.filter(user=user, weight__isnull=False, date__gte=since)
+                        .values_list('date', 'weight'))
+            days = np.array([(date - now).total_seconds() / 86400 for date, _ in rows])
+            weights = np.array([weight for _, weight in rows])
+            np.polyfit(days, weights, 1, w=np.sqrt(0.5 ** (-days / projection.HALF_LIFE_DAYS)))
+
+    results = [
+        measure(f'polyfit từng người dùng ({users} người)', records, per_user),
+        measure(f'project_goals ({users} người)', records, lambda: projection.project_goals(now=now)),
+    ]
+    assert GoalProgress.objects.count() == users
+    return results
+
+
+@benchmark('anomalies')
+def bench_anomalies(options):
+    """
+    detect_anomalies trên --readings số liệu (1000 số liệu mỗi người dùng, khoảng 0,2% là bất thường):
+    chế độ lô toàn bộ, rồi chế độ tăng dần cho 1% số liệu mới.
+    """
+    readings = options['readings']
+    per_user = 1000
+    users = max(readings // per_user, 1)
+    now = timezone.now()
+    rng = np.random.default_rng(42)
+    members = User.objects.bulk_create([User(username=f'bench-anomaly{i}', email=f'bench-anomaly{i}@example.com',
+                                             role=Role.Exerciser_Self_Help) for i in range(users)])
+
+    def add_readings(count, start):
+        heart_rate = rng.normal(72, 4, (users, count)).round()
+        steps = rng.normal(6000, 800, (users, count)).round()
+        spikes = rng.random((users, count)) < 0.001
+        heart_rate[spikes] += 60
+        steps[rng.random((users, count)) < 0.001] = 40000
+        for offset in range(0, users, 20):
+            HealthRecord._base_manager.bulk_create([
+                HealthRecord(user=user, date=now - timedelta(hours=per_user * 2 - start - k),
+                             heart_rate=int(heart_rate[u, k]), steps=int(steps[u, k]))
+                for u, user in enumerate(members[offset:offset + 20], start=offset) for k in range(count)],
+                batch_size=SEED_BATCH_SIZE)
+
+    started = time.perf_counter()
+    add_readings(per_user, 0)
+    results = [{"name": "dữ liệu tổng hợp", "users": users, "readings": users * per_user,
+                "seconds": round(time.perf_counter() - started, 2)}]
+
+    full = anomalies.detect_all()
+    results.append({"name": "detect_all (lô)", "rows": full['readings'], "events": full['events'],
+                    "seconds": full['seconds'], "rows_per_sec": round(full['readings'] / full['seconds'], 1)})
+    add_readings(per_user // 100, per_user)
+    incremental = anomalies.detect_new()
+    results.append({"name": "detect_new (1% số liệu mới)", "rows": incremental['readings'],
+                    "events": incremental['events'], "seconds": incremental['seconds'],
+                    "rows_per_sec": round(incremental['readings'] / incremental['seconds'], 1)})
+    return results
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+# Chiều của từng chỉ số: 1 nếu tăng là chậm đi, -1 nếu giảm là chậm đi
+COMPARED_KEYS = {'p50_ms': 1, 'p95_ms': 1, 'p99_ms': 1, 'seconds': 1, 'queries': 1,
+                 'req_per_sec': -1, 'rows_per_sec': -1}
+
+
+def load_baselines(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(runs, path=BASELINE_FILE):
+    """
+    Ghi kết quả {tên benchmark: [kết quả]} vào file baseline, giữ nguyên baseline của các benchmark khác.
+    """
+    baselines = load_baselines(path)
+    for name, results in runs.items():
+        baselines[name] = {result['name']: result for result in results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(result, baseline):
+    """
+    Phần trăm thay đổi của từng chỉ số so với baseline; số dương nghĩa là chậm hơn.
+    """
+    changes = {}
+    for key, direction in COMPARED_KEYS.items():
+        old, new = baseline.get(key), result.get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else (100.0 if new else 0.0)
+        changes[key] = round(change * direction, 1)
+    return changes
+
+
+BENCH_PASSWORD = 'load-password'
+SEED_BATCH_SIZE = 20000
+
+
+DIARY_FEELINGS = ['Tốt', 'Khá', 'Mệt', 'Bình thường', 'Rất tốt']
+
+
+def backdate(queryset, field, key, dates):
+    """
+    Lùi trường auto_now_add (bulk_create luôn ghi thời điểm tạo) về thời điểm lịch sử bằng một UPDATE:
+    dates ánh xạ giá trị của cột key sang thời điểm cần gán.
+    """
+    queryset.filter(**{f'{key}__in': list(dates)}).update(**{field: Case(
+        *[When(**{key: value}, then=Value(date)) for value, date in dates.items()],
+        output_field=queryset.model._meta.get_field(field))})
+
+
+def seed_dataset(users, records_per_user, messages_per_user=20, clients_per_coach=20, seed=42):
+    """
+    Sinh dữ liệu tổng hợp: users học viên chia đều cho các huấn luyện viên (kết nối 'accepted'),
+    records_per_user HealthRecord trải đều trong một năm, lịch sử chat với huấn luyện viên, kế hoạch
+    tập/ăn, nhật ký, mục tiêu và danh mục activity. Trả về (id các đối tượng mẫu, dòng tóm tắt).
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    now = timezone.now()
+    today = now.date()
+    password = make_password(BENCH_PASSWORD)
+    coaches = max(users // clients_per_coach, 1)
+
+    User.objects.bulk_create(
+        [User(username=f'load-user{i}', email=f'load-user{i}@example.com', password=password,
+              role=Role.Exerciser_With_Coach) for i in range(users)]
+        + [User(username=f'load-coach{i}', email=f'load-coach{i}@example.com', password=password,
+                role=Role.Coach) for i in range(coaches)]
+        + [User(username='load-admin', email='load-admin@example.com', password=password,
+                role=Role.Admin, is_staff=True)], batch_size=SEED_BATCH_SIZE)
+    ids = dict(User.objects.filter(username__startswith='load-').values_list('username', 'id'))
+    user_ids = [ids[f'load-user{i}'] for i in range(users)]
+    coach_ids = [ids[f'load-coach{i}'] for i in range(coaches)]
+    coach_of = {user_id: coach_ids[i % coaches] for i, user_id in enumerate(user_ids)}
+    UserConnection.objects.bulk_create([UserConnection(user_id=user_id, coach_id=coach_id, status='accepted')
+                                        for user_id, coach_id in coach_of.items()], batch_size=SEED_BATCH_SIZE)
+
+    activities = Activity.objects.bulk_create(
+        [Activity(name=f'load {rng.choice(WORDS)} {rng.choice(WORDS)} {i}', description='<p>Bài tập mẫu</p>',
+                  calories_burned=rng.randint(20, 600), time=rng.randint(5, 90)) for i in range(200)])
+    search.index_activities(activities)
+    Tag.objects.bulk_create([Tag(name=f'load-tag{i}') for i in range(50)])
+
+    step = timedelta(days=365) / max(records_per_user, 1)
+    batch = []
+    for user_id in user_ids:
+        for k in range(records_per_user):
+            height, weight = rng.randint(150, 195), rng.randint(45, 110)
+            batch.append(HealthRecord(user_id=user_id, date=now - step * k, steps=rng.randint(500, 15000),
+                                      heart_rate=rng.randint(55, 110), water_intake=rng.choice([0.25, 0.5, 1]),
+                                      height=height, weight=weight, bmi=round(weight / (height / 100) ** 2, 2)))
+        if len(batch) >= SEED_BATCH_SIZE:
+            HealthRecord._base_manager.bulk_create(batch)
+            batch = []
+    HealthRecord._base_manager.bulk_create(batch)
+
+    HealthDiary.objects.bulk_create([HealthDiary(user_id=user_id, feeling=feeling, content='<p>Hôm nay tập đủ bài.</p>')
+                                     for user_id in user_ids for feeling in DIARY_FEELINGS], batch_size=SEED_BATCH_SIZE)
+    backdate(HealthDiary.objects.filter(user_id__in=user_ids), 'date', 'feeling',
+             {feeling: now - timedelta(days=k) for k, feeling in enumerate(DIARY_FEELINGS)})
+    ChatMessage.objects.bulk_create(
+        [ChatMessage(sender_id=user_id if k % 2 else coach_of[user_id],
+                     receiver_id=coach_of[user_id] if k % 2 else user_id,
+                     message=f'Tin nhắn {k}', is_read=k < messages_per_user - 3)
+         for user_id in user_ids for k in range(messages_per_user)], batch_size=SEED_BATCH_SIZE)
+    backdate(ChatMessage.objects.filter(Q(sender_id__in=user_ids) | Q(receiver_id__in=user_ids)),
+             'timestamp', 'message',
+             {f'Tin nhắn {k}': now - timedelta(minutes=messages_per_user - k) for k in range(messages_per_user)})
+
+    plans = WorkoutPlan.objects.bulk_create(
+        [WorkoutPlan(user_id=user_id, name=f'Buổi tập {k}', date=today - timedelta(days=3 * k), sets=3, reps=12)
+         for user_id in user_ids for k in range(8)], batch_size=SEED_BATCH_SIZE)
+    through = WorkoutPlan.activities.through
+    through.objects.bulk_create([through(workoutplan_id=plan.pk, activity_id=activities[(plan.pk + k) % 200].pk)
+                                 for plan in plans for k in range(2)], batch_size=SEED_BATCH_SIZE)
+    MealPlan.objects.bulk_create(
+        [MealPlan(user_id=user_id, name=f'Bữa {k}', date=today - timedelta(days=k), calories_intake=rng.randint(300, 900))
+         for user_id in user_ids for k in range(8)], batch_size=SEED_BATCH_SIZE)
+    UserGoal.objects.bulk_create([UserGoal(user_id=user_id, goal_type='Giảm cân', target_weight=rng.randint(50, 80),
+                                           target_date=today + timedelta(days=90)) for user_id in user_ids],
+                                 batch_size=SEED_BATCH_SIZE)
+    member = user_ids[0]
+    # Bảng tổng hợp chỉ được tính cho nhóm học viên của huấn luyện viên mẫu: tính cho mọi người dùng
+    # chiếm phần lớn thời gian sinh dữ liệu mà /healthrecord/trends/ chỉ đọc dữ liệu của một người
+    group = [user_id for user_id in user_ids if coach_of[user_id] == coach_of[member]]
+    rollups.rebuild_rollups(group)
+    anomalies.detect_all(group)
+    record = HealthRecord.objects.filter(user_id=member).order_by('-id').first()
+    AnomalyEvent.objects.get_or_create(record_id=record.id, metric='heart_rate', defaults={
+        'user_id': member, 'recorded_at': record.date, 'value': 190, 'baseline': 70, 'deviation': 5, 'score': 16.2})
+
+    fixtures = {
+        'member': member,
+        'coach': coach_of[member],
+        'admin': ids['load-admin'],
+        'activity': activities[0].pk,
+        'tag': Tag.objects.filter(name='load-tag0').values_list('id', flat=True).get(),
+        'healthrecord': HealthRecord.objects.filter(user_id=member).values_list('id', flat=True).first(),
+        'healthdiary': HealthDiary.objects.filter(user_id=member).values_list('id', flat=True).first(),
+        'workoutplan': WorkoutPlan.objects.filter(user_id=member).values_list('id', flat=True).first(),
+        'mealplan': MealPlan.objects.filter(user_id=member).values_list('id', flat=True).first(),
+        'chatmessage': ChatMessage.objects.filter(sender_id=member).values_list('id', flat=True).first(),
+        'connection': UserConnection.objects.filter(user_id=member).values_list('id', flat=True).get(),
+        'goal': UserGoal.objects.filter(user_id=member).values_list('id', flat=True).get(),
+        'anomaly': AnomalyEvent.objects.filter(user_id=member).values_list('id', flat=True).first(),
+    }
+    summary = {"name": "dữ liệu tổng hợp", "users": users, "coaches": coaches,
+               "healthrecords": users * records_per_user, "messages": users * messages_per_user,
+               "seconds": round(time.perf_counter() - started, 2)}
+    return fixtures, summary
+
+
+def route_cases(ids):
+    """
+    Các request mẫu cho từng route: (nhãn, người gọi, method, url, dữ liệu, số lần gọi tối đa).
+    url và dữ liệu có thể là hàm nhận số thứ tự lần gọi; đối tượng cần cho DELETE được tạo trước khi đo.
+    """
+    member, coach = ids['member'], ids['coach']
+    today = timezone.now().date().isoformat()
+    plan = {'name': 'Buổi tập', 'date': today, 'sets': 3, 'reps': 12}
+    meal = {'name': 'Bữa trưa', 'date': today, 'calories_intake': 650}
+    reading = {'steps': 4200, 'heart_rate': 72, 'height': 170, 'weight': 65}
+    password = {'current_password': BENCH_PASSWORD, 'new_password': BENCH_PASSWORD,
+                'confirm_password': BENCH_PASSWORD}
+
+    def fresh(prefix, model, fields):
+        return lambda i: f'{prefix}{model.objects.create(**(fields(i) if callable(fields) else fields)).pk}/'
+
+    return [
+        ('GET /', 'anon', 'get', '/', None, None),
+        ('POST /users/', 'anon', 'post', '/users/', lambda i: {
+            'username': f'load-new{i}', 'email': f'load-new{i}@example.com', 'password': BENCH_PASSWORD,
+            'confirm_password': BENCH_PASSWORD, 'role': Role.Exerciser_Self_Help}, 10),
+        ('PATCH /users/change-password/', 'member', 'patch', '/users/change-password/', password, 10),
+        ('GET /users/export/', 'member', 'get', '/users/export/?types=healthrecord', None, 10),
+        ('GET /users/all-users/', 'admin', 'get', '/users/all-users/', None, None),
+        ('GET /users/current/', 'member', 'get', '/users/current/', None, None),
+        ('PATCH /users/update-info/', 'member', 'patch', '/users/update-info/',
+         lambda i: {'first_name': f'Load {i}'}, None),
+
+        ('GET /activity/', 'anon', 'get', '/activity/', None, None),
+        ('POST /activity/', 'coach', 'post', '/activity/',
+         lambda i: {'name': f'load created {i}', 'calories_burned': 120}, None),
+        ('POST /activity/import/', 'coach', 'post', '/activity/import/',
+         lambda i: {'activities': [{'name': f'load imported {k}', 'time': i} for k in range(50)]}, 10),
+        ('GET /activity/suggest/', 'anon', 'get', '/activity/suggest/?q=load', None, None),
+        ('GET /activity/{pk}/', 'anon', 'get', f'/activity/{ids["activity"]}/', None, None),
+        ('PUT /activity/{pk}/', 'coach', 'put', f'/activity/{ids["activity"]}/',
+         lambda i: {'name': f'load updated {ids["activity"]}', 'calories_burned': i}, None),
+        ('PATCH /activity/{pk}/', 'coach', 'patch', f'/activity/{ids["activity"]}/',
+         lambda i: {'calories_burned': i}, None),
+        ('DELETE /activity/{pk}/', 'coach', 'delete',
+         fresh('/activity/', Activity, lambda i: {'name': f'load deleted {i}'}), None, None),
+
+        ('GET /workoutplan/', 'member', 'get', '/workoutplan/', None, None),
+        ('POST /workoutplan/', 'member', 'post', '/workoutplan/', plan, None),
+        ('POST /workoutplan/create-plan/', 'member', 'post', '/workoutplan/create-plan/', plan, None),
+        ('GET /workoutplan/plans-by-user/{user_id}/', 'coach', 'get',
+         f'/workoutplan/plans-by-user/{member}/', None, None),
+        ('GET /workoutplan/my-plans/', 'member', 'get', '/workoutplan/my-plans/', None, None),
+        ('GET /workoutplan/weekly-summary/', 'member', 'get', '/workoutplan/weekly-summary/?range=month', None, None),
+        ('GET /workoutplan/{pk}/', 'member', 'get', f'/workoutplan/{ids["workoutplan"]}/', None, None),
+        ('PUT /workoutplan/{pk}/', 'member', 'put', f'/workoutplan/{ids["workoutplan"]}/', plan, None),
+        ('PATCH /workoutplan/{pk}/', 'member', 'patch', f'/workoutplan/{ids["workoutplan"]}/',
+         lambda i: {'sets': i % 5 + 1}, None),
+        ('DELETE /workoutplan/{pk}/', 'member', 'delete',
+         fresh('/workoutplan/', WorkoutPlan, {'user_id': member, 'name': 'Xoá', 'date': today}), None, None),
+
+        ('GET /mealplan/', 'member', 'get', '/mealplan/', None, None),
+        ('POST /mealplan/', 'member', 'post', '/mealplan/', meal, None),
+        ('POST /mealplan/create-meal-plan/', 'member', 'post', '/mealplan/create-meal-plan/', meal, None),
+        ('GET /mealplan/{pk}/', 'member', 'get', f'/mealplan/{ids["mealplan"]}/', None, None),
+        ('PUT /mealplan/{pk}/', 'member', 'put', f'/mealplan/{ids["mealplan"]}/', meal, None),
+        ('PATCH /mealplan/{pk}/', 'member', 'patch', f'/mealplan/{ids["mealplan"]}/',
+         lambda i: {'calories_intake': 500 + i}, None),
+        ('DELETE /mealplan/{pk}/', 'member', 'delete',
+         fresh('/mealplan/', MealPlan, {'user_id': member, 'name': 'Xoá', 'date': today}), None, None),
+
+        ('GET /healthrecord/', 'member', 'get', '/healthrecord/', None, None),
+        ('GET /healthrecord/?paginate=cursor (coach)', 'coach', 'get', '/healthrecord/?paginate=cursor', None, None),
+        ('POST /healthrecord/', 'member', 'post', '/healthrecord/', reading, None),
+        ('POST /healthrecord/bulk/', 'member', 'post', '/healthrecord/bulk/',
+         {'records': sample_readings(50)}, 10),
+        ('GET /healthrecord/trends/', 'member', 'get', '/healthrecord/trends/?period=week', None, None),
+        ('GET /healthrecord/{pk}/', 'member', 'get', f'/healthrecord/{ids["healthrecord"]}/', None, None),
+        ('PUT /healthrecord/{pk}/', 'member', 'put', f'/healthrecord/{ids["healthrecord"]}/', reading, None),
+        ('PATCH /healthrecord/{pk}/', 'member', 'patch', f'/healthrecord/{ids["healthrecord"]}/',
+         lambda i: {'steps': 4000 + i}, None),
+        ('DELETE /healthrecord/{pk}/', 'member', 'delete',
+         fresh('/healthrecord/', HealthRecord, {'user_id': member, 'steps': 100}), None, None),
+
+        ('GET /healthdiary/', 'member', 'get', '/healthdiary/', None, None),
+        ('POST /healthdiary/', 'member', 'post', '/healthdiary/', {'content': '<p>Ổn</p>', 'feeling': 'Vui'}, None),
+        ('GET /healthdiary/{pk}/', 'member', 'get', f'/healthdiary/{ids["healthdiary"]}/', None, None),
+        ('PUT /healthdiary/{pk}/', 'member', 'put', f'/healthdiary/{ids["healthdiary"]}/',
+         {'content': '<p>Ổn</p>', 'feeling': 'Vui'}, None),
+        ('PATCH /healthdiary/{pk}/', 'member', 'patch', f'/healthdiary/{ids["healthdiary"]}/',
+         lambda i: {'feeling': f'Mức {i}'}, None),
+        ('DELETE /healthdiary/{pk}/', 'member', 'delete',
+         fresh('/healthdiary/', HealthDiary, {'user_id': member, 'content': 'Xoá'}), None, None),
+
+        ('GET /tag/', 'member', 'get', '/tag/', None, None),
+        ('POST /tag/', 'member', 'post', '/tag/', lambda i: {'name': f'load-new-tag{i}'}, None),
+        ('GET /tag/{pk}/', 'member', 'get', f'/tag/{ids["tag"]}/', None, None),
+        ('PUT /tag/{pk}/', 'member', 'put', f'/tag/{ids["tag"]}/', {'name': 'load-tag0'}, None),
+        ('PATCH /tag/{pk}/', 'member', 'patch', f'/tag/{ids["tag"]}/', {'name': 'load-tag0'}, None),
+        ('DELETE /tag/{pk}/', 'member', 'delete', fresh('/tag/', Tag, lambda i: {'name': f'load-deleted-tag{i}'}), None, None),
+
+        ('GET /chatmessage/', 'member', 'get', '/chatmessage/', None, None),
+        ('POST /chatmessage/', 'member', 'post', '/chatmessage/', {'receiver': coach, 'message': 'Chào'}, None),
+        ('GET /chatmessage/conversations/', 'coach', 'get', '/chatmessage/conversations/', None, None),
+        ('POST /chatmessage/mark-read/', 'coach', 'post', '/chatmessage/mark-read/', {'user_id': member}, None),
+        ('POST /chatmessage/send-message/', 'member', 'post', '/chatmessage/send-message/',
+         lambda i: {'receiver_id': coach, 'message': f'Câu hỏi {i}'}, None),
+        ('GET /chatmessage/{pk}/', 'member', 'get', f'/chatmessage/{ids["chatmessage"]}/', None, None),
+        ('PUT /chatmessage/{pk}/', 'member', 'put', f'/chatmessage/{ids["chatmessage"]}/',
+         {'receiver': coach, 'message': 'Đã sửa', 'is_read': True}, None),
+        ('PATCH /chatmessage/{pk}/', 'member', 'patch', f'/chatmessage/{ids["chatmessage"]}/',
+         {'message': 'Đã sửa'}, None),
+        ('DELETE /chatmessage/{pk}/', 'member', 'delete',
+         fresh('/chatmessage/', ChatMessage, {'sender_id': member, 'receiver_id': coach, 'message': 'Xoá'}), None, None),
+
+        ('GET /connection/', 'member', 'get', '/connection/', None, None),
+        ('POST /connection/', 'member', 'post', '/connection/', lambda i: {'status': 'pending', 'coach': User.objects.create(
+            username=f'load-coach-new{i}', email=f'load-coach-new{i}@example.com', role=Role.Coach).pk}, None),
+        ('GET /connection/dashboard/', 'coach', 'get', '/connection/dashboard/', None, None),
+        ('GET /connection/{pk}/', 'member', 'get', f'/connection/{ids["connection"]}/', None, None),
+        ('PUT /connection/{pk}/', 'member', 'put', f'/connection/{ids["connection"]}/',
+         {'coach': coach, 'status': 'accepted'}, None),
+        ('PATCH /connection/{pk}/', 'member', 'patch', f'/connection/{ids["connection"]}/',
+         {'status': 'accepted'}, None),
+        ('DELETE /connection/{pk}/', 'member', 'delete',
+         fresh('/connection/', UserConnection, lambda i: {'user_id': member, 'coach_id': User.objects.create(
+             username=f'load-coach-x{i}', email=f'load-coach-x{i}@example.com', role=Role.Coach).pk}), None, None),
+
+        ('GET /goal/', 'member', 'get', '/goal/', None, None),
+        ('POST /goal/', 'member', 'post', '/goal/', {'goal_type': 'Tăng cơ', 'target_weight': 70}, None),
+        ('GET /goal/progress/', 'member', 'get', '/goal/progress/', None, None),
+        ('GET /goal/{pk}/', 'member', 'get', f'/goal/{ids["goal"]}/', None, None),
+        ('PUT /goal/{pk}/', 'member', 'put', f'/goal/{ids["goal"]}/', {'goal_type': 'Giảm cân'}, None),
+        ('PATCH /goal/{pk}/', 'member', 'patch', f'/goal/{ids["goal"]}/', lambda i: {'target_weight': 60 + i % 5},
+         None),
+        ('DELETE /goal/{pk}/', 'member', 'delete', fresh('/goal/', UserGoal, {'user_id': member}), None, None),
+
+        ('GET /anomaly/', 'coach', 'get', '/anomaly/', None, None),
+        ('GET /anomaly/{pk}/', 'coach', 'get', f'/anomaly/{ids["anomaly"]}/', None, None),
+
+        ('GET /energy-balance/', 'member', 'get', '/energy-balance/', None, None),
+        ('GET /energy-balance/?from=&to=&user_id=', 'coach', 'get',
+         f'/energy-balance/?from={timezone.now().date() - timedelta(days=89)}&to={today}&user_id={member}',
+         None, None),
+
+        ('GET /metrics/', 'admin', 'get', '/metrics/', None, None),
+        ('POST /metrics/reset/', 'admin', 'post', '/metrics/reset/', None, None),
+    ]
+
+
+def route_key(label):
+    """
+    (tên URL, action) của nhãn dạng 'PATCH /activity/{pk}/'.
+    """
+    method, path = label.split()[:2]
+    match = resolve(re.sub(r'\{\w+\}', '1', path.split('?')[0]))
+    actions = getattr(match.func, 'actions', None) or {}
+    return match.url_name, actions.get(method.lower(), method.lower())
+
+
+def registered_routes():
+    """
+    Tập (tên URL, action) của mọi route trong router, bỏ qua các biến thể hậu tố định dạng (.json).
+    """
+    routes = set()
+    for pattern in router.urls:
+        if 'format' in pattern.pattern.regex.groupindex:
+            continue
+        actions = getattr(pattern.callback, 'actions', None) or {'get': 'get'}
+        routes |= {(pattern.name, action) for action in actions.values()}
+    return routes
+
+
+def drive_route(client, method, url, data, calls):
+    samples, statuses = [], set()
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    for i in range(calls):
+        path = url(i) if callable(url) else url
+        payload = data(i) if callable(data) else data
+        kwargs = {'format': 'json'} if method != 'get' else {}
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            response = getattr(client, method)(path, payload, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            samples.append(time.perf_counter() - started)
+        statuses.add(response.status_code)
+    return {"calls": calls, **percentiles(samples), "queries": round(queries / calls, 1),
+            "req_per_sec": round(calls / sum(samples), 1), "status": ','.join(map(str, sorted(statuses)))}
+
+
+@benchmark('routes')
+def bench_routes(options):
+    """
+    Gọi mọi route trong managements/urls.py trên dữ liệu tổng hợp (--users, --records-per-user):
+    p50/p95/p99, số query mỗi request, số request/giây và mã trạng thái của từng route.
+    """
+    ids, summary = seed_dataset(options['users'], options['records_per_user'])
+    cases = route_cases(ids)
+    missing = registered_routes() - {route_key(case[0]) for case in cases}
+    if missing:
+        raise AssertionError(f'Chưa có request mẫu cho route: {sorted(missing)}')
+
+    clients = {'anon': APIClient()}
+    for actor in ('member', 'coach', 'admin'):
+        clients[actor] = authenticated_client(User.objects.get(pk=ids[actor]))
+    for client in clients.values():
+        client.raise_request_exception = False
+
+    cache.clear()
+    results = [summary]
+    # Route lỗi 500 được ghi vào cột status, không in traceback
+    with mock.patch.object(logging.getLogger('django.request'), 'disabled', True):
+        for label, actor, method, url, data, max_calls in cases:
+            calls = min(options['calls'], max_calls or options['calls'])
+            results.append({"name": label, **drive_route(clients[actor], method, url, data, calls)})
+    return results
+
+
+@benchmark('archive')
+def bench_archive(options):
+    """
+    Độ trễ các route đọc HealthRecord/ChatMessage trước và sau archive_data trên dữ liệu tổng hợp
+    (--users, --records-per-user), khi 3/4 số liệu và tin nhắn đã đọc quá hạn lưu ở bảng chính và 5%
+    số liệu đã bị xoá mềm; kèm detect_anomalies --full, việc nền đọc toàn bộ HealthRecord.
+    """
+    ids, summary = seed_dataset(options['users'], options['records_per_user'])
+    now = timezone.now()
+    # Lịch sử dài hơn: số liệu trước 90 ngày gần nhất lùi thêm một năm, tin nhắn đã đọc lùi quá hạn lưu
+    HealthRecord._base_manager.filter(date__lt=now - timedelta(days=90)).update(
+        date=F('date') - timedelta(days=archive.HEALTHRECORD_DAYS))
+    HealthRecord._base_manager.alias(bucket=Mod('id', 20)).filter(bucket=0).update(active=False)
+    ChatMessage._base_manager.filter(is_read=True).update(
+        timestamp=F('timestamp') - timedelta(days=archive.CHATMESSAGE_DAYS + 1))
+    oldest = HealthRecord.objects.filter(user_id=ids['member'], active=True).order_by('date').values_list(
+        'id', flat=True).first()
+
+    clients = {actor: authenticated_client(User.objects.get(pk=ids[actor])) for actor in ('member', 'coach', 'admin')}
+    cases = [
+        ('GET /healthrecord/', 'member', '/healthrecord/'),
+        ('GET /healthrecord/ (huấn luyện viên)', 'coach', '/healthrecord/'),
+        ('GET /healthrecord/ (admin)', 'admin', '/healthrecord/'),
+        ('GET /healthrecord/?paginate=cursor', 'member', '/healthrecord/?paginate=cursor'),
+        ('GET /healthrecord/?paginate=cursor (huấn luyện viên)', 'coach', '/healthrecord/?paginate=cursor'),
+        ('GET /healthrecord/{id}/ (số liệu cũ)', 'member', f'/healthrecord/{oldest}/'),
+        ('GET /chatmessage/', 'member', '/chatmessage/'),
+        ('GET /chatmessage/?paginate=cursor', 'member', '/chatmessage/?paginate=cursor'),
+        ('GET /chatmessage/conversations/', 'coach', '/chatmessage/conversations/'),
+    ]
+
+    def run(stage):
+        cache.clear()
+        results = [{"name": f'{label} ({stage})', **drive_route(clients[actor], 'get', url, None, options['calls'])}
+                   for label, actor, url in cases]
+        # Việc nền đọc toàn bộ bảng chính
+        readings = HealthRecord.objects.filter(active=True).count()
+        return results + [measure(f'detect_anomalies --full ({stage})', readings, anomalies.detect_all)]
+
+    results = [summary, *run('trước')]
+    for moved in archive.archive_all(pause=0):
+        results.append({"name": f'archive_data {moved["source"]}', "rows": moved['moved'], "chunks": moved['chunks'],
+                        "seconds": moved['seconds'],
+                        "rows_per_sec": round(moved['moved'] / moved['seconds'], 1) if moved['seconds'] else None})
+    results.append({"name": "bảng chính còn lại", "healthrecords": HealthRecord._base_manager.count(),
+                    "messages": ChatMessage._base_manager.count()})
+    results += run('sau')
+    assert HealthRecordArchive.objects.filter(pk=oldest).exists()
+    return results
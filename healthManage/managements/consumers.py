@@ -0,0 +1,54 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from managements.models import ChatMessage, User
+from managements.realtime import user_group
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    ws/chat/ nhận mọi tin nhắn gửi đến hoặc đi từ người dùng hiện tại;
+    ws/chat/<user_id>/ chỉ nhận tin nhắn trong cuộc trò chuyện với user_id.
+    Client có thể gửi {"message": "..."} (kèm "receiver_id" nếu dùng ws/chat/) để nhắn tin.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+        peer_id = self.scope['url_route']['kwargs'].get('user_id')
+        self.peer_id = int(peer_id) if peer_id else None
+        self.group = user_group(self.user.id)
+        await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group'):
+            await self.channel_layer.group_discard(self.group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        receiver_id = self.peer_id or content.get('receiver_id')
+        message = content.get('message')
+        if not receiver_id or not message:
+            await self.send_json({"error": "Cần receiver_id và message."})
+            return
+        try:
+            receiver_id = int(receiver_id)
+        except (TypeError, ValueError):
+            await self.send_json({"error": "receiver_id phải là số nguyên."})
+            return
+        if not await self.save_message(receiver_id, message):
+            await self.send_json({"error": "Người nhận không tồn tại."})
+
+    async def chat_message(self, event):
+        if self.peer_id and self.peer_id not in (event['sender_id'], event['receiver_id']):
+            return
+        await self.send_json(event['message'])
+
+    @database_sync_to_async
+    def save_message(self, receiver_id, message):
+        receiver = User.objects.filter(id=receiver_id).first()
+        if not receiver:
+            return None
+        return ChatMessage.objects.create(sender=self.user, receiver=receiver, message=message)
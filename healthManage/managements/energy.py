@@ -0,0 +1,111 @@
+"""
+Cân bằng năng lượng theo ngày: calo nạp vào (tổng MealPlan.calories_intake) và calo tiêu hao
+(Activity.calories_burned của các activity trong WorkoutPlan, nhân với sets; sets trống tính là 1).
+
+Mỗi ngày của một người dùng được lưu trong cache riêng. Các ngày chưa có trong cache được tính
+bằng hai truy vấn GROUP BY date (một cho MealPlan, một cho WorkoutPlan JOIN activities) trên cả
+khoảng còn thiếu, nên số truy vấn không phụ thuộc số ngày hay số kế hoạch. Cache của một ngày bị
+xoá khi kế hoạch của ngày đó được tạo/sửa/xoá hoặc đổi danh sách activity; khi danh mục Activity
+đổi (calories_burned) phiên bản 'activity' của httpcache tăng nên mọi khoá cũ không còn được đọc.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from managements import httpcache
+from managements.models import MealPlan, WorkoutPlan
+
+ENERGY_CACHE_TIMEOUT = getattr(settings, 'ENERGY_BALANCE_CACHE_TIMEOUT', 86400)
+ENERGY_MAX_DAYS = getattr(settings, 'ENERGY_BALANCE_MAX_DAYS', 366)
+
+
+def burned_calories():
+    """
+    Biểu thức tổng calo tiêu hao của các WorkoutPlan trong queryset: mỗi activity của kế hoạch đóng góp
+    calories_burned * sets (sets trống tính là 1). Dùng chung cho energy-balance và weekly-summary.
+    """
+    return Coalesce(Sum(F('activities__calories_burned') * Coalesce('sets', Value(1)), output_field=FloatField()),
+                    Value(0.0))
+
+
+def _cache_key(version, user_id, day):
+    return f'energy-balance:{version}:{user_id}:{day}'
+
+
+def compute_days(user_id, start, end):
+    """
+    {ngày: số liệu} cho mọi ngày trong [start, end], tính trực tiếp từ CSDL.
+    """
+    days = {start + timedelta(days=i): {"intake": 0.0, "burned": 0.0, "meals": 0, "workouts": 0}
+            for i in range((end - start).days + 1)}
+    meals = (MealPlan.objects.filter(user_id=user_id, active=True, date__range=(start, end))
+             .order_by().values('date')
+             .annotate(intake=Coalesce(Sum('calories_intake'), Value(0.0)), meals=Count('id')))
+    for row in meals:
+        days[row['date']].update(intake=row['intake'], meals=row['meals'])
+    workouts = (WorkoutPlan.objects.filter(user_id=user_id, active=True, date__range=(start, end))
+                .order_by().values('date')
+                .annotate(burned=burned_calories(), workouts=Count('id', distinct=True)))
+    for row in workouts:
+        days[row['date']].update(burned=row['burned'], workouts=row['workouts'])
+    return days
+
+
+def daily_balance(user_id, start, end):
+    """
+    Danh sách số liệu từng ngày trong [start, end]; chỉ các ngày chưa có trong cache được tính lại.
+    """
+    version = httpcache.get_version('activity')
+    keys = {start + timedelta(days=i): _cache_key(version, user_id, start + timedelta(days=i))
+            for i in range((end - start).days + 1)}
+    cached = cache.get_many(keys.values())
+
+    missing = [day for day, key in keys.items() if key not in cached]
+    if missing:
+        computed = compute_days(user_id, missing[0], missing[-1])
+        fresh = {keys[day]: computed[day] for day in missing}
+        cache.set_many(fresh, ENERGY_CACHE_TIMEOUT)
+        cached.update(fresh)
+
+    days = []
+    for day, key in keys.items():
+        values = cached[key]
+        days.append({"date": day, **values, "balance": round(values['intake'] - values['burned'], 2)})
+    return days
+
+
+def invalidate_days(*user_days):
+    """
+    Xoá cache của các (user_id, ngày) sau khi transaction hiện tại commit.
+    """
+    user_days = {(user_id, day) for user_id, day in user_days if user_id and day}
+    if not user_days:
+        return
+
+    def delete():
+        version = httpcache.get_version('activity')
+        cache.delete_many([_cache_key(version, user_id, day) for user_id, day in user_days])
+
+    transaction.on_commit(delete)
+
+
+@receiver(m2m_changed, sender=WorkoutPlan.activities.through)
+def _invalidate_workout_activities(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_days((instance.user_id, instance.date))
+        return
+    # Sửa từ phía Activity (activity.workoutplan_set): pk_set là id các kế hoạch
+    if action == 'pre_clear':
+        plans = instance.workoutplan_set.all()
+    elif action in ('post_add', 'post_remove') and pk_set:
+        plans = WorkoutPlan.objects.filter(pk__in=pk_set)
+    else:
+        return
+    invalidate_days(*plans.values_list('user_id', 'date'))
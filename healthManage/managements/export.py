@@ -0,0 +1,103 @@
+"""
+Xuất toàn bộ dữ liệu sức khoẻ của một người dùng (HealthRecord, HealthDiary, WorkoutPlan, MealPlan)
+dưới dạng CSV hoặc NDJSON, có thể nén gzip.
+
+Dữ liệu được đọc theo từng phần EXPORT_CHUNK_SIZE dòng bằng keyset (id > id cuối của phần trước)
+và ghi ra ngay cho StreamingHttpResponse, nên bộ nhớ dùng không phụ thuộc số dòng. Không dùng
+QuerySet.iterator() vì driver MySQL (PyMySQL) vẫn tải toàn bộ kết quả về trước khi trả dòng đầu tiên.
+HealthRecord đã chuyển sang bảng lưu trữ được xuất trước các dòng còn ở bảng chính.
+"""
+import csv
+import json
+import zlib
+from itertools import chain
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from managements.models import HealthDiary, HealthRecord, HealthRecordArchive, MealPlan, WorkoutPlan
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+EXPORT_SOURCES = {
+    'healthrecord': (HealthRecord, ['id', 'date', 'steps', 'heart_rate', 'water_intake', 'height', 'weight', 'bmi']),
+    'healthdiary': (HealthDiary, ['id', 'date', 'feeling', 'content']),
+    'workoutplan': (WorkoutPlan, ['id', 'date', 'name', 'sets', 'reps', 'description', 'activities']),
+    'mealplan': (MealPlan, ['id', 'date', 'name', 'calories_intake', 'description']),
+}
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+# Bảng lưu trữ của nguồn (managements.archive), đọc trước bảng chính vì chứa các dòng cũ hơn
+ARCHIVE_MODELS = {'healthrecord': HealthRecordArchive}
+
+CSV_COLUMNS = ['type', *dict.fromkeys(chain.from_iterable(columns for _, columns in EXPORT_SOURCES.values()))]
+
+
+def iter_rows(user_id, source, chunk_size=None):
+    """
+    Sinh từng phần (danh sách dict) dữ liệu của source thuộc user_id, theo thứ tự id.
+    """
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    model, columns = EXPORT_SOURCES[source]
+    if source in ARCHIVE_MODELS:
+        yield from _iter_chunks(ARCHIVE_MODELS[source], user_id, columns, chunk_size)
+    yield from _iter_chunks(model, user_id, columns, chunk_size)
+
+
+def _iter_chunks(model, user_id, columns, chunk_size):
+    fields = [c for c in columns if c != 'activities']
+    queryset = model.objects.filter(user_id=user_id, active=True).order_by('id').values(*fields)
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not rows:
+            return
+        if 'activities' in columns:
+            through = model.activities.through
+            activities = {}
+            for plan_id, activity_id in (through.objects.filter(workoutplan_id__in=[r['id'] for r in rows])
+                                         .order_by('id').values_list('workoutplan_id', 'activity_id')):
+                activities.setdefault(plan_id, []).append(activity_id)
+            for row in rows:
+                row['activities'] = activities.get(row['id'], [])
+        yield rows
+        last_id = rows[-1]['id']
+
+
+class _Echo:
+    """File giả cho csv.writer: write() trả lại chuỗi thay vì ghi vào bộ đệm."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(chunk, source, writer):
+    for row in chunk:
+        if 'activities' in row:
+            row['activities'] = ';'.join(map(str, row['activities']))
+        yield writer.writerow([source if column == 'type' else row.get(column, '') for column in CSV_COLUMNS])
+
+
+def stream_export(user_id, sources, output='csv', chunk_size=None):
+    """
+    Sinh các khối văn bản của file xuất; mỗi khối ứng với một phần dữ liệu.
+    """
+    writer = csv.writer(_Echo())
+    if output == 'csv':
+        yield writer.writerow(CSV_COLUMNS)
+    for source in sources:
+        for chunk in iter_rows(user_id, source, chunk_size):
+            if output == 'csv':
+                yield ''.join(_csv_lines(chunk, source, writer))
+            else:
+                yield ''.join(json.dumps({'type': source, **row}, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+                              for row in chunk)
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,79 @@
+"""
+Cache phía server và GET có điều kiện (ETag/Last-Modified) cho các endpoint công khai ít thay đổi.
+
+Dữ liệu trả về được lưu trong cache theo khoá gồm phiên bản của namespace và đường dẫn đầy đủ
+của request. Mỗi lần dữ liệu thay đổi chỉ cần tăng phiên bản (bump_version), các khoá cũ không còn
+được đọc và tự hết hạn. Phiên bản là thời điểm thay đổi gần nhất nên dùng luôn làm Last-Modified.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 3600)
+
+
+def _version_key(namespace):
+    return f'response-cache-version:{namespace}'
+
+
+def get_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        version = int(time.time())
+        # add() để các tiến trình cùng khởi tạo không ghi đè phiên bản của nhau
+        if not cache.add(_version_key(namespace), version, None):
+            version = cache.get(_version_key(namespace), version)
+    return version
+
+
+def bump_version(namespace):
+    # Phiên bản luôn tăng kể cả khi có nhiều thay đổi trong cùng một giây
+    version = max(int(time.time()), get_version(namespace) + 1)
+    cache.set(_version_key(namespace), version, None)
+    return version
+
+
+def compute_etag(data):
+    payload = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return quote_etag(hashlib.md5(payload).hexdigest())
+
+
+class CachedResponseMixin:
+    """
+    Cache kết quả list/retrieve của viewset theo cache_namespace và trả 304 khi client gửi
+    If-None-Match/If-Modified-Since khớp với bản đang có.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs))
+
+    def _cached_response(self, request, render):
+        version = get_version(self.cache_namespace)
+        key = f'response-cache:{self.cache_namespace}:{version}:{request.get_full_path()}'
+        cached = cache.get(key)
+        if cached is None:
+            response = render()
+            if response.status_code != 200:
+                return response
+            cached = (response.data, compute_etag(response.data))
+            cache.set(key, cached, RESPONSE_CACHE_TIMEOUT)
+        data, etag = cached
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=version)
+        response = not_modified or Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        # Client luôn hỏi lại server nhưng chỉ tải lại khi ETag đổi
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
@@ -0,0 +1,59 @@
+"""
+Nhập hàng loạt số liệu HealthRecord từ thiết bị đeo: kiểm tra theo lô (kể cả thời điểm đo của từng
+số liệu), tính BMI bằng NumPy cho cả lô và ghi bằng bulk_create theo từng phần.
+"""
+import numpy as np
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from managements.models import HealthRecord
+from managements.serializers import HealthRecordReadingSerializer
+
+BULK_MAX_RECORDS = 5000
+BULK_CHUNK_SIZE = 500
+
+
+def compute_bmi(weights, heights):
+    """
+    Tính BMI cho cả mảng; phần tử thiếu cân nặng/chiều cao hoặc chiều cao bằng 0 trả về None.
+    """
+    weight = np.array(weights, dtype=float)
+    height = np.array(heights, dtype=float) / 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = np.round(weight / height ** 2, 2)
+    valid = np.isfinite(bmi)
+    return [float(value) if ok else None for value, ok in zip(bmi, valid)]
+
+
+def validate_readings(readings):
+    """
+    Trả về (danh sách dữ liệu hợp lệ kèm vị trí, danh sách lỗi kèm vị trí).
+    """
+    child = HealthRecordReadingSerializer()
+    valid, errors = [], []
+    for index, item in enumerate(readings):
+        try:
+            valid.append((index, child.run_validation(item)))
+        except ValidationError as ex:
+            errors.append({"index": index, "status": "error", "errors": ex.detail})
+    return valid, errors
+
+
+def ingest_health_records(user, readings, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Lưu các số liệu hợp lệ của user; trả về kết quả theo đúng thứ tự của readings.
+    """
+    valid, errors = validate_readings(readings)
+
+    weights = [data.get('weight') for _, data in valid]
+    heights = [data.get('height') for _, data in valid]
+    records = [HealthRecord(user=user, bmi=bmi, **data)
+               for (_, data), bmi in zip(valid, compute_bmi(weights, heights))]
+
+    with transaction.atomic():
+        HealthRecord.objects.bulk_create(records, batch_size=chunk_size)
+
+    # MySQL không trả về id sau bulk_create nên kết quả chỉ báo vị trí và trạng thái
+    results = errors + [{"index": index, "status": "created"} for index, _ in valid]
+    results.sort(key=lambda r: r['index'])
+    return results
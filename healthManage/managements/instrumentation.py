@@ -0,0 +1,268 @@
+"""
+Đo hiệu năng từng request của API.
+
+RequestMetricsMiddleware ghi cho mỗi request vào một view DRF: số query và tổng thời gian DB
+(connection.execute_wrapper), thời gian serializer (serializer.data của các serializer mà view tạo qua
+get_serializer khi có SerializerTimingMixin, cùng các khối bọc trong timed_serialize() của những action tự
+tạo serializer hoặc tự dựng dữ liệu trả về; không tính thời gian query phát sinh trong lúc serialize),
+thời gian render response và số byte của response. Kết quả được gửi
+về client trong header Server-Timing và cộng dồn vào histogram theo "ViewSet.action" để trang
+/metrics/ (chỉ admin) đọc.
+
+Histogram dùng các ngưỡng cố định nên mỗi request chỉ tốn vài phép cộng dưới một khoá; số liệu nằm
+trong bộ nhớ của từng tiến trình (như cache token), khi chạy nhiều tiến trình mỗi tiến trình báo
+phần của mình kèm pid. Tắt bằng REQUEST_METRICS_ENABLED = False.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+METRICS_ENABLED = getattr(settings, 'REQUEST_METRICS_ENABLED', True)
+
+TIME_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('view', 'queries', 'db', 'serialize', 'render')
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db = self.serialize = self.render = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+class Histogram:
+    """
+    Histogram với ngưỡng cố định: counts[i] đếm giá trị <= bounds[i], ô cuối đếm phần còn lại.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Ước lượng phân vị q bằng ngưỡng trên của ô chứa nó (ô cuối dùng giá trị lớn nhất).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        cumulative = 0
+        buckets = []
+        for bound, count in zip((*self.bounds, '+Inf'), self.counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """
+    Histogram theo view của tiến trình hiện tại, an toàn khi dùng từ nhiều luồng.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.started_at = timezone.now()
+
+    def record(self, view, metrics, total_ms, size):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = {
+                    'total_ms': Histogram(TIME_BUCKETS_MS),
+                    'db_ms': Histogram(TIME_BUCKETS_MS),
+                    'serialize_ms': Histogram(TIME_BUCKETS_MS),
+                    'render_ms': Histogram(TIME_BUCKETS_MS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'bytes': Histogram(BYTE_BUCKETS),
+                }
+            stats['total_ms'].observe(total_ms)
+            stats['db_ms'].observe(metrics.db * 1000)
+            stats['serialize_ms'].observe(metrics.serialize * 1000)
+            stats['render_ms'].observe(metrics.render * 1000)
+            stats['queries'].observe(metrics.queries)
+            if size is not None:
+                stats['bytes'].observe(size)
+
+    def snapshot(self):
+        with self._lock:
+            views = {view: {name: histogram.as_dict() for name, histogram in stats.items()}
+                     for view, stats in self._views.items()}
+        # View tốn nhiều thời gian nhất lên đầu
+        return {
+            "pid": os.getpid(),
+            "since": self.started_at,
+            "views": dict(sorted(views.items(), key=lambda item: -item[1]['total_ms']['sum'])),
+        }
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.started_at = timezone.now()
+
+
+registry = MetricsRegistry()
+
+
+def server_timing(metrics, total_ms):
+    return ', '.join([
+        f'db;dur={metrics.db * 1000:.2f};desc="{metrics.queries} queries"',
+        f'serialize;dur={metrics.serialize * 1000:.2f}',
+        f'render;dur={metrics.render * 1000:.2f}',
+        f'total;dur={total_ms:.2f}',
+    ])
+
+
+class RequestMetricsMiddleware:
+    """
+    Đặt đầu MIDDLEWARE để thời gian total gồm cả các middleware còn lại.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not METRICS_ENABLED:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        timing = server_timing(metrics, total_ms)
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        if metrics.view is not None:
+            size = None if response.streaming else len(response.content)
+            registry.record(metrics.view, metrics, total_ms, size)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        cls = getattr(view_func, 'cls', None)
+        if metrics is None or cls is None:
+            return None
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None) or {}
+        metrics.view = f'{cls.__name__}.{actions.get(method, method)}'
+        return None
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is None:
+            return response
+        render = response.render
+
+        def timed_render():
+            started, db_before = time.perf_counter(), metrics.db
+            try:
+                return render()
+            finally:
+                metrics.render += time.perf_counter() - started - (metrics.db - db_before)
+
+        response.render = timed_render
+        return response
+
+
+@contextmanager
+def timed_serialize():
+    """
+    Cộng thời gian của khối lệnh (trừ thời gian query trong đó) vào phần serialize của request đang đo.
+    Dùng cho action tự tạo serializer hoặc tự dựng dữ liệu trả về thay vì qua get_serializer.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started, db_before = time.perf_counter(), metrics.db
+    try:
+        yield
+    finally:
+        metrics.serialize += time.perf_counter() - started - (metrics.db - db_before)
+
+
+_timed_classes = {}
+
+
+def _timed_class(cls):
+    # Lớp con của cls với data được đo giờ; tạo một lần cho mỗi lớp serializer
+    timed = _timed_classes.get(cls)
+    if timed is None:
+        data = cls.data.fget
+
+        def timed_data(self):
+            with timed_serialize():
+                return data(self)
+
+        timed = _timed_classes[cls] = type(cls.__name__, (cls,), {'data': property(timed_data),
+                                                                    '__module__': cls.__module__})
+    return timed
+
+
+class SerializerTimingMixin:
+    """
+    Mixin cho GenericAPIView: serializer trả về từ get_serializer được đổi sang lớp con đo thời gian
+    serializer.data cho RequestMetricsMiddleware. Chỉ áp dụng khi đang đo request; serializer tạo trực
+    tiếp trong action cần bọc .data trong timed_serialize().
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _current.get() is not None:
+            serializer.__class__ = _timed_class(type(serializer))
+        return serializer
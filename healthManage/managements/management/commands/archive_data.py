@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from managements import archive
+
+
+class Command(BaseCommand):
+    help = ('Chuyển HealthRecord/ChatMessage đã xoá mềm hoặc quá cũ sang bảng lưu trữ (chạy định kỳ bằng cron, '
+            'hoặc --schedule để tự lặp lại)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*', help='healthrecord, chatmessage; bỏ trống để chuyển tất cả')
+        parser.add_argument('--chunk-size', type=int, default=archive.CHUNK_SIZE,
+                            help='Số dòng mỗi transaction')
+        parser.add_argument('--pause', type=float, default=archive.CHUNK_PAUSE,
+                            help='Số giây nghỉ giữa hai phần')
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ đếm số dòng sẽ được chuyển')
+        parser.add_argument('--schedule', action='store_true',
+                            help='Chạy lặp lại sau mỗi --interval giây cho tới khi bị dừng')
+        parser.add_argument('--interval', type=int, default=archive.INTERVAL,
+                            help='Số giây giữa hai lần chạy khi --schedule')
+
+    def handle(self, *args, **options):
+        unknown = [source for source in options['sources'] if source not in archive.ARCHIVE_SOURCES]
+        if unknown:
+            raise CommandError(f'Không có bảng lưu trữ cho: {", ".join(unknown)}')
+        while True:
+            summaries = archive.archive_all(options['sources'], options['chunk_size'], options['pause'],
+                                            dry_run=options['dry_run'])
+            verb = 'Sẽ chuyển' if options['dry_run'] else 'Đã chuyển'
+            for summary in summaries:
+                self.stdout.write(self.style.SUCCESS(
+                    '{verb} {moved} dòng {source} sang bảng lưu trữ trong {seconds}s.'.format(verb=verb, **summary)))
+            if not options['schedule'] or options['dry_run']:
+                return
+            time.sleep(options['interval'])
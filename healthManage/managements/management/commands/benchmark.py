@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from managements import tokens
+from managements.benchmarks import BASELINE_FILE, BENCHMARKS, compare, load_baselines, save_baselines
+
+# Chỉ số dùng để quyết định hồi quy với --max-regression
+REGRESSION_KEYS = ('p95_ms', 'queries', 'req_per_sec', 'rows_per_sec')
+
+
+class Command(BaseCommand):
+    help = 'Chạy bộ đo hiệu năng trên CSDL SQLite tạm'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Tên benchmark, bỏ trống để chạy tất cả')
+        parser.add_argument('--rows', type=int, default=2000, help='Số dòng dữ liệu mẫu')
+        parser.add_argument('--catalog-size', type=int, default=100000, help='Số activity cho activity_search')
+        parser.add_argument('--users', type=int, default=1000, help='Số học viên cho routes')
+        parser.add_argument('--records-per-user', type=int, default=100, help='Số HealthRecord mỗi học viên cho routes')
+        parser.add_argument('--calls', type=int, default=30, help='Số request cho mỗi route trong routes')
+        parser.add_argument('--readings', type=int, default=1000000, help='Số số liệu HealthRecord cho anomalies')
+        parser.add_argument('--list', action='store_true', help='Liệt kê các benchmark')
+        parser.add_argument('--baseline-file', default=BASELINE_FILE, help='File JSON chứa baseline')
+        parser.add_argument('--compare', action='store_true', help='So sánh với baseline đã lưu')
+        parser.add_argument('--save-baseline', action='store_true', help='Lưu kết quả lần chạy này làm baseline')
+        parser.add_argument('--max-regression', type=float,
+                            help='Báo lỗi nếu p95, số query hoặc thông lượng kém hơn baseline quá N%%')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, func in BENCHMARKS.items():
+                self.stdout.write(f'{name}: {(func.__doc__ or "").strip()}')
+            return
+
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Không có benchmark: {", ".join(unknown)}')
+        if connection.vendor != 'sqlite':
+            raise CommandError('Benchmark chỉ chạy trên SQLite.')
+
+        compare_with = options['compare'] or options['max_regression'] is not None
+        baselines = load_baselines(options['baseline_file']) if compare_with else {}
+        runs = {}
+        regressions = []
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                runs[name] = BENCHMARKS[name](options)
+                for result in runs[name]:
+                    line = '  '.join(f'{key}={value}' for key, value in result.items())
+                    baseline = baselines.get(name, {}).get(result['name'])
+                    if baseline:
+                        changes = compare(result, baseline)
+                        line += '  | ' + '  '.join(f'Δ{key}={value:+}%' for key, value in changes.items())
+                        limit = options['max_regression']
+                        if limit is not None and any(changes.get(key, 0) > limit for key in REGRESSION_KEYS):
+                            regressions.append(f'{name}: {result["name"]}')
+                    self.stdout.write('  ' + line)
+                # Mỗi benchmark bắt đầu từ CSDL và cache trống
+                call_command('flush', interactive=False, verbosity=0)
+                cache.clear()
+                tokens.token_cache.clear()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save_baseline']:
+            save_baselines(runs, options['baseline_file'])
+            self.stdout.write(f'Đã lưu baseline vào {options["baseline_file"]}')
+        if regressions:
+            raise CommandError('Chậm hơn baseline quá {}%: {}'.format(options['max_regression'], '; '.join(regressions)))
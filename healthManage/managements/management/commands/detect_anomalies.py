@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from managements import anomalies
+
+
+class Command(BaseCommand):
+    help = ('Tìm số liệu heart_rate/steps bất thường. Mặc định chỉ xét số liệu mới từ lần chạy trước '
+            '(chạy định kỳ bằng cron); --full tính lại toàn bộ')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Tính lại toàn bộ và thay các sự kiện cũ')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Chỉ tính lại cho người dùng có id này (cùng --full, có thể lặp lại)')
+        parser.add_argument('--batch-users', type=int, default=anomalies.BATCH_USERS,
+                            help='Số người dùng mỗi lô khi --full')
+        parser.add_argument('--chunk-rows', type=int, default=anomalies.CHUNK_ROWS,
+                            help='Số số liệu mới mỗi lần đọc ở chế độ tăng dần')
+
+    def handle(self, *args, **options):
+        if options['full'] or options['user_ids']:
+            summary = anomalies.detect_all(options['user_ids'], options['batch_users'])
+        else:
+            summary = anomalies.detect_new(options['chunk_rows'])
+        self.stdout.write(self.style.SUCCESS(
+            'Đã xét {readings} số liệu, tìm thấy {events} bất thường trong {seconds}s.'.format(**summary)))
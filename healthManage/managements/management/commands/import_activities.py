@@ -0,0 +1,38 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from managements.activity_import import IMPORT_BATCH_SIZE, import_activities, parse_rows
+
+
+class Command(BaseCommand):
+    help = 'Nhập danh mục Activity từ file CSV/JSON (cập nhật activity cùng tên)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File CSV hoặc JSON')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Mặc định theo phần mở rộng của file')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Số dòng mỗi lô')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        try:
+            with open(path, 'rb') as f:
+                rows = parse_rows(f.read(), file_format)
+        except (OSError, ValueError) as ex:
+            raise CommandError(str(ex))
+
+        # Đường dẫn ảnh tương đối được tính theo thư mục chứa file nhập
+        base_dir = os.path.dirname(os.path.abspath(path))
+        for row in rows:
+            image = row.get('image') if isinstance(row, dict) else None
+            if image and '://' not in image and not os.path.isabs(image):
+                row['image'] = os.path.join(base_dir, image)
+
+        result = import_activities(rows, batch_size=options['batch_size'], allow_local_images=True)
+        for error in result.pop('errors'):
+            self.stderr.write(f"Dòng {error['index']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã nhập {result['rows']} dòng: {result['created']} tạo mới, {result['updated']} cập nhật, "
+            f"{result['failed']} lỗi ({result['rows_per_sec']} dòng/giây)."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from managements.models import MediaUpload
+from managements.uploads import process_upload
+
+
+class Command(BaseCommand):
+    help = 'Xử lý các ảnh đang chờ tải lên (ví dụ sau khi tiến trình bị khởi động lại)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Thử lại cả các job đã lỗi')
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        done = failed = 0
+        for upload_id in MediaUpload.objects.filter(status__in=statuses).order_by('id').values_list('id', flat=True):
+            job = process_upload(upload_id)
+            if job is not None and job.status == 'done':
+                done += 1
+            elif job is not None:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Đã tải lên {done} ảnh, {failed} ảnh lỗi.'))
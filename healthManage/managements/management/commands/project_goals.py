@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from managements import projection
+
+
+class Command(BaseCommand):
+    help = 'Tính lại tiến độ và ngày dự kiến đạt mục tiêu cân nặng (chạy hằng đêm bằng cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Chỉ tính lại cho người dùng có id này (có thể lặp lại)')
+        parser.add_argument('--batch-size', type=int, default=projection.BATCH_SIZE,
+                            help='Số người dùng tính trong một lô')
+
+    def handle(self, *args, **options):
+        summary = projection.project_goals(options['user_ids'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Đã tính {goals} mục tiêu của {users} người dùng từ {records} số liệu trong {seconds}s.'.format(**summary)))
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, RefreshToken
+from oauth2_provider.settings import oauth2_settings
+
+
+def delete_in_chunks(queryset, chunk_size):
+    """
+    Xoá các dòng của queryset theo từng phần chunk_size id để không khoá bảng lâu.
+    """
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        queryset.model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+class Command(BaseCommand):
+    help = 'Xoá AccessToken hết hạn và RefreshToken đã thu hồi/hết hạn theo từng phần'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Số dòng xoá mỗi lần')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        now = timezone.now()
+
+        # RefreshToken đã thu hồi chỉ cần giữ trong thời gian cho phép dùng lại (grace period);
+        # nếu có REFRESH_TOKEN_EXPIRE_SECONDS thì refresh token của access token hết hạn quá lâu cũng bị xoá
+        refresh_query = Q(revoked__lt=now - timedelta(seconds=oauth2_settings.REFRESH_TOKEN_GRACE_PERIOD_SECONDS))
+        expire_seconds = oauth2_settings.REFRESH_TOKEN_EXPIRE_SECONDS
+        if expire_seconds:
+            if not isinstance(expire_seconds, timedelta):
+                expire_seconds = timedelta(seconds=expire_seconds)
+            refresh_query |= Q(access_token__expires__lt=now - expire_seconds)
+        refresh_deleted = delete_in_chunks(RefreshToken.objects.filter(refresh_query).order_by('id'), chunk_size)
+
+        # Access token còn refresh token hợp lệ đi kèm được giữ lại để refresh token vẫn dùng được
+        access_deleted = delete_in_chunks(
+            AccessToken.objects.filter(expires__lt=now, refresh_token__isnull=True).order_by('id'), chunk_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Đã xoá {access_deleted} access token và {refresh_deleted} refresh token.'))
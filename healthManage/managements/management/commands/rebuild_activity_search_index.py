@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from managements.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Tạo lại chỉ mục tìm kiếm cho toàn bộ Activity'
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Đã lập chỉ mục {count} activity.'))
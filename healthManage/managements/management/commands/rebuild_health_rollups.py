@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from managements.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Tính lại bảng tổng hợp HealthRecord theo ngày/tuần/tháng'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Chỉ tính lại cho người dùng có id này (có thể lặp lại)')
+
+    def handle(self, *args, **options):
+        days = rebuild_rollups(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Đã tính lại {days} ngày dữ liệu.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from managements import stats
+
+
+class Command(BaseCommand):
+    help = 'Tính lại snapshot thống kê cho trang admin (chạy định kỳ bằng cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='YYYY-MM-DD')
+        parser.add_argument('--to', dest='end', help='YYYY-MM-DD')
+        parser.add_argument('--top', type=int, default=stats.STATS_TOP_N)
+
+    def handle(self, *args, **options):
+        start, end = stats.parse_range(options['start'], options['end'])
+        snapshot = stats.refresh_snapshot(start, end, options['top'])
+        self.stdout.write(self.style.SUCCESS(f'Đã cập nhật {snapshot.key}.'))
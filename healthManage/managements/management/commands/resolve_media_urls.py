@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from managements.media import refresh_stored_urls
+from managements.models import Activity, User
+
+
+class Command(BaseCommand):
+    help = 'Lưu sẵn URL Cloudinary (ảnh gốc và ảnh thu nhỏ) cho avatar và ảnh activity'
+
+    def handle(self, *args, **options):
+        users = refresh_stored_urls(User.objects.all(), 'avatar')
+        activities = refresh_stored_urls(Activity.objects.all(), 'image')
+        self.stdout.write(self.style.SUCCESS(f'Đã cập nhật {users} người dùng và {activities} activity.'))
@@ -0,0 +1,80 @@
+"""
+URL ảnh Cloudinary (avatar, ảnh activity).
+
+URL đầy đủ và URL ảnh thu nhỏ được tính một lần khi lưu ảnh và ghi vào các cột <field>_url,
+<field>_thumbnail_url; serializer chỉ đọc lại chuỗi đã lưu. Với dữ liệu cũ chưa có URL lưu sẵn,
+resolve_url được ghi nhớ (lru_cache) theo resource nên mỗi ảnh chỉ phải dựng URL một lần.
+"""
+from functools import lru_cache
+
+from cloudinary import CloudinaryResource
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+THUMBNAIL_OPTIONS = getattr(settings, 'MEDIA_THUMBNAIL_OPTIONS', {'width': 200, 'height': 200, 'crop': 'fill'})
+
+
+@lru_cache(maxsize=8192)
+def _build_url(public_id, format, version, type, resource_type, options):
+    resource = CloudinaryResource(public_id, format=format, version=version, type=type, resource_type=resource_type)
+    return resource.build_url(**dict(options))
+
+
+def resolve_url(resource, **options):
+    if not resource or not getattr(resource, 'public_id', None):
+        return None
+    return _build_url(resource.public_id, resource.format, resource.version, resource.type,
+                      resource.resource_type or 'image', tuple(sorted(options.items())))
+
+
+def store_urls(instance, field):
+    """
+    Ghi URL của ảnh instance.<field> vào <field>_url và <field>_thumbnail_url.
+    Trả về True nếu giá trị đã lưu thay đổi.
+    """
+    resource = getattr(instance, field)
+    if isinstance(resource, UploadedFile):
+        return False
+    if isinstance(resource, str) and resource:
+        resource = instance._meta.get_field(field).to_python(resource)
+    url = resolve_url(resource) or ''
+    thumbnail_url = resolve_url(resource, **THUMBNAIL_OPTIONS) or ''
+    changed = (getattr(instance, f'{field}_url'), getattr(instance, f'{field}_thumbnail_url')) != (url, thumbnail_url)
+    setattr(instance, f'{field}_url', url)
+    setattr(instance, f'{field}_thumbnail_url', thumbnail_url)
+    return changed
+
+
+def save_with_urls(instance, field, save, *args, **kwargs):
+    """
+    Gọi save(*args, **kwargs) của model và cập nhật URL ảnh. Khi ảnh vừa được tải lên, URL chỉ có
+    sau khi CloudinaryField upload nên được ghi bằng một câu UPDATE riêng.
+    """
+    uploading = isinstance(getattr(instance, field), UploadedFile)
+    store_urls(instance, field)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and field in update_fields:
+        kwargs['update_fields'] = {*update_fields, f'{field}_url', f'{field}_thumbnail_url'}
+    save(*args, **kwargs)
+    if uploading and store_urls(instance, field):
+        type(instance)._default_manager.filter(pk=instance.pk).update(**{
+            f'{field}_url': getattr(instance, f'{field}_url'),
+            f'{field}_thumbnail_url': getattr(instance, f'{field}_thumbnail_url'),
+        })
+
+
+def refresh_stored_urls(queryset, field, batch_size=500):
+    """
+    Tính lại URL lưu sẵn cho các dòng của queryset (dùng cho dữ liệu cũ).
+    """
+    updated = 0
+    batch = []
+    for instance in queryset.iterator(chunk_size=batch_size):
+        if store_urls(instance, field):
+            batch.append(instance)
+        if len(batch) == batch_size:
+            updated += type(instance)._default_manager.bulk_update(batch, [f'{field}_url', f'{field}_thumbnail_url'])
+            batch = []
+    if batch:
+        updated += type(batch[0])._default_manager.bulk_update(batch, [f'{field}_url', f'{field}_thumbnail_url'])
+    return updated
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0010_alter_healthrecord_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthRecordRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Ngày'), ('week', 'Tuần'), ('month', 'Tháng')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('metric', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0)),
+                ('minimum', models.FloatField(blank=True, null=True)),
+                ('maximum', models.FloatField(blank=True, null=True)),
+                ('updated_date', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='health_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['period_start'],
+                'unique_together': {('user', 'period', 'metric', 'period_start')},
+            },
+        ),
+    ]
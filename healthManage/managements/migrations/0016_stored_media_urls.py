@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0015_activitysearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='image_thumbnail_url',
+            field=models.URLField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='image_url',
+            field=models.URLField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_thumbnail_url',
+            field=models.URLField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_url',
+            field=models.URLField(blank=True, default='', editable=False, max_length=500),
+        ),
+    ]
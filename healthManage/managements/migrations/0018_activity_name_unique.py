@@ -0,0 +1,77 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:49
+
+import logging
+import unicodedata
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def _name_key(name):
+    # Trùng theo collation *_ai_ci của MySQL: không phân biệt hoa thường và dấu
+    name = unicodedata.normalize('NFKD', name.strip().replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(c for c in name if not unicodedata.combining(c)).casefold()
+
+
+def merge_duplicate_activities(apps, schema_editor):
+    """
+    Gộp các Activity trùng tên vào activity có id nhỏ nhất: chuyển mọi liên kết (WorkoutPlan và các khoá
+    ngoại khác) sang activity được giữ, kiểm tra không còn dòng nào trỏ tới bản trùng rồi mới xoá.
+    Chỉ mục tìm kiếm là dữ liệu dẫn xuất nên bị xoá theo bản trùng.
+    """
+    Activity = apps.get_model('managements', 'Activity')
+
+    keep = {}
+    duplicates = {}
+    for activity_id, name in Activity.objects.order_by('id').values_list('id', 'name').iterator():
+        key = _name_key(name)
+        if key in keep:
+            duplicates[activity_id] = keep[key]
+        else:
+            keep[key] = activity_id
+    if not duplicates:
+        return
+
+    references = []
+    for relation in Activity._meta.related_objects:
+        if relation.related_model._meta.model_name == 'activitysearchtoken':
+            continue
+        if relation.many_to_many:
+            through = relation.through
+            owner = relation.field.m2m_field_name() + '_id'
+            column = relation.field.m2m_reverse_field_name() + '_id'
+        else:
+            through, owner, column = relation.related_model, None, relation.field.attname
+        references.append((through, column))
+        for duplicate_id, kept_id in duplicates.items():
+            if owner:
+                # Kế hoạch đã có cả hai bản: bỏ liên kết tới bản trùng để không sinh dòng trung gian trùng lặp
+                linked = list(through.objects.filter(**{column: kept_id}).values_list(owner, flat=True))
+                through.objects.filter(**{column: duplicate_id, f'{owner}__in': linked}).delete()
+            through.objects.filter(**{column: duplicate_id}).update(**{column: kept_id})
+
+    for through, column in references:
+        remaining = through.objects.filter(**{f'{column}__in': list(duplicates)}).count()
+        if remaining:
+            raise RuntimeError(f'{remaining} dòng {through._meta.db_table} vẫn trỏ tới Activity trùng tên; '
+                               f'dừng migration để không mất dữ liệu.')
+    Activity.objects.filter(id__in=list(duplicates)).delete()
+    logger.info('Đã gộp %s Activity trùng tên: %s', len(duplicates),
+                ', '.join(f'{duplicate_id}→{kept_id}' for duplicate_id, kept_id in sorted(duplicates.items())))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0017_media_upload'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_activities, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='activity',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
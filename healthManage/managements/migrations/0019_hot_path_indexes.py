@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0018_activity_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mealplan',
+            index=models.Index(fields=['user', 'date'], name='mealplan_user_date'),
+        ),
+        migrations.AddIndex(
+            model_name='userconnection',
+            index=models.Index(fields=['coach', 'status', 'active', 'user'], name='connection_coach_status'),
+        ),
+        migrations.AddIndex(
+            model_name='workoutplan',
+            index=models.Index(fields=['user', 'date'], name='workoutplan_user_date'),
+        ),
+    ]
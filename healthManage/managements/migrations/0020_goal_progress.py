@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0019_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoalProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('achieved', 'Đã đạt'), ('on_track', 'Đúng tiến độ'), ('behind', 'Chậm tiến độ'), ('off_track', 'Đi ngược mục tiêu'), ('insufficient_data', 'Chưa đủ dữ liệu')], max_length=20)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('current_weight', models.FloatField(blank=True, null=True)),
+                ('trend_per_week', models.FloatField(blank=True, null=True)),
+                ('required_per_week', models.FloatField(blank=True, null=True)),
+                ('projected_date', models.DateField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField()),
+                ('goal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='managements.usergoal')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goal_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0020_goal_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('last_record_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnomalyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_id', models.BigIntegerField()),
+                ('metric', models.CharField(max_length=20)),
+                ('recorded_at', models.DateTimeField()),
+                ('value', models.FloatField()),
+                ('baseline', models.FloatField()),
+                ('deviation', models.FloatField()),
+                ('score', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomaly_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'recorded_at', 'id'], name='anomalyevent_user_recorded')],
+                'unique_together': {('record_id', 'metric')},
+            },
+        ),
+    ]
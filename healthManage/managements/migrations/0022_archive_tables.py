@@ -0,0 +1,57 @@
+# Generated by Django 5.1.2 on 2026-10-18 10:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0021_anomaly_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessageArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_date', models.DateField(null=True)),
+                ('updated_date', models.DateField(null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('message', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+                ('is_read', models.BooleanField(default=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'indexes': [models.Index(fields=['timestamp', 'id'], name='chatmessagearchive_timestamp'), models.Index(fields=['sender', 'timestamp'], name='chatmessagearchive_sender'), models.Index(fields=['receiver', 'timestamp'], name='chatmessagearchive_receiver')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HealthRecordArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_date', models.DateField(null=True)),
+                ('updated_date', models.DateField(null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('date', models.DateTimeField()),
+                ('water_intake', models.FloatField(blank=True, null=True)),
+                ('steps', models.IntegerField(blank=True, null=True)),
+                ('heart_rate', models.IntegerField(blank=True, null=True)),
+                ('height', models.FloatField(blank=True, null=True)),
+                ('weight', models.FloatField(blank=True, null=True)),
+                ('bmi', models.FloatField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['user', 'date', 'id'], name='healthrecordarchive_user_date')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0022_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0024_explicit_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['sender', 'timestamp', 'id'], name='chatmessage_sender_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['receiver', 'timestamp', 'id'], name='chatmessage_receiver_timestamp'),
+        ),
+    ]
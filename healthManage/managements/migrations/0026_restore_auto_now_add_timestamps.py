@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managements', '0025_chatmessage_participant_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='healthdiary',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -1,9 +1,10 @@
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from ckeditor.fields import RichTextField
 from cloudinary.models import CloudinaryField
 from enum import IntEnum
+from managements import media
 
 class BaseModel(models.Model):
     created_date = models.DateField(auto_now_add=True, null=True)
@@ -31,21 +32,88 @@ class User(AbstractUser):
         choices=Role.choices(),
         default=Role.Admin.value
     )
+    avatar_url = models.URLField(max_length=500, blank=True, default='', editable=False)
+    avatar_thumbnail_url = models.URLField(max_length=500, blank=True, default='', editable=False)
 
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        media.save_with_urls(self, 'avatar', super().save, *args, **kwargs)
+        # Token trong cache giữ bản sao người dùng (quyền, trạng thái is_active)
+        from managements import tokens
+        tokens.invalidate_user(self.pk)
+
 class Activity(BaseModel):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
     description = RichTextField(null=True, blank=True)
     calories_burned = models.FloatField(null=True, blank=True)
     time = models.IntegerField(null=True, blank=True)
     image = CloudinaryField('activity_image', null=True, blank=True)
+    image_url = models.URLField(max_length=500, blank=True, default='', editable=False)
+    image_thumbnail_url = models.URLField(max_length=500, blank=True, default='', editable=False)
 
     def __str__(self):
         return self.name
 
-class WorkoutPlan(BaseModel):
+    def save(self, *args, **kwargs):
+        media.save_with_urls(self, 'image', super().save, *args, **kwargs)
+        from managements import search
+        search.index_activities([self])
+        self.invalidate_catalog()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.invalidate_catalog()
+        return result
+
+    @staticmethod
+    def invalidate_catalog():
+        from managements import httpcache
+        transaction.on_commit(lambda: httpcache.bump_version('activity'))
+
+class ActivitySearchToken(models.Model):
+    """
+    Chỉ mục tìm kiếm của Activity: mỗi dòng là một từ (đã bỏ dấu, chữ thường) trong name/description.
+    """
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.token} - {self.activity_id}"
+
+    class Meta:
+        unique_together = ('activity', 'token')
+        indexes = [
+            models.Index(fields=['token', 'activity'], name='activitysearch_token'),
+        ]
+
+class PlanDayMixin:
+    """
+    Xoá cache cân bằng năng lượng (managements.energy) của ngày cũ và ngày mới khi kế hoạch thay đổi.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Đọc qua __dict__ để không nạp lại trường bị hoãn (only()/defer())
+        self._loaded_day = (self.__dict__.get('user_id'), self.__dict__.get('date'))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalidate_energy()
+        self._loaded_day = (self.user_id, self.date)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._invalidate_energy()
+        return result
+
+    def _invalidate_energy(self):
+        from managements import energy
+        energy.invalidate_days(self._loaded_day, (self.user_id, self.date))
+
+class WorkoutPlan(PlanDayMixin, BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     date = models.DateField()
@@ -54,16 +122,26 @@ class WorkoutPlan(BaseModel):
     sets = models.IntegerField(null=True, blank=True)
     reps = models.IntegerField(null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['user', 'date'], name='workoutplan_user_date'),
+        ]
+
     def __str__(self):
         return self.name
 
-class MealPlan(BaseModel):
+class MealPlan(PlanDayMixin, BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     date = models.DateField()  # Removed default=timezone.now
     description = RichTextField(null=True, blank=True)
     calories_intake = models.FloatField(null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['user', 'date'], name='mealplan_user_date'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -77,9 +155,18 @@ class CoachProfile(BaseModel):
     def __str__(self):
         return self.user.username
 
+class HealthRecordManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        from managements import rollups
+        objs = super().bulk_create(objs, *args, **kwargs)
+        rollups.refresh_rollups(objs)
+        return objs
+
 class HealthRecord(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    date = models.DateTimeField(auto_now_add=True)
+    # Mặc định là lúc tạo (không dùng auto_now_add để nhập hàng loạt và dữ liệu lịch sử giữ được thời điểm
+    # gốc); nhập từ thiết bị đeo ghi thời điểm đo của từng số liệu
+    date = models.DateTimeField(default=timezone.now, editable=False)
     water_intake = models.FloatField(null=True, blank=True)
     steps = models.IntegerField(null=True, blank=True)
     heart_rate = models.IntegerField(null=True, blank=True)
@@ -87,12 +174,119 @@ class HealthRecord(BaseModel):
     weight = models.FloatField(null=True, blank=True)
     bmi = models.FloatField(editable=False, blank=True, null=True)
 
+    objects = HealthRecordManager()
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='healthrecord_user_date_id'),
+        ]
+
     def save(self, *args, **kwargs):
         try:
             self.bmi = round(self.weight / ((self.height / 100) ** 2), 2)
         except (TypeError, ZeroDivisionError):
             self.bmi = None
         super().save(*args, **kwargs)
+        from managements import rollups
+        rollups.refresh_rollups([self])
+
+    def delete(self, *args, **kwargs):
+        from managements import rollups
+        result = super().delete(*args, **kwargs)
+        rollups.refresh_rollups([self])
+        return result
+
+class HealthRecordArchive(models.Model):
+    """
+    HealthRecord đã xoá mềm hoặc quá cũ, được managements.archive chuyển khỏi bảng chính (giữ nguyên id).
+    Các trường ngày không dùng auto_now để giữ giá trị gốc.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    created_date = models.DateField(null=True)
+    updated_date = models.DateField(null=True)
+    active = models.BooleanField(default=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    date = models.DateTimeField()
+    water_intake = models.FloatField(null=True, blank=True)
+    steps = models.IntegerField(null=True, blank=True)
+    heart_rate = models.IntegerField(null=True, blank=True)
+    height = models.FloatField(null=True, blank=True)
+    weight = models.FloatField(null=True, blank=True)
+    bmi = models.FloatField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.date}"
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='healthrecordarchive_user_date'),
+        ]
+
+class HealthRecordRollup(models.Model):
+    """
+    Số liệu tổng hợp (count/sum/min/max) của một chỉ số HealthRecord theo ngày, tuần hoặc tháng.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='health_rollups')
+    period = models.CharField(max_length=10, choices=(
+        ('day', 'Ngày'),
+        ('week', 'Tuần'),
+        ('month', 'Tháng')
+    ))
+    period_start = models.DateField()
+    metric = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0)
+    minimum = models.FloatField(null=True, blank=True)
+    maximum = models.FloatField(null=True, blank=True)
+    updated_date = models.DateTimeField(auto_now=True)
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
+
+    def __str__(self):
+        return f"{self.user_id} - {self.metric} - {self.period} {self.period_start}"
+
+    class Meta:
+        unique_together = ('user', 'period', 'metric', 'period_start')
+        ordering = ['period_start']
+
+class AnomalyEvent(models.Model):
+    """
+    Số liệu heart_rate/steps lệch mạnh khỏi mức nền của chính người dùng (xem managements.anomalies).
+    record_id không phải khoá ngoại để sự kiện vẫn còn khi HealthRecord được chuyển sang bảng lưu trữ.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='anomaly_events')
+    record_id = models.BigIntegerField()
+    metric = models.CharField(max_length=20)
+    recorded_at = models.DateTimeField()
+    value = models.FloatField()
+    baseline = models.FloatField()
+    deviation = models.FloatField()
+    score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.metric} - {self.recorded_at}"
+
+    class Meta:
+        unique_together = ('record_id', 'metric')
+        indexes = [
+            models.Index(fields=['user', 'recorded_at', 'id'], name='anomalyevent_user_recorded'),
+        ]
+
+class AnomalyCheckpoint(models.Model):
+    """
+    id HealthRecord lớn nhất đã được bộ phát hiện bất thường xử lý (chế độ tăng dần).
+    """
+    key = models.CharField(max_length=50, unique=True)
+    last_record_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} - {self.last_record_id}"
 
 class HealthDiary(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -117,9 +311,49 @@ class ChatMessage(BaseModel):
     def __str__(self):
         return f"{self.sender.username} to {self.receiver.username} - {self.timestamp}"
 
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        super().save(*args, **kwargs)
+        if created:
+            from managements import realtime
+            transaction.on_commit(lambda: realtime.broadcast_message(self))
+
     class Meta:
         ordering = ['timestamp']
         unique_together = ('sender', 'receiver', 'timestamp')
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='chatmessage_timestamp_id'),
+            # Trang tin nhắn của một người: mỗi nhánh sender/receiver đọc theo (timestamp, id) của người đó
+            models.Index(fields=['sender', 'timestamp', 'id'], name='chatmessage_sender_timestamp'),
+            models.Index(fields=['receiver', 'timestamp', 'id'], name='chatmessage_receiver_timestamp'),
+            models.Index(fields=['receiver', 'is_read'], name='chatmessage_receiver_is_read'),
+        ]
+
+class ChatMessageArchive(models.Model):
+    """
+    ChatMessage đã xoá mềm hoặc đã đọc từ lâu, được managements.archive chuyển khỏi bảng chính (giữ nguyên id).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    created_date = models.DateField(null=True)
+    updated_date = models.DateField(null=True)
+    active = models.BooleanField(default=True)
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    message = models.TextField()
+    timestamp = models.DateTimeField()
+    is_read = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.sender_id} to {self.receiver_id} - {self.timestamp}"
+
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='chatmessagearchive_timestamp'),
+            models.Index(fields=['sender', 'timestamp'], name='chatmessagearchive_sender'),
+            models.Index(fields=['receiver', 'timestamp'], name='chatmessagearchive_receiver'),
+        ]
 
 
 class Tag(BaseModel):
@@ -138,6 +372,31 @@ class UserGoal(BaseModel):
     def __str__(self):
         return f"Mục tiêu của {self.user.username} - {self.goal_type}"
 
+class GoalProgress(models.Model):
+    """
+    Tiến độ của một UserGoal do lệnh project_goals tính hằng đêm: xu hướng cân nặng (hồi quy có trọng số
+    giảm dần theo thời gian) và ngày dự kiến đạt target_weight.
+    """
+    STATUS_CHOICES = [
+        ('achieved', 'Đã đạt'),
+        ('on_track', 'Đúng tiến độ'),
+        ('behind', 'Chậm tiến độ'),
+        ('off_track', 'Đi ngược mục tiêu'),
+        ('insufficient_data', 'Chưa đủ dữ liệu'),
+    ]
+    goal = models.OneToOneField(UserGoal, on_delete=models.CASCADE, related_name='progress')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goal_progress')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    samples = models.PositiveIntegerField(default=0)
+    current_weight = models.FloatField(null=True, blank=True)
+    trend_per_week = models.FloatField(null=True, blank=True)
+    required_per_week = models.FloatField(null=True, blank=True)
+    projected_date = models.DateField(null=True, blank=True)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.goal_id} - {self.status}"
+
 class UserConnection(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_connections")
     coach = models.ForeignKey(User, on_delete=models.CASCADE, related_name="coach_connections")
@@ -151,5 +410,69 @@ class UserConnection(BaseModel):
     def __str__(self):
         return f"Kết nối giữa {self.user.username} và {self.coach.username} - {self.status}"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_coach_id = self.coach_id
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalidate_clients()
+        self._loaded_coach_id = self.coach_id
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._invalidate_clients()
+        return result
+
+    def _invalidate_clients(self):
+        from managements import access
+        coach_ids = (self.coach_id, self._loaded_coach_id)
+        transaction.on_commit(lambda: access.invalidate_client_ids(*coach_ids))
+
     class Meta:
         unique_together = ('user', 'coach')
+        indexes = [
+            # Đủ cột cho truy vấn danh sách học viên (access.get_client_ids), không cần đọc bảng
+            models.Index(fields=['coach', 'status', 'active', 'user'], name='connection_coach_status'),
+        ]
+
+class StatsSnapshot(models.Model):
+    """
+    Kết quả thống kê đã tính sẵn cho trang admin, khoá theo khoảng thời gian và top-N.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    data = models.JSONField(default=dict)
+    generated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} - {self.generated_at}"
+
+
+class MediaUpload(models.Model):
+    """
+    Ảnh đang chờ xử lý nền: file đã ghi tạm (hoặc URL) ở staged_path, sau khi tải lên xong sẽ thay vào
+    trường field của đối tượng (content_type, object_id).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    content_type = models.ForeignKey('contenttypes.ContentType', on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    field = models.CharField(max_length=50)
+    staged_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.content_type_id}:{self.object_id}.{self.field} - {self.status}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='mediaupload_status_id'),
+        ]
@@ -1,4 +1,43 @@
 from rest_framework import pagination
 
 class Pagination(pagination.PageNumberPagination):
-    page_size = 5
\ No newline at end of file
+    page_size = 5
+
+class KeysetPagination(pagination.CursorPagination):
+    """
+    Phân trang theo con trỏ (CursorPagination của DRF): không chạy COUNT(*). Con trỏ chỉ lưu giá trị của
+    trường sắp xếp đầu tiên (vd. date) nên mỗi trang lọc theo trường đó qua chỉ mục; OFFSET chỉ dùng để bỏ
+    qua các dòng trùng đúng giá trị ấy ở đầu trang, vì vậy chi phí không tăng theo số trang. Trường thứ hai
+    (id) chỉ giữ thứ tự ổn định, không phải khoá con trỏ tổng hợp.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class HealthRecordCursorPagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+class ChatMessageCursorPagination(KeysetPagination):
+    # ChatMessageViewSet tách sender/receiver thành các nhánh riêng: mỗi nhánh đọc theo chỉ mục
+    # (sender|receiver, timestamp, id) kèm LIMIT nên chi phí mỗi trang chỉ theo page_size
+    ordering = ('-timestamp', '-id')
+
+class AnomalyEventCursorPagination(KeysetPagination):
+    ordering = ('-recorded_at', '-id')
+
+class CursorModeMixin:
+    """
+    Cho viewset chuyển sang cursor_pagination_class khi client gửi ?paginate=cursor
+    (hoặc ?cursor= của trang kế tiếp); mặc định vẫn giữ pagination_class cũ.
+    """
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if self.cursor_pagination_class and ('cursor' in params or params.get('paginate') == 'cursor'):
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
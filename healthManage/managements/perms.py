@@ -6,7 +6,7 @@ class OwnerPermission(permissions.IsAuthenticated):
         if isinstance(obj, request.user.__class__):
             return obj == request.user
         # Nếu object có thuộc tính user
-        return hasattr(obj, 'user') and obj.user == request.user
+        return hasattr(obj, 'user') and obj.user_id == request.user.id
 
 class AdminOrCoachPermission(permissions.BasePermission):
     def has_permission(self, request, view):
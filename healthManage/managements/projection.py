@@ -0,0 +1,149 @@
+"""
+Dự báo tiến độ UserGoal theo cân nặng.
+
+Với mỗi người dùng có mục tiêu target_weight, xu hướng cân nặng là đường hồi quy bình phương tối thiểu
+có trọng số trên HealthRecord.weight trong GOAL_PROJECTION_WINDOW_DAYS ngày gần nhất; trọng số giảm
+một nửa sau mỗi GOAL_PROJECTION_HALF_LIFE_DAYS ngày nên số liệu mới ảnh hưởng nhiều hơn. Các tổng
+của phương trình chuẩn được cộng theo người dùng bằng np.bincount nên cả lô người dùng được giải
+cùng lúc, không lặp theo từng người. Kết quả được ghi vào GoalProgress (lệnh project_goals chạy hằng
+đêm) và API chỉ đọc từ bảng đó.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from managements.models import GoalProgress, HealthRecord, UserGoal
+
+WINDOW_DAYS = getattr(settings, 'GOAL_PROJECTION_WINDOW_DAYS', 90)
+HALF_LIFE_DAYS = getattr(settings, 'GOAL_PROJECTION_HALF_LIFE_DAYS', 21)
+MIN_SAMPLES = getattr(settings, 'GOAL_PROJECTION_MIN_SAMPLES', 3)
+MIN_SPAN_DAYS = getattr(settings, 'GOAL_PROJECTION_MIN_SPAN_DAYS', 3)
+BATCH_SIZE = getattr(settings, 'GOAL_PROJECTION_BATCH_SIZE', 1000)
+# Chênh lệch (kg) với target_weight được coi là đã đạt; dự báo xa hơn MAX_DAYS ngày coi như không đạt
+TOLERANCE = 0.5
+MAX_DAYS = 3650
+
+UPDATE_FIELDS = ['user', 'status', 'samples', 'current_weight', 'trend_per_week', 'required_per_week',
+                 'projected_date', 'computed_at']
+
+
+def fit_trends(user_ids, owners, days, weights, half_life=HALF_LIFE_DAYS):
+    """
+    Hồi quy có trọng số cho nhiều người dùng cùng lúc.
+
+    user_ids: mảng id người dùng đã sắp xếp, không trùng. owners, days, weights: người dùng, số ngày
+    tính từ hiện tại (<= 0) và cân nặng của từng số liệu. Trả về các mảng theo thứ tự user_ids:
+    (số số liệu, số ngày giữa số liệu đầu và cuối, cân nặng ước tính hôm nay, độ dốc kg/ngày);
+    độ dốc là NaN nếu không giải được.
+    """
+    size = len(user_ids)
+    index = np.searchsorted(user_ids, owners)
+    w = 0.5 ** (-days / half_life)
+
+    samples = np.bincount(index, minlength=size)
+    sw = np.bincount(index, weights=w, minlength=size)
+    sx = np.bincount(index, weights=w * days, minlength=size)
+    sy = np.bincount(index, weights=w * weights, minlength=size)
+    sxx = np.bincount(index, weights=w * days * days, minlength=size)
+    sxy = np.bincount(index, weights=w * days * weights, minlength=size)
+    first, last = np.zeros(size), np.full(size, -np.inf)
+    np.minimum.at(first, index, days)
+    np.maximum.at(last, index, days)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = sw * sxx - sx * sx
+        slope = np.where(denominator > 1e-9 * sw * sw, (sw * sxy - sx * sy) / denominator, np.nan)
+        # Giá trị của đường xu hướng tại ngày 0 (hôm nay); không có độ dốc thì là trung bình có trọng số
+        current = np.where(sw > 0, (sy - np.nan_to_num(slope) * sx) / sw, np.nan)
+    span = np.where(samples > 0, last - first, 0)
+    return samples, span, current, slope
+
+
+def classify(samples, span, current, slope, targets, days_left):
+    """
+    Trạng thái, số ngày dự kiến đến khi đạt mục tiêu và mức thay đổi cần thiết (kg/ngày) của từng mục tiêu.
+    days_left là số ngày còn lại đến target_date (NaN nếu không đặt hạn).
+    """
+    remaining = targets - current
+    enough = (samples >= MIN_SAMPLES) & (span >= MIN_SPAN_DAYS) & ~np.isnan(slope)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Làm tròn trước khi lấy trần để sai số dấu phẩy động không cộng thêm một ngày
+        eta = np.ceil(np.round(remaining / slope, 6))
+        required = np.where(days_left > 0, remaining / days_left, np.nan)
+    achieved = enough & (np.abs(remaining) <= TOLERANCE)
+    moving = enough & (slope * remaining > 0) & (eta <= MAX_DAYS)
+    on_time = moving & (np.isnan(days_left) | (eta <= days_left))
+    status = np.select([~enough, achieved, on_time, moving],
+                       ['insufficient_data', 'achieved', 'on_track', 'behind'], 'off_track')
+    eta = np.where(achieved, 0, np.where(moving, eta, np.nan))
+    return status, eta, required
+
+
+def _value(number, digits=2):
+    return None if np.isnan(number) else round(float(number), digits)
+
+
+def _project_batch(user_ids, now, today):
+    users = np.array(user_ids, dtype=np.int64)
+    goals = list(UserGoal.objects.filter(active=True, target_weight__isnull=False, user_id__in=user_ids)
+                 .order_by('id').values_list('id', 'user_id', 'target_weight', 'target_date'))
+    records = list(HealthRecord.objects.filter(user_id__in=user_ids, active=True, weight__isnull=False,
+                                               date__gte=now - timedelta(days=WINDOW_DAYS))
+                   .order_by().values_list('user_id', 'date', 'weight'))
+
+    owners = np.fromiter((r[0] for r in records), dtype=np.int64, count=len(records))
+    stamps = np.fromiter((r[1].timestamp() for r in records), dtype=float, count=len(records))
+    weights = np.fromiter((r[2] for r in records), dtype=float, count=len(records))
+    days = np.minimum((stamps - now.timestamp()) / 86400, 0)
+    samples, span, current, slope = fit_trends(users, owners, days, weights)
+
+    at = np.searchsorted(users, np.fromiter((g[1] for g in goals), dtype=np.int64, count=len(goals)))
+    targets = np.fromiter((g[2] for g in goals), dtype=float, count=len(goals))
+    days_left = np.fromiter(((g[3] - today).days if g[3] else np.nan for g in goals), dtype=float,
+                            count=len(goals))
+    status, eta, required = classify(samples[at], span[at], current[at], slope[at], targets, days_left)
+
+    progress = [GoalProgress(
+        goal_id=goal_id, user_id=user_id, status=str(status[i]), samples=int(samples[at[i]]),
+        current_weight=_value(current[at[i]]), trend_per_week=_value(slope[at[i]] * 7, 3),
+        required_per_week=_value(required[i] * 7, 3),
+        projected_date=None if np.isnan(eta[i]) else today + timedelta(days=int(eta[i])), computed_at=now,
+    ) for i, (goal_id, user_id, _, _) in enumerate(goals)]
+    with transaction.atomic():
+        GoalProgress.objects.bulk_create(progress, update_conflicts=True, unique_fields=['goal'],
+                                         update_fields=UPDATE_FIELDS)
+    return progress, len(records)
+
+
+def project_goals(user_ids=None, batch_size=BATCH_SIZE, now=None):
+    """
+    Tính lại GoalProgress cho mọi mục tiêu có target_weight (hoặc chỉ của user_ids), mỗi lần batch_size
+    người dùng; xoá tiến độ của các mục tiêu không còn hiệu lực. Trả về thống kê của lần chạy.
+    """
+    started = time.perf_counter()
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    goals = UserGoal.objects.filter(active=True, target_weight__isnull=False)
+    if user_ids:
+        goals = goals.filter(user_id__in=user_ids)
+    users = list(goals.order_by('user_id').values_list('user_id', flat=True).distinct())
+
+    summary = {"users": len(users), "goals": 0, "records": 0}
+    for offset in range(0, len(users), batch_size):
+        progress, records = _project_batch(users[offset:offset + batch_size], now, today)
+        summary['goals'] += len(progress)
+        summary['records'] += records
+        for item in progress:
+            summary[item.status] = summary.get(item.status, 0) + 1
+
+    stale = GoalProgress.objects.filter(Q(goal__active=False) | Q(goal__target_weight__isnull=True))
+    if user_ids:
+        stale = stale.filter(user_id__in=user_ids)
+    summary['removed'] = stale.delete()[0]
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
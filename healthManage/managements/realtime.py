@@ -0,0 +1,59 @@
+"""
+Đẩy tin nhắn chat theo thời gian thực qua WebSocket (channels).
+
+Mỗi người dùng đang kết nối tham gia nhóm chat_user_<id>; khi một ChatMessage được lưu,
+tin nhắn được gửi tới nhóm của người gửi và người nhận.
+"""
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import AnonymousUser
+
+
+def user_group(user_id):
+    return f'chat_user_{user_id}'
+
+
+def broadcast_message(message):
+    from managements.serializers import ChatMessageSerializer
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    event = {
+        "type": "chat.message",
+        "sender_id": message.sender_id,
+        "receiver_id": message.receiver_id,
+        "message": dict(ChatMessageSerializer(message).data),
+    }
+    for user_id in {message.sender_id, message.receiver_id}:
+        async_to_sync(layer.group_send)(user_group(user_id), event)
+
+
+@database_sync_to_async
+def get_token_user(token):
+    from managements import tokens
+
+    access_token = tokens.load_access_token(token)
+    if access_token is None or access_token.is_expired() or not access_token.user.is_active:
+        return AnonymousUser()
+    return access_token.user
+
+
+class TokenAuthMiddleware:
+    """
+    Xác thực WebSocket bằng access token OAuth2, gửi qua ?token= hoặc header Authorization: Bearer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        for name, value in scope.get('headers', []):
+            if name == b'authorization' and value.lower().startswith(b'bearer '):
+                token = value[7:].decode()
+        scope = dict(scope, user=await get_token_user(token) if token else AnonymousUser())
+        return await self.app(scope, receive, send)
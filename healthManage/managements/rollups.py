@@ -0,0 +1,206 @@
+"""
+Bảng tổng hợp HealthRecord theo ngày/tuần/tháng cho từng người dùng.
+
+Khi HealthRecord thay đổi, chỉ các bucket bị ảnh hưởng được tính lại: bucket ngày tính từ
+dữ liệu gốc, bucket tuần/tháng gộp lại từ các bucket ngày nên chi phí không phụ thuộc vào
+tổng số bản ghi của người dùng. Ngày cũ hơn mốc lưu trữ được tính cả từ HealthRecordArchive
+(xem managements.archive).
+"""
+import operator
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from managements import archive
+from managements.models import HealthRecord, HealthRecordArchive, HealthRecordRollup
+
+ROLLUP_METRICS = ['steps', 'water_intake', 'heart_rate', 'weight', 'bmi']
+ROLLUP_PERIODS = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def period_start(period, day):
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def period_end(period, start):
+    """Ngày đầu tiên sau bucket bắt đầu từ start."""
+    if period == 'week':
+        return start + timedelta(days=7)
+    if period == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def local_day(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def refresh_rollups(records):
+    """
+    Tính lại các bucket chứa những bản ghi vừa được tạo, sửa hoặc xoá.
+    """
+    days = defaultdict(set)
+    for record in records:
+        if record.user_id and record.date:
+            days[record.user_id].add(local_day(record.date))
+    if days:
+        refresh_days(days)
+
+
+def refresh_days(days):
+    """
+    days: {user_id: tập các ngày} cần tính lại.
+    """
+    with transaction.atomic():
+        _refresh_day_buckets(days)
+        for period, trunc in ROLLUP_PERIODS.items():
+            starts = {user_id: {period_start(period, d) for d in user_days} for user_id, user_days in days.items()}
+            _refresh_period_buckets(period, trunc, starts)
+
+
+def _day_bounds(first_day, last_day):
+    start = datetime.combine(first_day, time.min)
+    end = datetime.combine(last_day + timedelta(days=1), time.min)
+    if settings.USE_TZ:
+        start, end = timezone.make_aware(start), timezone.make_aware(end)
+    return start, end
+
+
+def _aggregates(from_rollups=False):
+    aggregates = {}
+    for metric in ROLLUP_METRICS:
+        if from_rollups:
+            aggregates[f'{metric}__count'] = Sum('count', filter=Q(metric=metric))
+            aggregates[f'{metric}__total'] = Sum('total', filter=Q(metric=metric))
+            aggregates[f'{metric}__minimum'] = Min('minimum', filter=Q(metric=metric))
+            aggregates[f'{metric}__maximum'] = Max('maximum', filter=Q(metric=metric))
+        else:
+            aggregates[f'{metric}__count'] = Count(metric)
+            aggregates[f'{metric}__total'] = Sum(metric)
+            aggregates[f'{metric}__minimum'] = Min(metric)
+            aggregates[f'{metric}__maximum'] = Max(metric)
+    return aggregates
+
+
+def _build_rows(period, groups):
+    rows = []
+    for group in groups:
+        for metric in ROLLUP_METRICS:
+            count = group[f'{metric}__count'] or 0
+            if not count:
+                continue
+            rows.append(HealthRecordRollup(
+                user_id=group['user_id'],
+                period=period,
+                period_start=group['bucket'],
+                metric=metric,
+                count=count,
+                total=group[f'{metric}__total'] or 0,
+                minimum=group[f'{metric}__minimum'],
+                maximum=group[f'{metric}__maximum'],
+            ))
+    return rows
+
+
+def _replace(period, buckets, rows):
+    condition = Q()
+    for user_id, starts in buckets.items():
+        condition |= Q(user_id=user_id, period_start__in=starts)
+    HealthRecordRollup.objects.filter(condition, period=period).delete()
+    HealthRecordRollup.objects.bulk_create(rows)
+
+
+def _day_groups(model, condition):
+    return list(model.objects.filter(condition, active=True)
+                .annotate(bucket=TruncDate('date'))
+                .values('user_id', 'bucket')
+                .annotate(**_aggregates())
+                .order_by())
+
+
+def _combine(first, second, how):
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return how(first, second)
+
+
+def _merge_groups(groups):
+    merged = {}
+    for group in groups:
+        key = (group['user_id'], group['bucket'])
+        if key not in merged:
+            merged[key] = dict(group)
+            continue
+        current = merged[key]
+        for metric in ROLLUP_METRICS:
+            for suffix, how in (('count', operator.add), ('total', operator.add), ('minimum', min), ('maximum', max)):
+                name = f'{metric}__{suffix}'
+                current[name] = _combine(current[name], group[name], how)
+    return list(merged.values())
+
+
+def _refresh_day_buckets(days):
+    condition = Q()
+    for user_id, user_days in days.items():
+        start, end = _day_bounds(min(user_days), max(user_days))
+        condition |= Q(user_id=user_id, date__gte=start, date__lt=end)
+
+    groups = _day_groups(HealthRecord, condition)
+    # Số liệu của ngày cũ hơn mốc lưu trữ có thể đã được chuyển sang HealthRecordArchive
+    if min(min(user_days) for user_days in days.values()) <= local_day(archive.cutoff('healthrecord')):
+        groups = _merge_groups(groups + _day_groups(HealthRecordArchive, condition))
+    groups = [g for g in groups if g['bucket'] in days[g['user_id']]]
+    _replace('day', days, _build_rows('day', groups))
+
+
+def _refresh_period_buckets(period, trunc, starts):
+    condition = Q()
+    for user_id, user_starts in starts.items():
+        condition |= Q(user_id=user_id, period_start__gte=min(user_starts),
+                       period_start__lt=period_end(period, max(user_starts)))
+
+    groups = (HealthRecordRollup.objects.filter(condition, period='day')
+              .annotate(bucket=trunc('period_start'))
+              .values('user_id', 'bucket')
+              .annotate(**_aggregates(from_rollups=True))
+              .order_by())
+    groups = [g for g in groups if g['bucket'] in starts[g['user_id']]]
+    _replace(period, starts, _build_rows(period, groups))
+
+
+def rebuild_rollups(user_ids=None):
+    """
+    Tính lại toàn bộ bảng tổng hợp (dùng khi khởi tạo hoặc sau khi cập nhật hàng loạt bằng update()).
+    """
+    days = defaultdict(set)
+    for model in (HealthRecord, HealthRecordArchive):
+        records = model.objects.all()
+        if user_ids:
+            records = records.filter(user_id__in=user_ids)
+        for user_id, day in records.annotate(day=TruncDate('date')).values_list('user_id', 'day').distinct().order_by():
+            days[user_id].add(day)
+
+    with transaction.atomic():
+        stale = HealthRecordRollup.objects.all()
+        if user_ids:
+            stale = stale.filter(user_id__in=user_ids)
+        stale.delete()
+        if days:
+            refresh_days(days)
+    return sum(len(d) for d in days.values())
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from managements import consumers
+
+websocket_urlpatterns = [
+    path('ws/chat/', consumers.ChatConsumer.as_asgi()),
+    path('ws/chat/<int:user_id>/', consumers.ChatConsumer.as_asgi()),
+]
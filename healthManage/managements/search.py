@@ -0,0 +1,107 @@
+"""
+Tìm kiếm toàn văn cho danh mục Activity bằng bảng chỉ mục ActivitySearchToken.
+
+Mỗi Activity được tách thành các từ (bỏ thẻ HTML, bỏ dấu tiếng Việt, chữ thường) từ name và
+description; từ trong name có trọng số cao hơn. Truy vấn chỉ dùng so sánh bằng và so sánh khoảng
+trên cột token nên chạy được bằng index trên cả MySQL và SQLite.
+"""
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils.html import strip_tags
+
+from managements.models import Activity, ActivitySearchToken
+
+NAME_WEIGHT = 5
+DESCRIPTION_WEIGHT = 1
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 8
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(normalize(strip_tags(text)))]
+
+
+def activity_tokens(activity):
+    weights = Counter()
+    for token in tokenize(activity.name):
+        weights[token] += NAME_WEIGHT
+    for token in tokenize(activity.description):
+        weights[token] += DESCRIPTION_WEIGHT
+    return weights
+
+
+def index_activities(activities):
+    """
+    Ghi lại chỉ mục cho các activity (gọi sau khi lưu, kể cả sau bulk_create/bulk_update).
+    """
+    activities = [a for a in activities if a.pk]
+    rows = [ActivitySearchToken(activity_id=activity.pk, token=token, weight=weight)
+            for activity in activities
+            for token, weight in activity_tokens(activity).items()]
+    with transaction.atomic():
+        ActivitySearchToken.objects.filter(activity_id__in=[a.pk for a in activities]).delete()
+        ActivitySearchToken.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild_index(batch_size=1000):
+    ActivitySearchToken.objects.all().delete()
+    count = 0
+    queryset = Activity.objects.only('id', 'name', 'description').order_by('id')
+    batch = []
+    for activity in queryset.iterator(chunk_size=batch_size):
+        batch.append(activity)
+        if len(batch) == batch_size:
+            index_activities(batch)
+            count += len(batch)
+            batch = []
+    index_activities(batch)
+    return count + len(batch)
+
+
+def _prefix_range(prefix):
+    """Điều kiện token bắt đầu bằng prefix, viết dưới dạng khoảng để dùng được index."""
+    return Q(token__gte=prefix, token__lt=prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def search_activities(queryset, query, prefix=True, names_only=False):
+    """
+    Lọc queryset theo query; activity phải chứa mọi từ trong query (từ cuối được khớp theo tiền tố
+    khi prefix=True), kết quả được sắp theo tổng trọng số (search_rank).
+    names_only=True chỉ xét các từ xuất hiện trong name (dùng cho gợi ý khi đang gõ).
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset.none()
+
+    conditions = [Q(token=term) for term in terms]
+    if prefix:
+        conditions[-1] = _prefix_range(terms[-1])
+
+    matches = Q()
+    for condition in conditions:
+        matches |= condition
+    if names_only:
+        matches &= Q(weight__gte=NAME_WEIGHT)
+    # Gom nhóm trên bảng token (đi theo index token) rồi mới nối sang Activity
+    ranked = (ActivitySearchToken.objects.filter(matches)
+              .values('activity_id')
+              .annotate(rank=Sum('weight'),
+                        matched_terms=Count(Case(*[When(c, then=Value(i)) for i, c in enumerate(conditions)]),
+                                            distinct=True))
+              .filter(matched_terms=len(conditions))
+              .order_by())
+    return (queryset.filter(id__in=ranked.values('activity_id'))
+            .annotate(search_rank=Subquery(ranked.filter(activity_id=OuterRef('pk')).values('rank')[:1]))
+            .order_by('-search_rank', '-id'))
@@ -1,15 +1,159 @@
+import os
+
 from rest_framework import serializers
 from rest_framework.serializers import *
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import Prefetch
+from django.utils import timezone
+from managements import media, uploads
 from managements.models import *
 
-class UserSerializer(ModelSerializer):
+
+def parse_field_tree(value):
+    """
+    'id,user.username,user.email' -> {'id': {}, 'user': {'username': {}, 'email': {}}}
+    """
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in filter(None, (p.strip() for p in path.split('.'))):
+            node = node.setdefault(part, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    ?fields=id,name,user.username chỉ trả về các trường được chọn; quan hệ trong expandable_fields mặc định
+    chỉ trả về id, ?expand=user,activities trả về đầy đủ bằng serializer lồng. Serializer gốc đọc hai tham số
+    từ request trong context, serializer lồng nhận phần tương ứng qua tham số fields=/expand=.
+
+    field_columns khai báo các cột mà một trường không gắn trực tiếp với cột (SerializerMethodField) cần đọc,
+    để optimize_queryset giới hạn được cột bằng only().
+    """
+    expandable_fields = {}
+    field_columns = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self._field_trees = (fields or None, expand or {}) if fields is not None or expand is not None else None
+        super().__init__(*args, **kwargs)
+
+    def _is_root(self):
+        parent = getattr(self, 'parent', None)
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_field_trees(self):
+        """
+        (cây fields hoặc None nếu lấy tất cả, cây expand).
+        """
+        if self._field_trees is None:
+            request = self.context.get('request') if self._is_root() else None
+            params = request.query_params if request is not None else {}
+            self._field_trees = (parse_field_tree(params['fields']) if params.get('fields') else None,
+                                 parse_field_tree(params.get('expand')))
+        return self._field_trees
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self.get_field_trees()
+        for name, field in fields.items():
+            sub_fields = (requested or {}).get(name) or None
+            if name in self.expandable_fields and name in expand:
+                serializer_class, options = self.expandable_fields[name]
+                fields[name] = serializer_class(read_only=True, fields=sub_fields, expand=expand[name], **options)
+                continue
+            nested = field.child if isinstance(field, ListSerializer) else field
+            if isinstance(nested, DynamicFieldsMixin):
+                nested._field_trees = (sub_fields, expand.get(name, {}))
+        return fields
+
+    @property
+    def _readable_fields(self):
+        requested = self.get_field_trees()[0]
+        for field in super()._readable_fields:
+            if requested is None or field.field_name in requested:
+                yield field
+
+    def get_query_plan(self, model):
+        """
+        (các cột cần đọc hoặc None nếu không xác định được, select_related, prefetch_related).
+        """
+        columns, select, prefetch = {model._meta.pk.name}, [], []
+        for field in self._readable_fields:
+            name, source = field.field_name, field.source
+            if name in self.field_columns:
+                columns.update(self.field_columns[name])
+                continue
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                columns = None
+                continue
+            nested = field.child if isinstance(field, ListSerializer) else field
+            if isinstance(field, ManyRelatedField):
+                prefetch.append(Prefetch(source, queryset=model_field.related_model._default_manager.only('pk')))
+            elif model_field.many_to_many or model_field.one_to_many:
+                related = model_field.related_model._default_manager.all()
+                prefetch.append(Prefetch(source, queryset=nested.optimize_queryset(related)))
+            elif isinstance(nested, DynamicFieldsMixin):
+                sub_columns, sub_select, _ = nested.get_query_plan(model_field.related_model)
+                if sub_columns is None:
+                    sub_columns = [f.name for f in model_field.related_model._meta.concrete_fields]
+                select += [source, *(f'{source}__{s}' for s in sub_select)]
+                if columns is not None:
+                    columns.update([source, *(f'{source}__{c}' for c in sub_columns)])
+            elif columns is not None:
+                columns.add(source)
+        return columns, select, prefetch
+
+    def optimize_queryset(self, queryset, extra_columns=()):
+        """
+        Chọn cột (only) và select_related/prefetch_related của queryset theo đúng các trường sẽ trả về.
+        """
+        columns, select, prefetch = self.get_query_plan(queryset.model)
+        queryset = queryset.select_related(None).prefetch_related(None)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if columns is not None:
+            queryset = queryset.only(*columns, *extra_columns)
+        return queryset
+
+
+class StagedMediaMixin:
+    """
+    Ảnh trong staged_media_fields không được tải lên ngay trong request: file được ghi tạm và
+    giao cho managements.uploads xử lý nền, trường ảnh được thay khi tải lên xong.
+    """
+    staged_media_fields = ()
+
+    def save(self, **kwargs):
+        files = {field: self.validated_data.pop(field) for field in self.staged_media_fields
+                 if isinstance(self.validated_data.get(field), UploadedFile)}
+        instance = super().save(**kwargs)
+        for field, uploaded_file in files.items():
+            uploads.enqueue_upload(instance, field, uploaded_file)
+        return instance
+
+class UserSerializer(DynamicFieldsMixin, StagedMediaMixin, ModelSerializer):
     confirm_password = serializers.CharField(write_only=True, required=True)
+    staged_media_fields = ('avatar',)
+    field_columns = {
+        'avatar_url': ('avatar', 'avatar_url'),
+        'avatar_thumbnail_url': ('avatar', 'avatar_thumbnail_url'),
+    }
     avatar_url = serializers.SerializerMethodField()
+    avatar_thumbnail_url = serializers.SerializerMethodField()
 
     def get_avatar_url(self, user):
-        if user.avatar and hasattr(user.avatar, 'url'):
-            return user.avatar.url
-        return None
+        # URL đã được lưu khi lưu ảnh; dữ liệu cũ dùng bản ghi nhớ của media.resolve_url
+        return user.avatar_url or media.resolve_url(user.avatar)
+
+    def get_avatar_thumbnail_url(self, user):
+        return user.avatar_thumbnail_url or media.resolve_url(user.avatar, **media.THUMBNAIL_OPTIONS)
 
     def validate(self, attrs):
         if attrs.get('password') != attrs.get('confirm_password'):
@@ -26,7 +170,7 @@ class UserSerializer(ModelSerializer):
 
     class Meta:
         model = User
-        fields = ["id", "username", "password", "confirm_password", "avatar", "avatar_url", "first_name", "last_name", "email", "role"]
+        fields = ["id", "username", "password", "confirm_password", "avatar", "avatar_url", "avatar_thumbnail_url", "first_name", "last_name", "email", "role"]
         extra_kwargs = {
             'password': {
                 'write_only': True,
@@ -49,73 +193,172 @@ class ChangePasswordSerializer(ModelSerializer):
             raise serializers.ValidationError("Mật khẩu mới và mật khẩu xác nhận không khớp.")
         return attrs
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(DynamicFieldsMixin, StagedMediaMixin, serializers.ModelSerializer):
+    staged_media_fields = ('image',)
+    field_columns = {
+        'image_url': ('image', 'image_url'),
+        'image_thumbnail_url': ('image', 'image_thumbnail_url'),
+    }
     image_url = serializers.SerializerMethodField()
+    image_thumbnail_url = serializers.SerializerMethodField()
 
     def get_image_url(self, obj):
-        if obj.image and hasattr(obj.image, 'url'):
-            return obj.image.url  # Cloudinary đã là full URL
-        return None
+        return obj.image_url or media.resolve_url(obj.image)
+
+    def get_image_thumbnail_url(self, obj):
+        return obj.image_thumbnail_url or media.resolve_url(obj.image, **media.THUMBNAIL_OPTIONS)
 
     class Meta:
         model = Activity
-        fields = ['id', 'name', 'description', 'calories_burned', 'image_url']
+        fields = ['id', 'name', 'description', 'calories_burned', 'image', 'image_url', 'image_thumbnail_url']
+        extra_kwargs = {
+            'image': {'write_only': True, 'required': False}
+        }
 
-class WorkoutPlanSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
-    activities = ActivitySerializer(many=True, read_only=True) # Nest Activity info
+class WorkoutPlanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    activities = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    expandable_fields = {'user': (UserSerializer, {}), 'activities': (ActivitySerializer, {'many': True})}
     class Meta:
         model = WorkoutPlan
         fields = ['id', 'user', 'name', 'date', 'activities', 'description', 'sets', 'reps']
 
-class MealPlanSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
+class MealPlanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
     class Meta:
         model = MealPlan
         fields = ['id', 'user', 'name', 'date', 'description', 'calories_intake']
 
-class CoachProfileSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
+class CoachProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
     class Meta:
         model = CoachProfile
         fields = ['id', 'user', 'bio', 'specialties', 'years_of_experience', 'certifications']
 
-class HealthRecordSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
+class HealthRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
     class Meta:
         model = HealthRecord
         fields = ['id', 'user', 'bmi', 'water_intake', 'steps', 'heart_rate', 'height', 'weight', 'date']
         read_only_fields = ['bmi']
 
-class HealthDiarySerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
+class HealthRecordReadingSerializer(serializers.Serializer):
+    """
+    Kiểm tra một số liệu trong lô nhập hàng loạt (không dùng ModelSerializer để nhẹ hơn).
+    date là thời điểm đo trên thiết bị (ISO 8601), bỏ trống thì lấy thời điểm nhận.
+    """
+    date = serializers.DateTimeField(required=False)
+    water_intake = serializers.FloatField(required=False, allow_null=True, min_value=0)
+    steps = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    heart_rate = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    height = serializers.FloatField(required=False, allow_null=True, min_value=0)
+    weight = serializers.FloatField(required=False, allow_null=True, min_value=0)
+
+    def validate_date(self, value):
+        if value > timezone.now():
+            raise serializers.ValidationError("Thời điểm đo không được ở tương lai.")
+        return value
+
+    def validate(self, attrs):
+        if not any(value is not None for name, value in attrs.items() if name != 'date'):
+            raise serializers.ValidationError("Số liệu không có chỉ số nào.")
+        return attrs
+
+class ActivityImportSerializer(serializers.Serializer):
+    """
+    Kiểm tra một dòng khi nhập danh mục Activity. image là URL https thuộc MEDIA_REMOTE_HOSTS; lệnh quản trị
+    (context allow_local_images) cho phép thêm đường dẫn file trên máy.
+    """
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    calories_burned = serializers.FloatField(required=False, allow_null=True, min_value=0)
+    time = serializers.IntegerField(required=False, allow_null=True, min_value=0)
+    image = serializers.CharField(required=False, allow_blank=True, allow_null=True, max_length=500)
+
+    def validate_image(self, value):
+        if not value:
+            return None
+        if uploads.is_allowed_url(value):
+            return value
+        if not uploads.is_remote(value) and self.context.get('allow_local_images') and os.path.isfile(value):
+            return value
+        raise serializers.ValidationError(
+            f"Ảnh phải là URL https thuộc các máy chủ: {', '.join(uploads.REMOTE_HOSTS)}.")
+
+class HealthRecordRollupSerializer(serializers.ModelSerializer):
+    sum = serializers.FloatField(source='total')
+    avg = serializers.FloatField(source='average')
+    min = serializers.FloatField(source='minimum')
+    max = serializers.FloatField(source='maximum')
+    class Meta:
+        model = HealthRecordRollup
+        fields = ['period_start', 'count', 'sum', 'avg', 'min', 'max']
+
+class HealthDiarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
     class Meta:
         model = HealthDiary
         fields = ['id', 'user', 'date', 'content', 'feeling']
 
 
-class ChatMessageSerializer(serializers.ModelSerializer):
-    sender = UserSerializer()
-    receiver = UserSerializer()
+class ChatMessageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    sender = serializers.PrimaryKeyRelatedField(read_only=True)
+    receiver = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    expandable_fields = {'sender': (UserSerializer, {}), 'receiver': (UserSerializer, {})}
     class Meta:
         model = ChatMessage
         fields = ['id', 'sender', 'receiver', 'message', 'timestamp', 'is_read']
 
-class TagSerializer(serializers.ModelSerializer):
+class ConversationSerializer(DynamicFieldsMixin, serializers.Serializer):
+    user = serializers.IntegerField(source='counterpart')
+    last_message = ChatMessageSerializer()
+    unread_count = serializers.IntegerField()
+    expandable_fields = {'user': (UserSerializer, {'source': 'counterpart_user'})}
+
+class TagSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
 
-class UserGoalSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
+class UserGoalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
     class Meta:
         model = UserGoal
         fields = ['id', 'user', 'goal_type', 'target_weight', 'target_date', 'description']
         read_only_fields = ['user']
 
-class UserConnectionSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
-    coach = UserSerializer()
+class GoalProgressSerializer(serializers.ModelSerializer):
+    goal = UserGoalSerializer()
+    class Meta:
+        model = GoalProgress
+        fields = ['goal', 'status', 'samples', 'current_weight', 'trend_per_week', 'required_per_week',
+                  'projected_date', 'computed_at']
+
+class AnomalyEventSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    expandable_fields = {'user': (UserSerializer, {})}
+    class Meta:
+        model = AnomalyEvent
+        fields = ['id', 'user', 'metric', 'record_id', 'recorded_at', 'value', 'baseline', 'deviation', 'score']
+
+class UserConnectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    coach = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    expandable_fields = {'user': (UserSerializer, {}), 'coach': (UserSerializer, {})}
     class Meta:
         model = UserConnection
         fields = ['id', 'user', 'coach', 'status']
+
+class ClientDashboardSerializer(serializers.Serializer):
+    """
+    Một dòng trên bảng điều khiển của huấn luyện viên (xem UserConnectionViewSet.dashboard).
+    """
+    user = UserSerializer(fields=parse_field_tree('id,username,first_name,last_name,avatar_thumbnail_url'))
+    latest_record = HealthRecordSerializer(allow_null=True)
+    week_plans = serializers.IntegerField()
+    active_goal = UserGoalSerializer(allow_null=True)
@@ -0,0 +1,147 @@
+"""
+Thống kê cho trang admin managements-stats.
+
+Số liệu được tính sẵn vào bảng StatsSnapshot và trang admin chỉ đọc snapshot. Khi snapshot cũ
+hơn MANAGEMENTS_STATS_TTL giây, trang vẫn hiển thị bản cũ và một luồng nền tính lại.
+Khoảng thời gian dài tối đa MANAGEMENTS_STATS_MAX_DAYS ngày; mỗi lần tính lại, chỉ giữ
+MANAGEMENTS_STATS_MAX_SNAPSHOTS snapshot mới nhất để bảng không phình theo các khoảng đã từng xem.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from managements.models import Activity, HealthDiary, HealthRecordRollup, StatsSnapshot, UserGoal
+
+logger = logging.getLogger(__name__)
+
+STATS_TTL = getattr(settings, 'MANAGEMENTS_STATS_TTL', 300)
+STATS_TOP_N = getattr(settings, 'MANAGEMENTS_STATS_TOP_N', 10)
+STATS_DEFAULT_DAYS = getattr(settings, 'MANAGEMENTS_STATS_DEFAULT_DAYS', 30)
+STATS_MAX_DAYS = getattr(settings, 'MANAGEMENTS_STATS_MAX_DAYS', 366)
+STATS_MAX_SNAPSHOTS = getattr(settings, 'MANAGEMENTS_STATS_MAX_SNAPSHOTS', 200)
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def default_range():
+    end = timezone.now().date()
+    return end - timedelta(days=STATS_DEFAULT_DAYS - 1), end
+
+
+def parse_range(start, end):
+    """
+    Khoảng thời gian từ hai chuỗi YYYY-MM-DD: thiếu hoặc sai thì dùng default_range, đảo lại nếu
+    from > to, và rút về STATS_MAX_DAYS ngày cuối nếu dài hơn.
+    """
+    default_start, default_end = default_range()
+    try:
+        start = parse_date(start or '') or default_start
+        end = parse_date(end or '') or default_end
+    except ValueError:
+        start, end = default_start, default_end
+    if start > end:
+        start, end = end, start
+    return max(start, end - timedelta(days=STATS_MAX_DAYS - 1)), end
+
+
+def snapshot_key(start, end, top):
+    return f'managements-stats:{start.isoformat()}:{end.isoformat()}:{top}'
+
+
+def compute_stats(start, end, top=STATS_TOP_N):
+    activity_stats = (Activity.objects.filter(active=True)
+                      .annotate(activity_count=Count('workoutplan', filter=Q(workoutplan__date__range=(start, end))))
+                      .filter(activity_count__gt=0)
+                      .values('name', 'activity_count')
+                      .order_by('-activity_count', 'name')[:top])
+
+    record_stats = {}
+    daily = (HealthRecordRollup.objects.filter(period='day', period_start__range=(start, end))
+             .values('period_start', 'metric')
+             .annotate(total=Sum('total'), count=Sum('count'), users=Count('user', distinct=True))
+             .order_by('period_start'))
+    for row in daily:
+        day = record_stats.setdefault(row['period_start'].isoformat(), {'date': row['period_start'].isoformat()})
+        day[row['metric']] = round(row['total'] / row['count'], 2) if row['count'] else None
+        day['users'] = max(day.get('users', 0), row['users'])
+
+    goal_stats = (UserGoal.objects.filter(active=True, created_date__range=(start, end))
+                  .values('goal_type')
+                  .annotate(goal_count=Count('id'))
+                  .order_by('-goal_count')[:top])
+
+    diary_stats = (HealthDiary.objects.filter(active=True, date__date__range=(start, end))
+                   .values('user__username')
+                   .annotate(diary_count=Count('id'))
+                   .order_by('-diary_count')[:top])
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'top': top,
+        'activity_count': Activity.objects.filter(active=True).count(),
+        'activity_stats': list(activity_stats),
+        'record_stats': list(record_stats.values()),
+        'goal_stats': list(goal_stats),
+        'diary_stats': list(diary_stats),
+    }
+
+
+def refresh_snapshot(start, end, top=STATS_TOP_N):
+    data = compute_stats(start, end, top)
+    snapshot, _ = StatsSnapshot.objects.update_or_create(
+        key=snapshot_key(start, end, top),
+        defaults={'data': data, 'generated_at': timezone.now()},
+    )
+    prune_snapshots()
+    return snapshot
+
+
+def prune_snapshots(keep=None):
+    """
+    Xoá các snapshot cũ nhất, chỉ giữ keep (mặc định STATS_MAX_SNAPSHOTS) snapshot được tính gần đây nhất.
+    """
+    keep = STATS_MAX_SNAPSHOTS if keep is None else keep
+    stale = StatsSnapshot.objects.order_by('-generated_at', '-id').values_list('id', flat=True)[keep:]
+    return StatsSnapshot.objects.filter(id__in=list(stale)).delete()[0]
+
+
+def _refresh_in_background(start, end, top):
+    key = snapshot_key(start, end, top)
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            refresh_snapshot(start, end, top)
+        except Exception:
+            logger.exception('Không thể tính lại thống kê %s', key)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+            close_old_connections()
+
+    threading.Thread(target=run, name=f'stats-refresh-{key}', daemon=True).start()
+
+
+def get_snapshot(start, end, top=STATS_TOP_N):
+    """
+    Trả về snapshot cho khoảng thời gian; tính ngay nếu chưa có, tính lại ở nền nếu đã hết hạn.
+    """
+    if (end - start).days >= STATS_MAX_DAYS:
+        raise ValueError(f'Khoảng thời gian tối đa {STATS_MAX_DAYS} ngày.')
+    snapshot = StatsSnapshot.objects.filter(key=snapshot_key(start, end, top)).first()
+    if snapshot is None:
+        return refresh_snapshot(start, end, top)
+    if snapshot.generated_at < timezone.now() - timedelta(seconds=STATS_TTL):
+        _refresh_in_background(start, end, top)
+    return snapshot
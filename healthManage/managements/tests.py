@@ -1,3 +1,1834 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from cloudinary import CloudinaryResource
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from managements import (access, anomalies, archive, benchmarks, export, httpcache, ingest, instrumentation, media,
+                         paginators, projection, rollups, search, stats, tokens, uploads)
+from managements.models import *
+from managements.serializers import UserSerializer
+from managements.realtime import TokenAuthMiddleware
+from managements.routing import websocket_urlpatterns
+from oauth2_provider.models import AccessToken, Application, RefreshToken
+from PIL import Image
+
+
+def make_user(username, role=Role.Exerciser_Self_Help, **kwargs):
+    return User.objects.create_user(username=username, email=f'{username}@example.com',
+                                    password='secret', role=role, **kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Đảm bảo số query của một endpoint không tăng theo số dòng trả về (không có N+1).
+    """
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, (url, getattr(response, 'data', None)))
+        return len(ctx.captured_queries)
+
+    def assertQueryCountFlat(self, client, url, seed, small=1, large=6):
+        """
+        seed(n) tạo thêm n dòng dữ liệu cho endpoint; số query ở hai cỡ dữ liệu phải bằng nhau.
+        """
+        seed(small)
+        small_count = self.count_queries(client, url)
+        seed(large - small)
+        large_count = self.count_queries(client, url)
+        self.assertEqual(small_count, large_count,
+                         f"{url}: {small_count} query với {small} dòng, {large_count} query với {large} dòng")
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.admin = make_user('admin', role=Role.Admin, is_staff=True)
+        self.coach = make_user('coach', role=Role.Coach)
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+        self.activities = [Activity.objects.create(name=f'Activity {i}', calories_burned=10 * i) for i in range(3)]
+
+    def seed_plans(self, n):
+        today = timezone.now().date()
+        for i in range(n):
+            plan = WorkoutPlan.objects.create(user=self.user, name=f'Plan {i}', date=today, sets=3, reps=10)
+            plan.activities.set(self.activities)
+
+    def seed_meal_plans(self, n):
+        for i in range(n):
+            MealPlan.objects.create(user=self.user, name=f'Meal {i}', date=timezone.now().date(), calories_intake=500)
+
+    def seed_records(self, n):
+        for i in range(n):
+            HealthRecord.objects.create(user=self.user, steps=1000 * i, height=170, weight=65)
+
+    def seed_diaries(self, n):
+        for i in range(n):
+            HealthDiary.objects.create(user=self.user, content=f'Diary {i}')
+
+    def seed_messages(self, n):
+        for i in range(n):
+            ChatMessage.objects.create(sender=self.user, receiver=self.coach, message=f'Hello {i}')
+
+    def seed_goals(self, n):
+        for i in range(n):
+            UserGoal.objects.create(user=self.user, goal_type='lose', target_weight=60 - i)
+
+    def seed_connections(self, n):
+        for i in range(n):
+            coach = make_user(f'coach{UserConnection.objects.count()}', role=Role.Coach)
+            UserConnection.objects.create(user=self.user, coach=coach, status='accepted')
+
+    def seed_users(self, n):
+        for i in range(n):
+            make_user(f'extra{User.objects.count()}')
+
+    def seed_tags(self, n):
+        for i in range(n):
+            Tag.objects.create(name=f'tag{Tag.objects.count()}')
+
+    def test_workout_plan_endpoints(self):
+        self.assertQueryCountFlat(self.client, '/workoutplan/', self.seed_plans)
+        self.assertQueryCountFlat(self.client, '/workoutplan/my-plans/', self.seed_plans)
+        self.assertQueryCountFlat(self.client, '/workoutplan/weekly-summary/', self.seed_plans)
+        self.assertQueryCountFlat(self.admin_client, f'/workoutplan/plans-by-user/{self.user.id}/', self.seed_plans)
+
+    def test_meal_plan_list(self):
+        self.assertQueryCountFlat(self.client, '/mealplan/', self.seed_meal_plans)
+
+    def test_health_record_list(self):
+        self.assertQueryCountFlat(self.client, '/healthrecord/', self.seed_records)
+        self.assertQueryCountFlat(self.admin_client, '/healthrecord/', self.seed_records)
+
+    def test_health_diary_list(self):
+        self.assertQueryCountFlat(self.client, '/healthdiary/', self.seed_diaries)
+
+    def test_chat_message_list(self):
+        self.assertQueryCountFlat(self.client, '/chatmessage/', self.seed_messages)
+
+    def test_goal_list(self):
+        self.assertQueryCountFlat(self.client, '/goal/', self.seed_goals)
+
+    def test_connection_list(self):
+        self.assertQueryCountFlat(self.client, '/connection/', self.seed_connections)
+
+    def test_user_and_catalog_lists(self):
+        self.assertQueryCountFlat(self.admin_client, '/users/all-users/', self.seed_users)
+        self.assertQueryCountFlat(self.client, '/tag/', self.seed_tags)
+        self.assertQueryCountFlat(APIClient(), '/activity/', self.seed_activities)
+
+    def seed_activities(self, n):
+        with self.captureOnCommitCallbacks(execute=True):
+            start = Activity.objects.count()
+            for i in range(start, start + n):
+                Activity.objects.create(name=f'Extra {i}')
+
+
+class WorkoutSummaryTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.today = timezone.now().date()
+        run = Activity.objects.create(name='Run', calories_burned=300)
+        push = Activity.objects.create(name='Push up', calories_burned=50)
+        plan = WorkoutPlan.objects.create(user=self.user, name='A', date=self.today, sets=3, reps=10)
+        plan.activities.set([run, push])
+        plan = WorkoutPlan.objects.create(user=self.user, name='B', date=self.today, sets=2, reps=5)
+        plan.activities.set([run])
+        WorkoutPlan.objects.create(user=self.user, name='Rest', date=self.today, sets=4, reps=4)
+
+    def test_summary_totals(self):
+        response = self.client.get('/workoutplan/weekly-summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_sessions'], 3)
+        self.assertEqual(response.data['estimated_total_exercise_units'], 3 * 10 * 2 + 2 * 5 * 1)
+        self.assertEqual(response.data['estimated_total_calories'], (300 + 50) * 3 + 300 * 2)
+        balance = self.client.get(f'/energy-balance/?from={self.today}&to={self.today}').data['days'][0]
+        self.assertEqual(balance['burned'], response.data['estimated_total_calories'])
+        self.assertEqual(len(response.data['plans']), 3)
+
+    def test_summary_ranges(self):
+        for window in ['month', 'quarter', 'year']:
+            response = self.client.get(f'/workoutplan/weekly-summary/?range={window}')
+            self.assertEqual(response.data['total_sessions'], 3, window)
+        day = self.today.isoformat()
+        response = self.client.get(f'/workoutplan/weekly-summary/?from={day}&to={day}')
+        self.assertEqual(response.data['total_sessions'], 3)
+        self.assertEqual(self.client.get('/workoutplan/weekly-summary/?range=decade').status_code, 400)
+        self.assertEqual(self.client.get('/workoutplan/weekly-summary/?from=2025-02-01').status_code, 400)
+
+    def test_summary_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/workoutplan/weekly-summary/?range=quarter')
+        before = len(ctx.captured_queries)
+        for i in range(10):
+            plan = WorkoutPlan.objects.create(user=self.user, name=f'More {i}', date=self.today, sets=1, reps=1)
+            plan.activities.set(Activity.objects.all())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/workoutplan/weekly-summary/?range=quarter')
+        self.assertEqual(response.data['total_sessions'], 13)
+        self.assertEqual(len(ctx.captured_queries), before)
+
+
+class HealthRecordRollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def rollup(self, period, metric):
+        return HealthRecordRollup.objects.get(user=self.user, period=period, metric=metric)
+
+    def test_save_updates_all_periods(self):
+        HealthRecord.objects.create(user=self.user, steps=1000, heart_rate=70, height=170, weight=65)
+        record = HealthRecord.objects.create(user=self.user, steps=3000, heart_rate=90)
+        for period in ['day', 'week', 'month']:
+            steps = self.rollup(period, 'steps')
+            self.assertEqual((steps.count, steps.total, steps.minimum, steps.maximum), (2, 4000, 1000, 3000))
+            self.assertEqual(steps.average, 2000)
+            self.assertEqual(self.rollup(period, 'bmi').count, 1)
+
+        record.steps = 5000
+        record.save()
+        self.assertEqual(self.rollup('month', 'steps').maximum, 5000)
+
+        record.delete()
+        self.assertEqual(self.rollup('week', 'steps').total, 1000)
+        self.assertEqual(self.rollup('day', 'heart_rate').count, 1)
+
+    def test_bulk_create_updates_rollups(self):
+        HealthRecord.objects.bulk_create([HealthRecord(user=self.user, steps=i) for i in range(1, 11)])
+        self.assertEqual(self.rollup('day', 'steps').total, 55)
+        self.assertEqual(self.rollup('month', 'steps').count, 10)
+
+    def test_trends_reads_only_rollups(self):
+        for steps in [100, 200, 300]:
+            HealthRecord.objects.create(user=self.user, steps=steps, water_intake=1.5)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/healthrecord/trends/?period=week&metrics=steps,water_intake')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('managements_healthrecordrollup', ctx.captured_queries[0]['sql'])
+        point = response.data['metrics']['steps'][0]
+        self.assertEqual((point['count'], point['sum'], point['avg'], point['min'], point['max']),
+                         (3, 600, 200, 100, 300))
+        self.assertEqual(response.data['metrics']['water_intake'][0]['sum'], 4.5)
+        self.assertEqual(self.client.get('/healthrecord/trends/?period=year').status_code, 400)
+        self.assertEqual(self.client.get('/healthrecord/trends/?metrics=password').status_code, 400)
+        self.assertEqual(self.client.get('/healthrecord/trends/?from=2020-13-01').status_code, 400)
+
+    def test_rebuild_command(self):
+        HealthRecord.objects.create(user=self.user, steps=100)
+        HealthRecordRollup.objects.all().delete()
+        call_command('rebuild_health_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup('month', 'steps').total, 100)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.coach = make_user('coach', role=Role.Coach)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        HealthRecord.objects.bulk_create([HealthRecord(user=self.user, steps=i) for i in range(25)])
+
+    def collect(self, url):
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_health_records_walk_all_pages(self):
+        ids = self.collect('/healthrecord/?paginate=cursor&page_size=7')
+        expected = list(HealthRecord.objects.order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_chat_messages_walk_all_pages(self):
+        for i in range(9):
+            ChatMessage.objects.create(sender=self.user, receiver=self.coach, message=f'Hi {i}')
+        ids = self.collect('/chatmessage/?paginate=cursor&page_size=4')
+        self.assertEqual(ids, list(ChatMessage.objects.order_by('-timestamp', '-id').values_list('id', flat=True)))
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/healthrecord/?paginate=cursor&page_size=100000')
+        self.assertEqual(len(response.data['results']), 25)
+        self.assertEqual(paginators.KeysetPagination().max_page_size, 500)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get('/healthrecord/')
+        self.assertEqual(response.data['count'], 25)
+
+
+class OwnedCreateTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.coach = make_user('coach', role=Role.Coach)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_create_sets_owner_from_request(self):
+        today = timezone.now().date().isoformat()
+        cases = [('/workoutplan/', {'name': 'A', 'date': today, 'sets': 3, 'reps': 10}, WorkoutPlan, 'user'),
+                 ('/mealplan/', {'name': 'B', 'date': today, 'calories_intake': 500}, MealPlan, 'user'),
+                 ('/chatmessage/', {'receiver': self.coach.id, 'message': 'Chào'}, ChatMessage, 'sender'),
+                 ('/connection/', {'coach': self.coach.id}, UserConnection, 'user')]
+        for url, data, model, owner in cases:
+            response = self.client.post(url, {**data, 'user': self.coach.id, 'sender': self.coach.id}, format='json')
+            self.assertEqual(response.status_code, 201, (url, response.data))
+            self.assertEqual(getattr(model.objects.get(pk=response.data['id']), f'{owner}_id'), self.user.id)
+
+        self.assertEqual(ChatMessage.objects.get().receiver, self.coach)
+        self.assertEqual(self.client.post('/chatmessage/', {'message': 'Chào'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/connection/', {'coach': 0}, format='json').status_code, 400)
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_creates_valid_readings_and_reports_errors(self):
+        response = self.client.post('/healthrecord/bulk/', {"records": [
+            {"steps": 1200, "heart_rate": 72},
+            {"steps": -5},
+            {"height": 170, "weight": 65},
+            {},
+            {"height": 0, "weight": 65},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 2))
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'error', 'created', 'error', 'created'])
+        self.assertIn('steps', response.data['results'][1]['errors'])
+
+        records = HealthRecord.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[1].bmi, round(65 / 1.7 ** 2, 2))
+        self.assertIsNone(records[2].bmi)
+        self.assertEqual(HealthRecordRollup.objects.get(user=self.user, period='day', metric='steps').total, 1200)
+
+    def test_bulk_keeps_reading_timestamps(self):
+        measured = timezone.now().replace(microsecond=0) - timedelta(days=2)
+        future = timezone.now() + timedelta(days=1)
+        response = self.client.post('/healthrecord/bulk/', [
+            {"steps": 800, "date": measured.isoformat()},
+            {"steps": 900, "date": future.isoformat()},
+            {"steps": 1000, "date": "hôm qua"},
+            {"date": measured.isoformat()},
+        ], format='json')
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'error', 'error', 'error'])
+        self.assertNotIn('id', response.data['results'][0])
+        self.assertIn('date', response.data['results'][1]['errors'])
+        self.assertEqual(HealthRecord.objects.get(user=self.user).date, measured)
+        rollup = HealthRecordRollup.objects.get(user=self.user, period='day', metric='steps')
+        self.assertEqual(rollup.period_start, timezone.localtime(measured).date())
+
+    def test_bulk_rejects_bad_payloads(self):
+        self.assertEqual(self.client.post('/healthrecord/bulk/', {"records": []}, format='json').status_code, 400)
+        too_many = [{"steps": 1}] * (ingest.BULK_MAX_RECORDS + 1)
+        self.assertEqual(self.client.post('/healthrecord/bulk/', too_many, format='json').status_code, 400)
+        self.assertFalse(HealthRecord.objects.exists())
+
+    def test_compute_bmi_matches_model(self):
+        weights, heights = [65, None, 80.5, 70], [170, 180, 0, 175.3]
+        expected = []
+        for weight, height in zip(weights, heights):
+            record = HealthRecord.objects.create(user=self.user, weight=weight, height=height)
+            expected.append(record.bmi)
+        self.assertEqual(ingest.compute_bmi(weights, heights), expected)
+
+
+class ChatRealtimeTests(TransactionTestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.coach = make_user('coach', role=Role.Coach)
+        self.other = make_user('other')
+        for user in [self.user, self.coach, self.other]:
+            AccessToken.objects.create(user=user, token=f'token-{user.username}', scope='read write',
+                                       expires=timezone.now() + timedelta(hours=1))
+        self.application = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(self.application, path)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_saved_message_is_pushed_to_both_sides(self):
+        async def run():
+            member = await self.connect('/ws/chat/?token=token-member')
+            coach = await self.connect(f'/ws/chat/{self.user.id}/?token=token-coach')
+            other = await self.connect('/ws/chat/?token=token-other')
+
+            client = APIClient()
+            client.force_authenticate(self.user)
+            response = await database_sync_to_async(client.post)(
+                '/chatmessage/send-message/', {'receiver_id': self.coach.id, 'message': 'Xin chào'}, format='json')
+            self.assertEqual(response.status_code, 201)
+
+            for communicator in [member, coach]:
+                pushed = await communicator.receive_json_from()
+                self.assertEqual(pushed['message'], 'Xin chào')
+            self.assertTrue(await other.receive_nothing())
+
+            await coach.send_json_to({'message': 'Chào bạn'})
+            reply = await member.receive_json_from()
+            self.assertEqual(reply['message'], 'Chào bạn')
+            for communicator in [member, coach, other]:
+                await communicator.disconnect()
+
+        async_to_sync(run)()
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+    def test_invalid_receiver_id_returns_error(self):
+        async def run():
+            member = await self.connect('/ws/chat/?token=token-member')
+            for receiver_id in ['abc', [self.coach.id], {'id': self.coach.id}]:
+                await member.send_json_to({'receiver_id': receiver_id, 'message': 'Xin chào'})
+                self.assertEqual(await member.receive_json_from(), {"error": "receiver_id phải là số nguyên."})
+            # Kết nối vẫn mở sau lỗi: gửi lại với receiver_id hợp lệ dạng chuỗi
+            await member.send_json_to({'receiver_id': str(self.coach.id), 'message': 'Xin chào'})
+            self.assertEqual((await member.receive_json_from())['message'], 'Xin chào')
+            await member.disconnect()
+
+        async_to_sync(run)()
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    def test_rejects_missing_or_invalid_token(self):
+        async def run():
+            for path in ['/ws/chat/', '/ws/chat/?token=wrong']:
+                communicator = WebsocketCommunicator(self.application, path)
+                connected, _ = await communicator.connect()
+                self.assertFalse(connected)
+
+        async_to_sync(run)()
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.coach = make_user('coach', role=Role.Coach)
+        self.friend = make_user('friend')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, sender, receiver, text):
+        return ChatMessage.objects.create(sender=sender, receiver=receiver, message=text)
+
+    def test_conversations_list_last_message_and_unread(self):
+        self.send(self.coach, self.user, 'c1')
+        self.send(self.user, self.coach, 'c2')
+        self.send(self.coach, self.user, 'c3')
+        self.send(self.friend, self.user, 'f1')
+        self.send(self.friend, self.coach, 'not mine')
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/chatmessage/conversations/?expand=user,last_message.sender')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+        threads = {t['user']['username']: t for t in response.data['results']}
+        self.assertEqual(threads['coach']['last_message']['sender']['username'], 'coach')
+        self.assertEqual(threads['coach']['last_message']['receiver'], self.user.id)
+        self.assertEqual(set(threads), {'coach', 'friend'})
+        self.assertEqual(threads['coach']['last_message']['message'], 'c3')
+        self.assertEqual(threads['coach']['unread_count'], 2)
+        self.assertEqual(threads['friend']['unread_count'], 1)
+        self.assertEqual(response.data['results'][0]['user']['username'], 'friend')
+
+    def test_mark_read_updates_one_conversation(self):
+        self.send(self.coach, self.user, 'c1')
+        self.send(self.coach, self.user, 'c2')
+        self.send(self.friend, self.user, 'f1')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/chatmessage/mark-read/', {'user_id': self.coach.id}, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(ChatMessage.objects.filter(is_read=False).count(), 1)
+        self.assertEqual(self.client.post('/chatmessage/mark-read/', {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/chatmessage/mark-read/', {'user_id': 'abc'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/chatmessage/mark-read/', {'user_id': [1]}, format='json').status_code, 400)
+
+    def test_list_is_scoped_to_requester(self):
+        self.send(self.user, self.coach, 'mine')
+        self.send(self.friend, self.coach, 'not mine')
+        response = self.client.get('/chatmessage/')
+        self.assertEqual(response.data['count'], 1)
+
+
+class AdminStatsTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin', role=Role.Admin, is_staff=True)
+        self.user = make_user('member')
+        today = timezone.now().date()
+        for i in range(3):
+            activity = Activity.objects.create(name=f'Activity {i}')
+            for _ in range(i + 1):
+                plan = WorkoutPlan.objects.create(user=self.user, name='Plan', date=today)
+                plan.activities.add(activity)
+        HealthRecord.objects.create(user=self.user, steps=1000)
+        HealthRecord.objects.create(user=self.admin, steps=3000)
+        self.client.force_login(self.admin)
+
+    def test_page_renders_from_snapshot(self):
+        response = self.client.get('/admin/managements-stats/?top=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a['name'] for a in response.context['activity_stats']], ['Activity 2', 'Activity 1'])
+        self.assertEqual(response.context['record_stats'][0]['steps'], 2000)
+        self.assertEqual(response.context['record_stats'][0]['users'], 2)
+        self.assertEqual(StatsSnapshot.objects.count(), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/admin/managements-stats/?top=2')
+        self.assertFalse(any('managements_workoutplan' in q['sql'] for q in ctx.captured_queries))
+
+    def test_stale_snapshot_is_refreshed_in_background(self):
+        start, end = stats.default_range()
+        snapshot = stats.refresh_snapshot(start, end)
+        StatsSnapshot.objects.filter(pk=snapshot.pk).update(
+            generated_at=timezone.now() - timedelta(seconds=stats.STATS_TTL + 1))
+        with mock.patch.object(stats, '_refresh_in_background') as refresh:
+            response = self.client.get('/admin/managements-stats/')
+        self.assertEqual(response.status_code, 200)
+        refresh.assert_called_once_with(start, end, stats.STATS_TOP_N)
+
+    def test_range_is_capped_and_snapshots_pruned(self):
+        today = timezone.now().date()
+        response = self.client.get('/admin/managements-stats/?from=2000-01-01&to=2000-13-01')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['start'], stats.default_range()[0].isoformat())
+        response = self.client.get(f'/admin/managements-stats/?from=2000-01-01&to={today}')
+        self.assertEqual(response.context['start'], (today - timedelta(days=stats.STATS_MAX_DAYS - 1)).isoformat())
+        with self.assertRaises(ValueError):
+            stats.get_snapshot(today - timedelta(days=stats.STATS_MAX_DAYS), today)
+
+        with mock.patch.object(stats, 'STATS_MAX_SNAPSHOTS', 2):
+            for top in range(1, 5):
+                stats.refresh_snapshot(today, today, top)
+        self.assertEqual(StatsSnapshot.objects.count(), 2)
+        self.assertEqual(stats.prune_snapshots(keep=1), 1)
+        self.assertTrue(StatsSnapshot.objects.filter(key=stats.snapshot_key(today, today, 4)).exists())
+
+    def test_requires_staff_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/admin/managements-stats/').status_code, 302)
+
+    def test_refresh_command(self):
+        call_command('refresh_admin_stats', '--top', '1', stdout=StringIO())
+        self.assertEqual(len(StatsSnapshot.objects.get().data['activity_stats']), 1)
+
+
+class ActivitySearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.squat = Activity.objects.create(name='Squat', description='<p>Bài tập <b>chân</b> cơ bản</p>')
+        self.run = Activity.objects.create(name='Chạy bộ', description='<p>Cardio ngoài trời, tốt cho chân</p>')
+        self.jump = Activity.objects.create(name='Nhảy dây', description='Cardio tại nhà')
+
+    def names(self, q):
+        response = self.client.get('/activity/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [a['name'] for a in response.data['results']]
+
+    def test_tokens_are_normalized_and_html_stripped(self):
+        tokens = set(ActivitySearchToken.objects.filter(activity=self.squat).values_list('token', flat=True))
+        self.assertEqual(tokens, {'squat', 'bai', 'tap', 'chan', 'co', 'ban'})
+        self.assertEqual(search.tokenize('Đạp xe <i>30</i> phút'), ['dap', 'xe', '30', 'phut'])
+
+    def test_ranked_results(self):
+        self.assertEqual(self.names('chân'), ['Chạy bộ', 'Squat'])
+        self.assertEqual(self.names('squat chân'), ['Squat'])
+        self.assertEqual(self.names('CHAY'), ['Chạy bộ'])
+        self.assertEqual(self.names('cardio chân'), ['Chạy bộ'])
+        self.assertEqual(self.names('xyz'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(name='Chân trụ', description='Giữ thăng bằng')
+        self.assertEqual(self.names('chân')[0], 'Chân trụ')
+
+    def test_prefix_matching_and_suggest(self):
+        self.assertEqual(self.names('car'), ['Nhảy dây', 'Chạy bộ'])
+        response = self.client.get('/activity/suggest/', {'q': 'nha'})
+        self.assertEqual(response.data, [{'id': self.jump.id, 'name': 'Nhảy dây'}])
+
+    def test_index_follows_updates(self):
+        self.squat.name = 'Deadlift'
+        self.squat.save()
+        self.assertEqual(self.names('squat'), [])
+        self.assertEqual(self.names('deadlift'), ['Deadlift'])
+        ActivitySearchToken.objects.all().delete()
+        call_command('rebuild_activity_search_index', stdout=StringIO())
+        self.assertEqual(self.names('deadlift'), ['Deadlift'])
+
+
+class CoachAccessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coach = make_user('coach', role=Role.Coach)
+        self.client_user = make_user('client')
+        self.stranger = make_user('stranger')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.connection = UserConnection.objects.create(user=self.client_user, coach=self.coach, status='accepted')
+        UserConnection.objects.create(user=self.stranger, coach=self.coach, status='pending')
+        for user in [self.coach, self.client_user, self.stranger]:
+            HealthRecord.objects.create(user=user, steps=100)
+            HealthDiary.objects.create(user=user, content='...')
+            WorkoutPlan.objects.create(user=user, name='Plan', date=timezone.now().date())
+            MealPlan.objects.create(user=user, name='Meal', date=timezone.now().date())
+        self.api = APIClient()
+        self.api.force_authenticate(self.coach)
+
+    def owners(self, url):
+        response = self.api.get(url + ('&' if '?' in url else '?') + 'expand=user')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        return {item['user']['username'] for item in results}
+
+    def test_only_the_client_accepts_a_connection(self):
+        pending = UserConnection.objects.get(user=self.stranger)
+        url = f'/connection/{pending.id}/'
+        self.assertEqual(self.api.patch(url, {'status': 'accepted'}, format='json').status_code, 403)
+        third = APIClient()
+        third.force_authenticate(self.client_user)
+        self.assertEqual(third.patch(url, {'status': 'accepted'}, format='json').status_code, 404)
+        self.assertEqual({c['id'] for c in third.get('/connection/').data['results']}, {self.connection.id})
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'pending')
+        self.assertEqual(self.owners('/healthrecord/?paginate=cursor'), {'coach', 'client'})
+
+        owner = APIClient()
+        owner.force_authenticate(self.stranger)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(owner.patch(url, {'status': 'accepted'}, format='json').status_code, 200)
+        self.assertEqual(self.owners('/healthrecord/?paginate=cursor'), {'coach', 'client', 'stranger'})
+
+    def test_coach_reads_accepted_clients_only(self):
+        for url in ['/healthrecord/?paginate=cursor', '/healthdiary/', '/workoutplan/', '/mealplan/']:
+            self.assertEqual(self.owners(url), {'coach', 'client'}, url)
+        self.assertEqual(self.api.get(f'/workoutplan/plans-by-user/{self.client_user.id}/').status_code, 200)
+        self.assertEqual(self.api.get(f'/workoutplan/plans-by-user/{self.stranger.id}/').status_code, 403)
+        self.assertEqual(self.api.get(f'/healthrecord/trends/?user_id={self.client_user.id}').status_code, 200)
+        self.assertEqual(self.api.get(f'/healthrecord/trends/?user_id={self.stranger.id}').status_code, 403)
+        self.assertEqual(self.api.get('/healthrecord/trends/?user_id=abc').status_code, 403)
+
+    def test_client_ids_are_cached(self):
+        access.get_client_ids(self.coach.id)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(access.get_client_ids(self.coach.id), {self.client_user.id})
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_status_change_invalidates_cache(self):
+        self.assertEqual(access.get_client_ids(self.coach.id), {self.client_user.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.connection.status = 'blocked'
+            self.connection.save()
+        self.assertEqual(access.get_client_ids(self.coach.id), set())
+        self.assertEqual(self.owners('/healthdiary/'), {'coach'})
+
+        pending = UserConnection.objects.get(user=self.stranger)
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.status = 'accepted'
+            pending.save()
+        self.assertEqual(access.get_client_ids(self.coach.id), {self.stranger.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.delete()
+        self.assertEqual(access.get_client_ids(self.coach.id), set())
+
+    def test_admin_role_without_staff_flag_reads_everyone(self):
+        admin = make_user('admin', role=Role.Admin)
+        self.api.force_authenticate(admin)
+        response = self.api.get(f'/workoutplan/plans-by-user/{self.stranger.id}/')
+        self.assertEqual((response.status_code, len(response.data)), (200, 1))
+        self.assertEqual(self.api.get(f'/healthrecord/trends/?user_id={self.stranger.id}').status_code, 200)
+        self.assertEqual(self.owners('/healthrecord/?paginate=cursor'), {'coach', 'client', 'stranger'})
+
+    def test_regular_user_sees_only_own_data(self):
+        self.api.force_authenticate(self.client_user)
+        self.assertEqual(self.owners('/workoutplan/'), {'client'})
+        self.assertEqual(self.api.get(f'/healthrecord/trends/?user_id={self.coach.id}').status_code, 403)
+
+
+class StoredMediaUrlTests(TestCase):
+    def test_urls_are_stored_on_save(self):
+        user = make_user('member', avatar='image/upload/v1712/avatar/member.jpg')
+        self.assertIn('avatar/member', user.avatar_url)
+        self.assertIn('c_fill', user.avatar_thumbnail_url)
+        activity = Activity.objects.create(name='Squat', image='image/upload/v1/activity/squat.png')
+        stored = Activity.objects.get(pk=activity.pk)
+        self.assertEqual(stored.image_url, stored.image.url)
+
+        user.avatar = ''
+        user.save()
+        self.assertEqual((user.avatar_url, user.avatar_thumbnail_url), ('', ''))
+
+    def test_urls_are_stored_after_upload(self):
+        user = make_user('member')
+        uploaded = CloudinaryResource('avatar/new', format='jpg', version='99', type='upload', resource_type='image')
+        with mock.patch('cloudinary.uploader.upload_resource', return_value=uploaded):
+            user.avatar = SimpleUploadedFile('a.jpg', b'jpeg', content_type='image/jpeg')
+            user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).avatar_url, uploaded.url)
+
+    def test_serializers_read_stored_strings(self):
+        user = make_user('member', avatar='image/upload/v1712/avatar/member.jpg')
+        user = User.objects.get(pk=user.pk)
+        with mock.patch.object(media, '_build_url', side_effect=AssertionError('URL phải được đọc từ cột đã lưu')):
+            data = UserSerializer(user).data
+        self.assertEqual(data['avatar_url'], user.avatar_url)
+        self.assertEqual(data['avatar_thumbnail_url'], user.avatar_thumbnail_url)
+
+    def test_legacy_rows_fall_back_to_memoized_urls(self):
+        user = make_user('member', avatar='image/upload/v1712/avatar/member.jpg')
+        User.objects.filter(pk=user.pk).update(avatar_url='', avatar_thumbnail_url='')
+        user = User.objects.get(pk=user.pk)
+        media._build_url.cache_clear()
+        first = UserSerializer(user).data['avatar_url']
+        self.assertEqual(first, user.avatar.url)
+        UserSerializer(user).data
+        self.assertEqual(media._build_url.cache_info().hits, 2)
+
+        call_command('resolve_media_urls', stdout=StringIO())
+        self.assertEqual(User.objects.get(pk=user.pk).avatar_url, first)
+
+
+def make_image(name='photo.png', size=(2400, 1600), mode='RGB', image_format='PNG'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, format=image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class MediaUploadPipelineTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        settings_patch = override_settings(MEDIA_STAGING_DIR=f'{self.tmp}/staging',
+                                           MEDIA_LOCAL_STORE_DIR=f'{self.tmp}/store',
+                                           MEDIA_REMOTE_STORE='managements.uploads.LocalFileStore')
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        workers_patch = mock.patch.object(uploads, 'UPLOAD_WORKERS', 0)
+        workers_patch.start()
+        self.addCleanup(workers_patch.stop)
+        self.client = APIClient()
+
+    def test_update_info_acknowledges_before_upload(self):
+        user = make_user('member')
+        self.client.force_authenticate(user)
+        with mock.patch('cloudinary.uploader.upload_resource', side_effect=AssertionError('Không tải lên trong request')):
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.patch('/users/update-info/', {'avatar': make_image()}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        job = MediaUpload.objects.get()
+        self.assertEqual((job.object_id, job.field, job.status), (user.pk, 'avatar', 'pending'))
+        self.assertEqual(User.objects.get(pk=user.pk).avatar_url, '')
+
+        for callback in callbacks:
+            callback()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        user = User.objects.get(pk=user.pk)
+        self.assertTrue(user.avatar_url.startswith('/media/avatar/'))
+        self.assertTrue(user.avatar_url.endswith('.jpg'))
+        with Image.open(f'{self.tmp}/store/{user.avatar.public_id}.jpg') as stored:
+            self.assertEqual(max(stored.size), uploads.MAX_DIMENSION)
+        with Image.open(f'{self.tmp}/store/{user.avatar.public_id}_thumb.jpg') as thumbnail:
+            self.assertEqual(thumbnail.size, (200, 200))
+
+    def test_activity_image_keeps_transparency(self):
+        admin = make_user('admin', role=Role.Admin)
+        self.client.force_authenticate(admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/activity/', {'name': 'Plank', 'image': make_image(mode='RGBA', size=(64, 64))},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 201)
+        activity = Activity.objects.get(pk=response.data['id'])
+        self.assertTrue(activity.image_url.endswith('.png'))
+        self.assertEqual(self.client.get(f'/activity/{activity.pk}/').data['image_url'], activity.image_url)
+
+    def test_failed_upload_is_retried_by_command(self):
+        user = make_user('member')
+        job = uploads.enqueue_upload(user, 'avatar', SimpleUploadedFile('broken.png', b'not an image'))
+        with self.assertLogs('managements.uploads', 'ERROR'):
+            uploads.process_upload(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(User.objects.get(pk=user.pk).avatar_url, '')
+
+        with open(job.staged_path, 'wb') as f:
+            f.write(make_image().read())
+        call_command('process_media_uploads', '--retry-failed', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertNotEqual(User.objects.get(pk=user.pk).avatar_url, '')
+
+    def test_newer_upload_wins(self):
+        user = make_user('member')
+        first = uploads.enqueue_upload(user, 'avatar', make_image('first.png'))
+        second = uploads.enqueue_upload(user, 'avatar', make_image('second.png'))
+        uploads.process_upload(second.pk)
+        expected = User.objects.get(pk=user.pk).avatar_url
+        uploads.process_upload(first.pk)
+        self.assertEqual(User.objects.get(pk=user.pk).avatar_url, expected)
+
+
+class ActivityCatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.activity = Activity.objects.create(name='Squat', calories_burned=80)
+
+    def test_list_and_detail_are_served_from_cache(self):
+        first = self.client.get('/activity/')
+        self.assertEqual(first.status_code, 200)
+        self.client.get(f'/activity/{self.activity.pk}/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/activity/')
+            detail = self.client.get(f'/activity/{self.activity.pk}/')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('Last-Modified', second)
+        self.assertEqual(detail.data['name'], 'Squat')
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/activity/')['ETag']
+        response = self.client.get('/activity/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/activity/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_writes_invalidate_cached_responses(self):
+        coach = make_user('coach', role=Role.Coach)
+        etag = self.client.get('/activity/')['ETag']
+        self.client.get(f'/activity/{self.activity.pk}/')
+
+        writer = APIClient()
+        writer.force_authenticate(coach)
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.patch(f'/activity/{self.activity.pk}/', {'name': 'Front squat'}, format='json')
+        self.assertEqual(self.client.get(f'/activity/{self.activity.pk}/').data['name'], 'Front squat')
+        response = self.client.get('/activity/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            writer.delete(f'/activity/{self.activity.pk}/')
+        self.assertEqual(self.client.get(f'/activity/{self.activity.pk}/').status_code, 404)
+        self.assertEqual(self.client.get('/activity/').data['count'], 0)
+
+
+class SparseFieldsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.activity = Activity.objects.create(name='Squat', description='<p>Mô tả dài</p>', calories_burned=80)
+        self.plan = WorkoutPlan.objects.create(user=self.user, name='Chân', date=timezone.now().date(), sets=3, reps=10)
+        self.plan.activities.add(self.activity)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data, ' '.join(q['sql'] for q in ctx.captured_queries)
+
+    def test_relations_default_to_ids(self):
+        data, sql = self.get('/workoutplan/')
+        plan = data['results'][0]
+        self.assertEqual(plan['user'], self.user.id)
+        self.assertEqual(plan['activities'], [self.activity.id])
+        self.assertNotIn('"managements_user"."email"', sql)
+        self.assertNotIn('"managements_activity"."description"', sql)
+
+    def test_fields_limit_columns(self):
+        data, sql = self.get('/workoutplan/?fields=id,name')
+        self.assertEqual(data['results'], [{'id': self.plan.id, 'name': 'Chân'}])
+        self.assertNotIn('"managements_workoutplan"."description"', sql)
+        self.assertNotIn('managements_workoutplan_activities', sql)
+
+    def test_expand_nests_requested_fields(self):
+        data, sql = self.get('/workoutplan/?expand=user,activities&fields=id,user.username,activities.name')
+        self.assertEqual(data['results'], [{
+            'id': self.plan.id,
+            'user': {'username': 'member'},
+            'activities': [{'name': 'Squat'}],
+        }])
+        self.assertIn('"managements_user"."username"', sql)
+        self.assertNotIn('"managements_user"."email"', sql)
+        self.assertNotIn('"managements_activity"."description"', sql)
+
+        data, _ = self.get('/workoutplan/my-plans/?expand=activities')
+        self.assertEqual(data[0]['activities'][0]['calories_burned'], 80)
+
+    def test_expanded_lists_stay_flat(self):
+        def seed(n):
+            for i in range(n):
+                plan = WorkoutPlan.objects.create(user=self.user, name=f'Plan {i}', date=timezone.now().date())
+                plan.activities.add(self.activity)
+                HealthRecord.objects.create(user=self.user, steps=i)
+        self.assertQueryCountFlat(self.client, '/workoutplan/?expand=user,activities', seed)
+        self.assertQueryCountFlat(self.client, '/healthrecord/?paginate=cursor&fields=id,steps&expand=user', seed)
+
+
+class AccessTokenCacheTests(TestCase):
+    def setUp(self):
+        tokens.token_cache.clear()
+        self.user = make_user('member')
+        self.app = Application.objects.create(name='mobile', client_type=Application.CLIENT_CONFIDENTIAL,
+                                              authorization_grant_type=Application.GRANT_PASSWORD)
+        self.token = AccessToken.objects.create(user=self.user, token='token-member', scope='read write',
+                                                expires=timezone.now() + timedelta(hours=1))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer token-member')
+
+    def token_queries(self, url='/users/current/'):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [q['sql'] for q in ctx.captured_queries if 'oauth2_provider_accesstoken' in q['sql']]
+
+    def test_second_request_skips_token_lookup(self):
+        response, queries = self.token_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.token_queries()
+        self.assertEqual(response.data['username'], 'member')
+        self.assertEqual(queries, [])
+
+    def test_revoke_and_user_changes_invalidate(self):
+        self.client.get('/users/current/')
+        self.user.role = Role.Coach
+        self.user.save()
+        self.assertEqual(self.client.get('/users/current/').data['role'], Role.Coach)
+
+        AccessToken.objects.get(pk=self.token.pk).revoke()
+        self.assertEqual(self.client.get('/users/current/').status_code, 401)
+
+    def test_refresh_revokes_cached_access_token(self):
+        refresh = RefreshToken.objects.create(user=self.user, token='refresh-member', access_token=self.token,
+                                              application=self.app)
+        self.client.get('/users/current/')
+        refresh.revoke()
+        self.assertEqual(self.client.get('/users/current/').status_code, 401)
+
+    def test_cache_is_bounded_lru_with_ttl(self):
+        cache = tokens.TokenCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        with mock.patch('managements.tokens.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 1)
+
+    def test_purge_expired_tokens_in_chunks(self):
+        past = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            AccessToken.objects.create(user=self.user, token=f'expired-{i}', expires=past)
+        kept = AccessToken.objects.create(user=self.user, token='expired-refreshable', expires=past)
+        RefreshToken.objects.create(user=self.user, token='refresh-live', access_token=kept, application=self.app)
+        RefreshToken.objects.create(user=self.user, token='refresh-revoked', revoked=past, application=self.app)
+
+        out = StringIO()
+        call_command('purge_expired_tokens', '--chunk-size', '2', stdout=out)
+        self.assertIn('5 access token', out.getvalue())
+        self.assertEqual(set(AccessToken.objects.values_list('token', flat=True)), {'token-member', 'expired-refreshable'})
+        self.assertEqual(list(RefreshToken.objects.values_list('token', flat=True)), ['refresh-live'])
+
+
+class HealthExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('member')
+        self.coach = make_user('coach', role=Role.Coach)
+        UserConnection.objects.create(user=self.user, coach=self.coach, status='accepted')
+        for i in range(5):
+            HealthRecord.objects.create(user=self.user, steps=1000 + i, heart_rate=70)
+        HealthDiary.objects.create(user=self.user, content='<p>Mệt, "khá" ổn</p>', feeling='ok')
+        activity = Activity.objects.create(name='Squat')
+        plan = WorkoutPlan.objects.create(user=self.user, name='Chân', date=timezone.now().date(), sets=3, reps=10)
+        plan.activities.add(activity)
+        self.activity = activity
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, url, client=None):
+        response = (client or self.client).get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_streams_in_chunks(self):
+        with mock.patch.object(export, 'EXPORT_CHUNK_SIZE', 2):
+            with CaptureQueriesContext(connection) as ctx:
+                body = self.download('/users/export/?types=healthrecord,healthdiary,workoutplan')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([r['type'] for r in rows], ['healthrecord'] * 5 + ['healthdiary', 'workoutplan'])
+        self.assertEqual(rows[-2]['content'], '<p>Mệt, "khá" ổn</p>')
+        self.assertEqual(rows[-1]['activities'], str(self.activity.id))
+        # healthrecord đọc 3 phần + 1 truy vấn rỗng, không tải cả bảng một lần
+        record_queries = [q for q in ctx.captured_queries if 'FROM "managements_healthrecord"' in q['sql']]
+        self.assertEqual(len(record_queries), 4)
+
+    def test_ndjson_gzip_and_coach_access(self):
+        coach_client = APIClient()
+        coach_client.force_authenticate(self.coach)
+        body = self.download(f'/users/export/?output=ndjson&gzip=1&types=healthrecord&user_id={self.user.id}',
+                             client=coach_client)
+        lines = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual([line['steps'] for line in lines], [1000, 1001, 1002, 1003, 1004])
+
+        stranger = APIClient()
+        stranger.force_authenticate(make_user('stranger'))
+        self.assertEqual(stranger.get(f'/users/export/?user_id={self.user.id}').status_code, 403)
+        self.assertEqual(self.client.get('/users/export/?output=xml').status_code, 400)
+        self.assertEqual(self.client.get('/users/export/?types=chat').status_code, 400)
+
+
+class ActivityImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coach = make_user('coach', role=Role.Coach)
+        self.client = APIClient()
+        self.client.force_authenticate(self.coach)
+        self.squat = Activity.objects.create(name='Squat', description='Cũ', calories_burned=50, time=5)
+
+    def test_csv_upsert_by_name_with_row_errors(self):
+        content = ('name,description,calories_burned,time,image\n'
+                   'Squat,Bài tập chân,80,10,\n'
+                   'Đạp xe,Cardio,200,30,https://res.cloudinary.com/demo/bike.jpg\n'
+                   ',Thiếu tên,10,1,\n'
+                   'Plank,Giữ,-5,1,\n')
+        version = httpcache.get_version('activity')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/activity/import/',
+                                        {'file': SimpleUploadedFile('catalog.csv', content.encode())},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 2))
+        self.assertEqual([e['index'] for e in response.data['errors']], [2, 3])
+        self.assertIn('calories_burned', response.data['errors'][1]['errors'])
+
+        self.squat.refresh_from_db()
+        self.assertEqual((self.squat.description, self.squat.calories_burned, self.squat.time), ('Bài tập chân', 80, 10))
+        bike = Activity.objects.get(name='Đạp xe')
+        self.assertEqual(search.search_activities(Activity.objects.all(), 'dap xe').get(), bike)
+        job = MediaUpload.objects.get()
+        self.assertEqual((job.object_id, job.field, job.staged_path), (bike.pk, 'image', 'https://res.cloudinary.com/demo/bike.jpg'))
+
+        with mock.patch.object(uploads, 'submit') as submit:
+            for callback in callbacks:
+                callback()
+        submit.assert_called_once_with(job.pk)
+        self.assertNotEqual(httpcache.get_version('activity'), version)
+
+    def test_json_import_and_permissions(self):
+        rows = [{'name': 'Plank', 'time': 2}, {'name': 'Plank', 'time': 3}, {'name': 'Burpee', 'image': '/etc/passwd'}]
+        response = self.client.post('/activity/import/', {'activities': rows}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 1))
+        self.assertEqual(Activity.objects.get(name='Plank').time, 3)
+        self.assertEqual(self.client.post('/activity/import/', {'x': 1}, format='json').status_code, 400)
+        # Ô vượt csv.field_size_limit() làm csv.Error
+        broken = SimpleUploadedFile('catalog.csv', b'name,time\nSquat,' + b'1' * (csv.field_size_limit() + 1))
+        response = self.client.post('/activity/import/', {'file': broken}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('CSV', response.data['message'])
+
+        member = APIClient()
+        member.force_authenticate(make_user('member'))
+        self.assertEqual(member.post('/activity/import/', rows, format='json').status_code, 403)
+
+    def test_partial_rows_keep_existing_columns(self):
+        content = 'name,description,calories_burned,time\nSquat,,,\nPlank,Giữ,,\n'
+        response = self.client.post('/activity/import/', {'file': SimpleUploadedFile('catalog.csv', content.encode())},
+                                    format='multipart')
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.squat.refresh_from_db()
+        self.assertEqual((self.squat.description, self.squat.calories_burned, self.squat.time), ('Cũ', 50, 5))
+
+        rows = [{'name': 'Squat', 'time': 8}, {'name': 'Squat', 'calories_burned': 60}, {'name': 'Plank'}]
+        self.client.post('/activity/import/', {'activities': rows}, format='json')
+        self.squat.refresh_from_db()
+        self.assertEqual((self.squat.description, self.squat.calories_burned, self.squat.time), ('Cũ', 60, 8))
+        self.assertEqual(Activity.objects.get(name='Plank').description, 'Giữ')
+
+    def test_remote_images_limited_to_allowed_https_hosts(self):
+        rows = [{'name': 'A', 'image': 'http://res.cloudinary.com/a.jpg'},
+                {'name': 'B', 'image': 'https://169.254.169.254/latest/meta-data/'},
+                {'name': 'C', 'image': 'https://res.cloudinary.com.evil.test/c.jpg'},
+                {'name': 'D', 'image': 'https://img.res.cloudinary.com/d.jpg'}]
+        response = self.client.post('/activity/import/', {'activities': rows}, format='json')
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 3))
+        self.assertEqual([e['index'] for e in response.data['errors']], [0, 1, 2])
+
+        with self.assertRaises(ValueError):
+            uploads.open_source('https://example.com/a.jpg')
+        response = mock.MagicMock()
+        response.__enter__.return_value.read.side_effect = lambda size: b'x' * size
+        with mock.patch.object(uploads, 'build_opener') as opener, \
+                mock.patch.object(uploads, 'DOWNLOAD_MAX_BYTES', 10):
+            opener.return_value.open.return_value = response
+            with self.assertRaises(ValueError):
+                uploads.open_source('https://res.cloudinary.com/big.jpg')
+        opener.return_value.open.assert_called_once_with('https://res.cloudinary.com/big.jpg',
+                                                          timeout=uploads.DOWNLOAD_TIMEOUT)
+
+    def test_command_reads_file_and_local_images(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with open(f'{tmp}/jump.png', 'wb') as f:
+            f.write(make_image().read())
+        with open(f'{tmp}/catalog.json', 'w', encoding='utf-8') as f:
+            json.dump([{'name': 'Nhảy dây', 'calories_burned': 120, 'image': 'jump.png'}], f)
+
+        out = StringIO()
+        with override_settings(MEDIA_STAGING_DIR=f'{tmp}/staging'):
+            call_command('import_activities', f'{tmp}/catalog.json', stdout=out)
+        self.assertIn('1 tạo mới', out.getvalue())
+        job = MediaUpload.objects.get()
+        self.assertTrue(job.staged_path.startswith(f'{tmp}/staging/'))
+
+    def test_admin_page(self):
+        admin_user = make_user('admin', role=Role.Admin, is_staff=True)
+        self.client.force_login(admin_user)
+        self.assertEqual(self.client.get('/admin/activity-import/').status_code, 200)
+        response = self.client.post('/admin/activity-import/',
+                                    {'file': SimpleUploadedFile('catalog.csv', b'name,time\nSquat,12\n')})
+        self.assertEqual(response.context['result']['updated'], 1)
+        self.assertContains(response, '1 cập nhật')
+
+    def test_migration_merges_duplicate_names(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        migration = import_module('managements.migrations.0018_activity_name_unique')
+        duplicate = Activity.objects.create(name='squát ')
+        plan = WorkoutPlan.objects.create(user=self.coach, name='Chân', date=timezone.now())
+        other = WorkoutPlan.objects.create(user=self.coach, name='Chân 2', date=timezone.now())
+        plan.activities.add(self.squat, duplicate)
+        other.activities.add(duplicate)
+
+        migration.merge_duplicate_activities(apps, None)
+        self.assertFalse(Activity.objects.filter(pk=duplicate.pk).exists())
+        self.assertEqual(list(plan.activities.all()), [self.squat])
+        self.assertEqual(list(other.activities.all()), [self.squat])
+        self.assertEqual(WorkoutPlan.activities.through.objects.filter(activity=self.squat).count(), 2)
+
+        # Liên kết không chuyển được thì migration dừng, không xoá bản trùng
+        duplicate = Activity.objects.create(name='SQUAT')
+        WorkoutPlan.objects.create(user=self.coach, name='Chân 3', date=timezone.now()).activities.add(duplicate)
+        with mock.patch('django.db.models.query.QuerySet.update', return_value=0):
+            with self.assertRaises(RuntimeError):
+                migration.merge_duplicate_activities(apps, None)
+        self.assertTrue(Activity.objects.filter(pk=duplicate.pk).exists())
+
+
+class QueryPlanTests(TestCase):
+    """
+    Chạy EXPLAIN QUERY PLAN cho mọi truy vấn của các endpoint nóng: bảng nóng không được quét toàn bộ
+    và phải dùng đúng index đã khai báo trong models.
+    """
+    HOT_TABLES = ['managements_healthrecord', 'managements_healthrecordrollup', 'managements_workoutplan',
+                  'managements_workoutplan_activities', 'managements_mealplan', 'managements_userconnection',
+                  'managements_chatmessage']
+
+    def setUp(self):
+        cache.clear()
+        self.coach = make_user('coach', role=Role.Coach)
+        self.user = make_user('member')
+        self.other = make_user('other')
+        UserConnection.objects.create(user=self.user, coach=self.coach, status='accepted')
+        activity = Activity.objects.create(name='Squat', calories_burned=50)
+        today = timezone.now().date()
+        for owner in (self.user, self.other):
+            for i in range(3):
+                HealthRecord.objects.create(user=owner, steps=1000 + i, heart_rate=70)
+                WorkoutPlan.objects.create(user=owner, name=f'Plan {i}', date=today, sets=3, reps=10).activities.add(activity)
+                MealPlan.objects.create(user=owner, name=f'Meal {i}', date=today, calories_intake=500)
+            ChatMessage.objects.create(sender=owner, receiver=self.coach, message='Chào')
+        ChatMessage.objects.create(sender=self.coach, receiver=self.user, message='Chào bạn')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def query_plans(self, user, method, url, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, (url, getattr(response, 'data', None)))
+        plans = []
+        for query in ctx.captured_queries:
+            if any(f'"{table}"' in query['sql'] for table in self.HOT_TABLES):
+                plans += self.explain(query['sql'])
+        return plans
+
+    def assertUsesIndexes(self, user, method, url, indexes, data=None):
+        plans = self.query_plans(user, method, url, data)
+        for line in plans:
+            scanned = re.match(r'SCAN (\w+)', line)
+            self.assertFalse(scanned and scanned.group(1) in self.HOT_TABLES,
+                             f'{method.upper()} {url}: quét toàn bảng ({line})')
+        for index in indexes:
+            self.assertTrue(any(f'INDEX {index} ' in line or line.endswith(f'INDEX {index}') for line in plans),
+                            f'{method.upper()} {url}: không dùng index {index}\n' + '\n'.join(plans))
+
+    def test_health_records(self):
+        self.assertUsesIndexes(self.user, 'get', '/healthrecord/?paginate=cursor', ['healthrecord_user_date_id'])
+        self.assertUsesIndexes(self.coach, 'get', '/healthrecord/?paginate=cursor', ['connection_coach_status'])
+        self.assertUsesIndexes(self.user, 'get', '/healthrecord/', [])
+        self.assertUsesIndexes(self.user, 'get', '/healthrecord/trends/?metrics=steps', [])
+        self.assertUsesIndexes(self.user, 'post', '/healthrecord/', ['healthrecord_user_date_id'],
+                               {'steps': 500, 'heart_rate': 80})
+
+    def test_plans(self):
+        self.assertUsesIndexes(self.user, 'get', '/workoutplan/weekly-summary/', ['workoutplan_user_date'])
+        self.assertUsesIndexes(self.user, 'get', '/workoutplan/my-plans/', [])
+        self.assertUsesIndexes(self.user, 'get', '/workoutplan/', [])
+        self.assertUsesIndexes(self.coach, 'get', f'/workoutplan/plans-by-user/{self.user.id}/', [])
+        self.assertUsesIndexes(self.user, 'get', '/mealplan/', [])
+
+    def test_coach_clients_and_chat(self):
+        self.assertUsesIndexes(self.coach, 'get', '/healthdiary/', ['connection_coach_status'])
+        self.assertUsesIndexes(self.coach, 'get', '/chatmessage/conversations/', [])
+        self.assertUsesIndexes(self.coach, 'get', '/chatmessage/?paginate=cursor',
+                               ['chatmessage_sender_timestamp', 'chatmessage_receiver_timestamp'])
+        # Mỗi nhánh đọc sẵn theo thứ tự của chỉ mục: không gộp OR rồi sắp xếp lại toàn bộ tin nhắn
+        plans = self.query_plans(self.coach, 'get', '/chatmessage/?paginate=cursor')
+        self.assertFalse([line for line in plans if 'MULTI-INDEX OR' in line or 'TEMP B-TREE' in line],
+                         '\n'.join(plans))
+        self.assertUsesIndexes(self.coach, 'post', '/chatmessage/mark-read/', [], {'user_id': self.user.id})
+
+
+class RouteBenchmarkTests(TransactionTestCase):
+    def test_every_route_has_a_sample_request(self):
+        results = benchmarks.bench_routes({'users': 4, 'records_per_user': 3, 'calls': 1})
+        self.assertEqual(results[0]['healthrecords'], 12)
+        routes = {result['name']: result for result in results[1:]}
+        self.assertEqual(len(routes), len(results) - 1)
+        self.assertEqual(routes['GET /healthrecord/']['status'], '200')
+        self.assertEqual(routes['DELETE /goal/{pk}/']['status'], '204')
+        for result in routes.values():
+            self.assertEqual(set(result), {'name', 'calls', 'p50_ms', 'p95_ms', 'p99_ms', 'queries',
+                                           'req_per_sec', 'status'})
+        for name in ('POST /workoutplan/', 'POST /mealplan/', 'POST /chatmessage/', 'POST /connection/'):
+            self.assertEqual(routes[name]['status'], '201', name)
+
+    def test_seed_backdates_auto_now_add_fields(self):
+        ids, _ = benchmarks.seed_dataset(2, 1, messages_per_user=4)
+        now = timezone.now()
+        days = sorted((now - diary.date).days for diary in HealthDiary.objects.filter(user_id=ids['member']))
+        self.assertEqual(days, [0, 1, 2, 3, 4])
+        messages = ChatMessage.objects.filter(Q(sender_id=ids['member']) | Q(receiver_id=ids['member']))
+        minutes = {m.message: round((now - m.timestamp).total_seconds() / 60) for m in messages}
+        self.assertEqual(minutes, {'Tin nhắn 0': 4, 'Tin nhắn 1': 3, 'Tin nhắn 2': 2, 'Tin nhắn 3': 1})
+
+    def test_baseline_comparison(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = f'{tmp}/baselines.json'
+        benchmarks.save_baselines({'routes': [{'name': 'GET /tag/', 'p95_ms': 10, 'queries': 2, 'req_per_sec': 100}]},
+                                  path)
+        baseline = benchmarks.load_baselines(path)['routes']['GET /tag/']
+        changes = benchmarks.compare({'name': 'GET /tag/', 'p95_ms': 12, 'queries': 2, 'req_per_sec': 80}, baseline)
+        self.assertEqual(changes, {'p95_ms': 20.0, 'queries': 0.0, 'req_per_sec': 20.0})
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin', role=Role.Admin, is_staff=True)
+        self.user = make_user('member')
+        HealthRecord.objects.create(user=self.user, steps=1000, heart_rate=70)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        instrumentation.registry.reset()
+        self.addCleanup(instrumentation.registry.reset)
+
+    def server_timing(self, response):
+        return dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/healthrecord/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', response['Server-Timing'])
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'db', 'serialize', 'render', 'total'})
+        self.assertGreater(float(timing['total']), float(timing['db']))
+
+    def test_histograms_per_view_and_action(self):
+        for _ in range(3):
+            self.client.get('/healthrecord/')
+        self.client.get('/users/current/')
+        self.client.get('/admin/login/')
+
+        views = instrumentation.registry.snapshot()['views']
+        self.assertEqual(set(views), {'HealthRecordViewSet.list', 'UserViewSet.get_current_user'})
+        stats = views['HealthRecordViewSet.list']
+        self.assertEqual(stats['total_ms']['count'], 3)
+        self.assertEqual(stats['queries']['buckets'][-1]['count'], 3)
+        self.assertGreater(stats['bytes']['sum'], 0)
+        self.assertIsNotNone(stats['serialize_ms']['p95'])
+
+    def test_serializer_timing_is_scoped_to_views(self):
+        from rest_framework.serializers import BaseSerializer
+        # Không thay thuộc tính data của DRF cho toàn tiến trình
+        self.assertEqual(BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+        response = self.client.get('/healthrecord/')
+        self.assertGreater(float(self.server_timing(response)['serialize']), 0)
+        self.assertEqual(BaseSerializer.data.fget.__module__, 'rest_framework.serializers')
+
+    def test_custom_actions_report_serialize_time(self):
+        ChatMessage.objects.create(sender=self.user, receiver=self.admin, message='Chào')
+        self.client.get('/chatmessage/conversations/')
+        self.client.get('/energy-balance/')
+
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        admin.get('/metrics/')
+        views = instrumentation.registry.snapshot()['views']
+        for view in ('ChatMessageViewSet.conversations', 'EnergyBalanceViewSet.list', 'MetricsViewSet.list'):
+            self.assertGreater(views[view]['serialize_ms']['sum'], 0, view)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.client.get('/healthrecord/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        admin = APIClient()
+        admin.force_authenticate(self.admin)
+        response = admin.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('HealthRecordViewSet.list', response.data['views'])
+        self.assertEqual(admin.post('/metrics/reset/').status_code, 204)
+        self.assertNotIn('HealthRecordViewSet.list', admin.get('/metrics/').data['views'])
+
+    def test_histogram_quantiles(self):
+        histogram = instrumentation.Histogram((1, 5, 10))
+        for value in (0.5, 0.7, 3, 7, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 5)
+        self.assertEqual(histogram.quantile(0.99), 50)
+        self.assertEqual(histogram.as_dict()['buckets'][-1], {'le': '+Inf', 'count': 5})
+
+    @mock.patch.object(instrumentation, 'METRICS_ENABLED', False)
+    def test_disabled(self):
+        response = self.client.get('/healthrecord/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.registry.snapshot()['views'], {})
+
+
+class EnergyBalanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('member')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.run_ = Activity.objects.create(name='Chạy bộ', calories_burned=100)
+        self.squat = Activity.objects.create(name='Squat', calories_burned=30)
+        self.plan = WorkoutPlan.objects.create(user=self.user, name='Sáng', date='2025-03-02', sets=2)
+        self.plan.activities.set([self.run_, self.squat])
+        WorkoutPlan.objects.create(user=self.user, name='Tối', date='2025-03-02').activities.set([self.squat])
+        MealPlan.objects.create(user=self.user, name='Trưa', date='2025-03-02', calories_intake=700)
+        MealPlan.objects.create(user=self.user, name='Tối', date='2025-03-02', calories_intake=500)
+        MealPlan.objects.create(user=self.user, name='Sáng', date='2025-03-03', calories_intake=400)
+        MealPlan.objects.create(user=self.user, name='Cũ', date='2025-03-03', calories_intake=999, active=False)
+        self.url = '/energy-balance/?from=2025-03-01&to=2025-03-03'
+
+    def days(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return {str(day['date']): day for day in response.data['days']}
+
+    def test_daily_totals(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        days = {str(day['date']): day for day in response.data['days']}
+        self.assertEqual(list(days), ['2025-03-01', '2025-03-02', '2025-03-03'])
+        self.assertEqual(days['2025-03-01'], {'date': days['2025-03-01']['date'], 'intake': 0.0, 'burned': 0.0,
+                                              'meals': 0, 'workouts': 0, 'balance': 0.0})
+        # (100 + 30) * 2 sets + 30 * 1 (sets trống)
+        self.assertEqual(days['2025-03-02']['burned'], 290)
+        self.assertEqual(days['2025-03-02']['intake'], 1200)
+        self.assertEqual(days['2025-03-02']['balance'], 910)
+        self.assertEqual(days['2025-03-02']['workouts'], 2)
+        self.assertEqual(days['2025-03-03']['intake'], 400)
+        self.assertEqual(response.data['total'], {'intake': 1600, 'burned': 290, 'balance': 1310})
+
+    def test_cached_per_day(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        # Chỉ ngày chưa có trong cache được tính
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/energy-balance/?from=2025-03-03&to=2025-03-04')
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(response.data['total']['intake'], 400)
+
+    def test_invalidated_when_plans_change(self):
+        self.days()
+        with self.captureOnCommitCallbacks(execute=True):
+            MealPlan.objects.create(user=self.user, name='Phụ', date='2025-03-03', calories_intake=100)
+        self.assertEqual(self.days()['2025-03-03']['intake'], 500)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.activities.remove(self.run_)
+        self.assertEqual(self.days()['2025-03-02']['burned'], 90)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_.workoutplan_set.add(self.plan)
+        self.assertEqual(self.days()['2025-03-02']['burned'], 290)
+
+        # Chuyển kế hoạch sang ngày khác: cả ngày cũ và ngày mới được tính lại
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.date = '2025-03-01'
+            self.plan.save()
+        days = self.days()
+        self.assertEqual((days['2025-03-01']['burned'], days['2025-03-02']['burned']), (260, 30))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.squat.calories_burned = 50
+            self.squat.save()
+        self.assertEqual(self.days()['2025-03-02']['burned'], 50)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.delete()
+        self.assertEqual(self.days()['2025-03-01']['burned'], 0)
+
+    def test_access_and_validation(self):
+        other = make_user('other')
+        self.assertEqual(self.client.get(f'{self.url}&user_id={other.id}').status_code, 403)
+        self.assertEqual(self.client.get('/energy-balance/?from=2025-03-03&to=2025-03-01').status_code, 400)
+        self.assertEqual(self.client.get('/energy-balance/?from=2020-01-01&to=2025-01-01').status_code, 400)
+        self.assertEqual(self.client.get('/energy-balance/?from=2020-02-30').status_code, 400)
+        self.assertEqual(len(self.client.get('/energy-balance/').data['days']), 7)
+
+
+class CoachDashboardTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coach = make_user('coach', role=Role.Coach)
+        self.client = APIClient()
+        self.client.force_authenticate(self.coach)
+        self.today = timezone.now().date()
+        self.clients = []
+
+    def add_clients(self, n):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(n):
+                user = make_user(f'client{len(self.clients)}', role=Role.Exerciser_With_Coach)
+                UserConnection.objects.create(user=user, coach=self.coach, status='accepted')
+                HealthRecord.objects.create(user=user, steps=1000, weight=60, height=170)
+                WorkoutPlan.objects.create(user=user, name='Tuần này', date=self.today)
+                UserGoal.objects.create(user=user, goal_type='Giảm cân', target_weight=55)
+                self.clients.append(user)
+
+    def test_latest_record_plans_and_goal(self):
+        self.add_clients(2)
+        first = self.clients[0]
+        old_record = HealthRecord.objects.filter(user=first).get()
+        HealthRecord.objects.filter(pk=old_record.pk).update(date=timezone.now() - timedelta(days=3))
+        latest = HealthRecord.objects.create(user=first, steps=9000)
+        WorkoutPlan.objects.create(user=first, name='Tuần trước', date=self.today - timedelta(days=7))
+        WorkoutPlan.objects.create(user=first, name='Hôm nay 2', date=self.today)
+        UserGoal.objects.create(user=first, goal_type='Cũ', target_date=self.today - timedelta(days=1))
+        outsider = make_user('outsider')
+        HealthRecord.objects.create(user=outsider, steps=1)
+
+        response = self.client.get('/connection/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        rows = {row['user']['username']: row for row in response.data['clients']}
+        self.assertEqual(set(rows), {'client0', 'client1'})
+        self.assertEqual(set(rows['client0']['user']),
+                         {'id', 'username', 'first_name', 'last_name', 'avatar_thumbnail_url'})
+        self.assertEqual(rows['client0']['latest_record']['id'], latest.id)
+        self.assertEqual(rows['client0']['week_plans'], 2)
+        self.assertEqual(rows['client0']['active_goal']['goal_type'], 'Giảm cân')
+        self.assertEqual(rows['client1']['week_plans'], 1)
+
+    def test_clients_without_data(self):
+        user = make_user('new-client', role=Role.Exerciser_With_Coach)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserConnection.objects.create(user=user, coach=self.coach, status='accepted')
+        row = self.client.get('/connection/dashboard/').data['clients'][0]
+        self.assertEqual((row['latest_record'], row['week_plans'], row['active_goal']), (None, 0, None))
+
+    def test_query_count_flat(self):
+        self.assertQueryCountFlat(self.client, '/connection/dashboard/', self.add_clients, small=1, large=8)
+
+    def test_permissions(self):
+        self.add_clients(1)
+        member = APIClient()
+        member.force_authenticate(self.clients[0])
+        self.assertEqual(member.get('/connection/dashboard/').status_code, 403)
+
+        admin = APIClient()
+        admin.force_authenticate(make_user('admin', role=Role.Admin))
+        response = admin.get(f'/connection/dashboard/?coach_id={self.coach.id}')
+        self.assertEqual(len(response.data['clients']), 1)
+
+
+class GoalProjectionTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+
+    def add_weights(self, user, weights, every=2):
+        """weights[-1] là số liệu hôm nay, các số liệu trước cách nhau every ngày."""
+        HealthRecord.objects.bulk_create([
+            HealthRecord(user=user, weight=weight, date=self.now - timedelta(days=every * (len(weights) - 1 - k)))
+            for k, weight in enumerate(weights)])
+
+    def goal(self, username, weights, target, days=None):
+        user = make_user(username)
+        self.add_weights(user, weights)
+        return UserGoal.objects.create(user=user, goal_type='Cân nặng', target_weight=target,
+                                       target_date=self.today + timedelta(days=days) if days else None)
+
+    def test_fit_trends_per_user(self):
+        days = np.array([-4, -2, 0, -3, 0, -1], dtype=float)
+        samples, span, current, slope = projection.fit_trends(
+            np.array([1, 2, 3]), np.array([1, 1, 1, 2, 2, 3]), days,
+            np.array([72, 71, 70, 60, 61.5, 80], dtype=float))
+        self.assertEqual(samples.tolist(), [3, 2, 1])
+        self.assertEqual(span.tolist(), [4, 3, 0])
+        np.testing.assert_allclose(slope[:2], [-0.5, 0.5])
+        np.testing.assert_allclose(current, [70, 61.5, 80])
+        self.assertTrue(np.isnan(slope[2]))
+
+    def test_project_goals(self):
+        # Giảm 0,2 kg mỗi 2 ngày (0,7 kg/tuần)
+        losing = [80 - 0.2 * k for k in range(15)]
+        on_track = self.goal('on-track', losing, 75, days=90)
+        behind = self.goal('behind', losing, 75, days=20)
+        no_deadline = self.goal('no-deadline', losing, 75)
+        off_track = self.goal('off-track', losing[::-1], 70)
+        achieved = self.goal('achieved', losing, 77.3)
+        sparse = self.goal('sparse', [80, 79], 70)
+        UserGoal.objects.create(user=sparse.user, goal_type='Không có cân nặng')
+
+        summary = projection.project_goals(now=self.now)
+        self.assertEqual((summary['users'], summary['goals'], summary['records']), (6, 6, 77))
+
+        progress = {p.goal_id: p for p in GoalProgress.objects.all()}
+        self.assertEqual(progress[on_track.id].status, 'on_track')
+        self.assertAlmostEqual(progress[on_track.id].trend_per_week, -0.7, places=3)
+        self.assertAlmostEqual(progress[on_track.id].current_weight, 77.2, places=3)
+        # (75 - 77,2) / -0,1 kg/ngày = 22 ngày
+        self.assertEqual(progress[on_track.id].projected_date, self.today + timedelta(days=22))
+        self.assertEqual(progress[behind.id].status, 'behind')
+        self.assertAlmostEqual(progress[behind.id].required_per_week, -0.77, places=3)
+        self.assertEqual(progress[no_deadline.id].status, 'on_track')
+        self.assertEqual(progress[off_track.id].status, 'off_track')
+        self.assertIsNone(progress[off_track.id].projected_date)
+        self.assertEqual(progress[achieved.id].status, 'achieved')
+        self.assertEqual(progress[achieved.id].projected_date, self.today)
+        self.assertEqual(progress[sparse.id].status, 'insufficient_data')
+
+        # Mục tiêu không còn hiệu lực bị xoá tiến độ ở lần chạy sau
+        UserGoal.objects.filter(pk=achieved.pk).update(active=False)
+        self.assertEqual(projection.project_goals(now=self.now, batch_size=2)['removed'], 1)
+        self.assertEqual(GoalProgress.objects.count(), 5)
+
+    def test_endpoint_reads_stored_progress(self):
+        goal = self.goal('member', [80 - 0.2 * k for k in range(15)], 75, days=90)
+        call_command('project_goals', stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(goal.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/goal/progress/')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response.data[0]['goal']['id'], goal.id)
+        self.assertEqual(response.data[0]['status'], 'on_track')
+
+        # Số liệu mới chỉ có hiệu lực sau lần tính kế tiếp
+        self.add_weights(goal.user, [60])
+        self.assertEqual(client.get('/goal/progress/').data[0]['status'], 'on_track')
+
+        other = make_user('other')
+        self.assertEqual(client.get(f'/goal/progress/?user_id={other.id}').status_code, 403)
+
+
+class AnomalyDetectionTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.coach = make_user('coach', role=Role.Coach)
+        self.user = make_user('member', role=Role.Exerciser_With_Coach)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserConnection.objects.create(user=self.user, coach=self.coach, status='accepted')
+
+    def add_readings(self, user, readings, start=0):
+        """readings: danh sách (heart_rate, steps), mỗi số liệu cách nhau một giờ kể từ giờ thứ start."""
+        return HealthRecord.objects.bulk_create([
+            HealthRecord(user=user, heart_rate=heart_rate, steps=steps,
+                         date=self.now - timedelta(days=30) + timedelta(hours=start + k))
+            for k, (heart_rate, steps) in enumerate(readings)])
+
+    def baseline(self, n):
+        return [(70 + k % 5, 5000 + 100 * (k % 7)) for k in range(n)]
+
+    def test_rolling_scores_match_reference(self):
+        rng = np.random.default_rng(1)
+        owners = np.repeat([3, 5, 9], [40, 5, 60])
+        values = rng.normal(70, 5, len(owners))
+        window, min_history = 8, 4
+        baseline, deviation, score = anomalies.rolling_scores(owners, values, window, min_history, 1.0, chunk_rows=7)
+        for i in range(len(values)):
+            previous = values[max(0, i - window):i][owners[max(0, i - window):i] == owners[i]]
+            if len(previous) < min_history:
+                self.assertTrue(np.isnan(score[i]))
+                continue
+            median = np.median(previous)
+            mad = np.median(np.abs(previous - median))
+            self.assertAlmostEqual(baseline[i], median)
+            self.assertAlmostEqual(deviation[i], mad)
+            self.assertAlmostEqual(score[i], 0.6745 * (values[i] - median) / max(mad, 1.0))
+
+    def test_batch_detection(self):
+        records = self.add_readings(self.user, [*self.baseline(20), (150, 5200), (72, None), (71, 40000)])
+        other = make_user('other')
+        self.add_readings(other, [(60, 3000)] * 15 + [(64, 3100)])
+
+        summary = anomalies.detect_all()
+        self.assertEqual((summary['readings'], summary['events']), (39, 2))
+        events = {(e.metric, e.record_id): e for e in AnomalyEvent.objects.all()}
+        self.assertEqual(set(events), {('heart_rate', records[20].id), ('steps', records[22].id)})
+        spike = events[('heart_rate', records[20].id)]
+        self.assertEqual((spike.user_id, spike.value, spike.baseline), (self.user.id, 150, 72))
+        self.assertGreater(spike.score, anomalies.THRESHOLD)
+        self.assertEqual(AnomalyCheckpoint.objects.get().last_record_id, HealthRecord.objects.latest('id').id)
+
+        # Chạy lại không tạo sự kiện trùng
+        anomalies.detect_all()
+        self.assertEqual(AnomalyEvent.objects.count(), 2)
+
+    def test_incremental_matches_batch(self):
+        self.add_readings(self.user, self.baseline(40))
+        anomalies.detect_all()
+        self.assertEqual(AnomalyEvent.objects.count(), 0)
+
+        new = self.add_readings(self.user, [(71, 5200), (160, 5100), (72, 90), *self.baseline(5)], start=40)
+        with CaptureQueriesContext(connection) as ctx:
+            summary = anomalies.detect_new(chunk_rows=3)
+        self.assertLess(len(ctx.captured_queries), 40)
+        self.assertEqual((summary['readings'], summary['events']), (8, 2))
+        incremental = set(AnomalyEvent.objects.values_list('record_id', 'metric', 'score'))
+        self.assertEqual({(r, m) for r, m, _ in incremental}, {(new[1].id, 'heart_rate'), (new[2].id, 'steps')})
+        self.assertEqual(AnomalyCheckpoint.objects.get().last_record_id, new[-1].id)
+        self.assertEqual(anomalies.detect_new()['readings'], 0)
+
+        anomalies.detect_all()
+        self.assertEqual(set(AnomalyEvent.objects.values_list('record_id', 'metric', 'score')), incremental)
+
+    def test_full_rescan_keeps_events_of_archived_records(self):
+        records = self.add_readings(self.user, [*self.baseline(20), (150, None), *self.baseline(5)])
+        anomalies.detect_all()
+        self.assertEqual(list(AnomalyEvent.objects.values_list('record_id', flat=True)), [records[20].id])
+
+        # Chuyển 21 số liệu đầu (kể cả số liệu bất thường), 5 số liệu sau vẫn ở bảng chính
+        archive.archive_source('healthrecord', now=self.now + timedelta(days=archive.HEALTHRECORD_DAYS - 30, hours=21))
+        self.assertEqual(HealthRecord.objects.count(), 5)
+        anomalies.detect_all()
+        self.assertEqual(list(AnomalyEvent.objects.values_list('record_id', flat=True)), [records[20].id])
+
+    def test_coach_queries_client_events(self):
+        records = self.add_readings(self.user, [*self.baseline(20), (150, None)])
+        self.add_readings(make_user('other'), [*self.baseline(20), (150, None)])
+        call_command('detect_anomalies', '--full', stdout=StringIO())
+        self.assertEqual(AnomalyEvent.objects.count(), 2)
+
+        client = APIClient()
+        client.force_authenticate(self.coach)
+        response = client.get(f'/anomaly/?metric=heart_rate&user_id={self.user.id}')
+        self.assertEqual([e['record_id'] for e in response.data['results']], [records[-1].id])
+        day = timezone.localtime(records[-1].date).date()
+        self.assertEqual(len(client.get(f'/anomaly/?from={day}&to={day}').data['results']), 1)
+        self.assertEqual(len(client.get(f'/anomaly/?from={day + timedelta(days=1)}').data['results']), 0)
+        self.assertEqual(len(client.get('/anomaly/?metric=steps').data['results']), 0)
+        self.assertEqual(client.get('/anomaly/?user_id=abc').status_code, 400)
+        self.assertEqual(client.get('/anomaly/?from=2020-02-30').status_code, 400)
+        stranger = AnomalyEvent.objects.exclude(user=self.user).get().user_id
+        self.assertEqual(client.get(f'/anomaly/?user_id={stranger}').status_code, 403)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.user = make_user('member')
+        self.coach = make_user('coach', role=Role.Coach)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_records(self, days_ago, user=None, **fields):
+        return HealthRecord.objects.bulk_create([
+            HealthRecord(user=user or self.user, steps=1000 + k, date=self.now - timedelta(days=days), **fields)
+            for k, days in enumerate(days_ago)])
+
+    def add_messages(self, *messages):
+        """messages: (người gửi, người nhận, số ngày trước, đã đọc)."""
+        created = ChatMessage.objects.bulk_create([
+            ChatMessage(sender=sender, receiver=receiver, message=f'Tin {k}', is_read=is_read)
+            for k, (sender, receiver, _, is_read) in enumerate(messages)])
+        # timestamp là auto_now_add: lùi về quá khứ sau khi tạo
+        for k, (message, (_, _, days, _)) in enumerate(zip(created, messages)):
+            message.timestamp = self.now - timedelta(days=days, minutes=k)
+        ChatMessage.objects.bulk_update(created, ['timestamp'])
+        return created
+
+    def collect(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_moves_inactive_and_old_rows_in_chunks(self):
+        old = self.add_records([400, 500, 600])
+        recent = self.add_records([1, 2])
+        deleted = self.add_records([3], active=False)
+        messages = self.add_messages((self.user, self.coach, 400, True), (self.coach, self.user, 400, False),
+                                     (self.user, self.coach, 1, True))
+
+        self.assertEqual(archive.archive_source('healthrecord', dry_run=True)['moved'], 4)
+        self.assertEqual(HealthRecord.objects.count(), 6)
+        summary = archive.archive_source('healthrecord', chunk_size=2, pause=0)
+        self.assertEqual((summary['moved'], summary['chunks']), (4, 2))
+        self.assertEqual(set(HealthRecord.objects.values_list('id', flat=True)), {r.id for r in recent})
+        archived = HealthRecordArchive.objects.in_bulk()
+        self.assertEqual(set(archived), {r.id for r in old + deleted})
+        self.assertEqual((archived[old[0].id].date, archived[old[0].id].steps), (old[0].date, old[0].steps))
+        self.assertFalse(archived[deleted[0].id].active)
+        self.assertEqual(archive.archive_source('healthrecord')['moved'], 0)
+
+        # Tin nhắn cũ chưa đọc vẫn ở bảng chính
+        self.assertEqual(archive.archive_source('chatmessage', pause=0)['moved'], 1)
+        self.assertEqual(list(ChatMessageArchive.objects.values_list('id', flat=True)), [messages[0].id])
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+    def test_rollups_keep_archived_days(self):
+        self.add_records([400, 400, 2])
+        def rows():
+            return set(HealthRecordRollup.objects.values_list('period', 'period_start', 'metric', 'count', 'total'))
+
+        before = rows()
+        archive.archive_source('healthrecord', pause=0)
+        self.assertEqual(rows(), before)
+        rollups.rebuild_rollups()
+        self.assertEqual(rows(), before)
+
+        # Số liệu mới của một ngày đã có dữ liệu lưu trữ: bucket ngày gộp cả hai bảng
+        record = self.add_records([400])[0]
+        point = HealthRecordRollup.objects.get(period='day', metric='steps', period_start=rollups.local_day(record.date))
+        self.assertEqual((point.count, point.total), (3, 3001))
+
+    def test_reads_fall_through_to_archive(self):
+        old = self.add_records([400, 500])
+        recent = self.add_records([1, 2])
+        self.add_records([3], active=False)
+        other = self.add_records([400], user=make_user('other'))
+        archive.archive_source('healthrecord', pause=0)
+
+        self.assertEqual(self.collect('/healthrecord/'), [recent[1].id, recent[0].id, old[1].id, old[0].id])
+        self.assertEqual(self.client.get('/healthrecord/?page=2').data['count'], 4)
+        self.assertEqual(self.collect('/healthrecord/?paginate=cursor&page_size=3'),
+                         [recent[0].id, recent[1].id, old[0].id, old[1].id])
+
+        response = self.client.get(f'/healthrecord/{old[0].id}/')
+        self.assertEqual((response.status_code, response.data['steps']), (200, old[0].steps))
+        self.assertEqual(self.client.get(f'/healthrecord/{other[0].id}/').status_code, 404)
+        # Dữ liệu lưu trữ chỉ đọc
+        self.assertEqual(self.client.patch(f'/healthrecord/{old[0].id}/', {'steps': 1}).status_code, 404)
+
+        exported = [row['id'] for chunk in export.iter_rows(self.user.id, 'healthrecord', 2) for row in chunk]
+        self.assertEqual(exported, [old[0].id, old[1].id, recent[0].id, recent[1].id])
+
+    def test_command_and_chat_history(self):
+        messages = self.add_messages((self.user, self.coach, 400, True), (self.coach, self.user, 300, False),
+                                     (self.user, self.coach, 0, True))
+        out = StringIO()
+        call_command('archive_data', '--dry-run', stdout=out)
+        self.assertIn('Sẽ chuyển 1 dòng chatmessage', out.getvalue())
+        self.assertEqual(ChatMessageArchive.objects.count(), 0)
+        call_command('archive_data', 'chatmessage', '--pause', '0', stdout=out)
+        self.assertEqual(ChatMessageArchive.objects.count(), 1)
+        with self.assertRaises(CommandError):
+            call_command('archive_data', 'healthdiary', stdout=out)
+
+        # Mặc định tin nhắn xếp theo thời gian tăng dần: tin lưu trữ đứng trước
+        self.assertEqual(self.collect('/chatmessage/'), [m.id for m in messages])
+        self.assertEqual(self.collect('/chatmessage/?paginate=cursor&page_size=2'), [m.id for m in reversed(messages)])
+        self.assertEqual(self.client.get(f'/chatmessage/{messages[0].id}/').data['message'], 'Tin 0')
+
+    def test_hot_rows_older_than_archived_rows_keep_order(self):
+        # Tin cũ chưa đọc ở lại bảng chính, tin mới hơn đã đọc được chuyển đi
+        messages = self.add_messages((self.coach, self.user, 300, False), (self.user, self.coach, 200, True),
+                                     (self.user, self.coach, 1, True))
+        self.assertEqual(archive.archive_source('chatmessage', pause=0)['moved'], 1)
+        self.assertEqual(ChatMessageArchive.objects.get().id, messages[1].id)
+
+        ids = [m.id for m in messages]
+        self.assertEqual(self.collect('/chatmessage/'), ids)
+        self.assertEqual(self.collect('/chatmessage/?paginate=cursor&page_size=2'), ids[::-1])
+        self.assertEqual(self.collect('/chatmessage/?paginate=cursor&page_size=1'), ids[::-1])
+
+        # Số liệu có id nhỏ hơn nhưng còn ở bảng chính (thứ tự mặc định -id)
+        records = self.add_records([100, 400, 50])
+        archive.archive_source('healthrecord', pause=0)
+        self.assertEqual(self.collect('/healthrecord/'), [r.id for r in reversed(records)])
+        self.assertEqual(self.collect('/healthrecord/?paginate=cursor&page_size=2'),
+                         [records[2].id, records[0].id, records[1].id])
+
+    def test_conversations_include_archived_threads(self):
+        friend = make_user('friend')
+        old = self.add_messages((self.user, friend, 400, True), (friend, self.user, 399, True))
+        self.add_messages((self.coach, self.user, 400, True), (self.coach, self.user, 300, False))
+        archive.archive_source('chatmessage', pause=0)
+        self.assertEqual(ChatMessage.objects.filter(sender=friend).count(), 0)
+
+        response = self.client.get('/chatmessage/conversations/?expand=user')
+        threads = {t['user']['username']: t for t in response.data['results']}
+        self.assertEqual(set(threads), {'friend', 'coach'})
+        self.assertEqual(threads['friend']['last_message']['id'], old[1].id)
+        self.assertEqual((threads['friend']['unread_count'], threads['coach']['unread_count']), (0, 1))
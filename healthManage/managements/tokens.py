@@ -0,0 +1,112 @@
+"""
+Cache access token OAuth2 trong bộ nhớ tiến trình.
+
+OAuth2Authentication tra AccessToken (JOIN user, application) ở mỗi request; CachedOAuth2Validator
+đặt trước truy vấn đó một cache LRU giới hạn OAUTH2_TOKEN_CACHE_SIZE token, mỗi token sống tối đa
+OAUTH2_TOKEN_CACHE_TTL giây. Token bị xoá cache ngay khi bị thu hồi, làm mới (refresh token thu hồi
+access token cũ) hoặc sửa; khi người dùng thay đổi, mọi token của người đó bị xoá khỏi cache.
+Cache nằm trong từng tiến trình nên các tiến trình khác thấy thay đổi chậm nhất sau TTL.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from oauth2_provider.models import AccessToken
+from oauth2_provider.oauth2_validators import OAuth2Validator
+
+TOKEN_CACHE_SIZE = getattr(settings, 'OAUTH2_TOKEN_CACHE_SIZE', 10000)
+TOKEN_CACHE_TTL = getattr(settings, 'OAUTH2_TOKEN_CACHE_TTL', 60)
+
+
+class TokenCache:
+    """
+    Cache LRU có hạn sống, an toàn khi dùng từ nhiều luồng.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+
+def token_checksum(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def load_access_token(token):
+    """
+    AccessToken (kèm user, application) của chuỗi token, hoặc None. Mỗi lần gọi trả về một bản sao
+    để request không sửa chung đối tượng đang nằm trong cache.
+    """
+    checksum = token_checksum(token)
+    access_token = token_cache.get(checksum)
+    if access_token is None:
+        access_token = (AccessToken.objects.select_related('application', 'user')
+                        .filter(token_checksum=checksum).first())
+        if access_token is None:
+            return None
+        token_cache.set(checksum, access_token)
+    cached, access_token = access_token, copy.copy(access_token)
+    if cached.user is not None:
+        access_token.user = copy.copy(cached.user)
+    return access_token
+
+
+def invalidate_user(user_id):
+    token_cache.discard_where(lambda access_token: access_token.user_id == user_id)
+
+
+class CachedOAuth2Validator(OAuth2Validator):
+    def _load_access_token(self, token):
+        return load_access_token(token)
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def _invalidate_access_token(sender, instance, **kwargs):
+    token_cache.delete(instance.token_checksum)
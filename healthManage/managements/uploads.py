@@ -0,0 +1,210 @@
+"""
+Tải ảnh (avatar, ảnh activity) lên kho lưu trữ ở nền.
+
+Request chỉ ghi file vào thư mục tạm MEDIA_STAGING_DIR và tạo một MediaUpload; sau khi transaction
+commit, một luồng trong pool MEDIA_UPLOAD_WORKERS resize/chuyển định dạng ảnh, đẩy lên kho
+MEDIA_REMOTE_STORE rồi mới thay giá trị của trường ảnh cùng các URL đã lưu sẵn.
+
+Kho lưu trữ là một lớp có phương thức save(name, content, **options) trả về
+(giá trị lưu vào CloudinaryField, URL, URL ảnh thu nhỏ): CloudinaryStore cho môi trường thật,
+LocalFileStore ghi ra đĩa dùng cho test và benchmark.
+"""
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+from urllib.request import HTTPRedirectHandler, build_opener
+
+from cloudinary import uploader
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps
+
+from managements import media
+from managements.models import MediaUpload
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS = getattr(settings, 'MEDIA_UPLOAD_WORKERS', 2)
+MAX_DIMENSION = getattr(settings, 'MEDIA_MAX_DIMENSION', 1024)
+DOWNLOAD_TIMEOUT = getattr(settings, 'MEDIA_DOWNLOAD_TIMEOUT', 30)
+DOWNLOAD_MAX_BYTES = getattr(settings, 'MEDIA_DOWNLOAD_MAX_BYTES', 10 * 1024 * 1024)
+# Ảnh từ URL chỉ được tải qua https từ các máy chủ này (và tên miền con của chúng)
+REMOTE_HOSTS = getattr(settings, 'MEDIA_REMOTE_HOSTS', ['res.cloudinary.com'])
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class CloudinaryStore:
+    def save(self, name, content, **options):
+        resource = uploader.upload_resource(content, **options)
+        return (resource.get_prep_value(), media.resolve_url(resource),
+                media.resolve_url(resource, **media.THUMBNAIL_OPTIONS))
+
+
+class LocalFileStore:
+    """
+    Kho lưu trên đĩa (MEDIA_LOCAL_STORE_DIR), thay cho Cloudinary khi test và benchmark.
+    """
+    def __init__(self, location=None, base_url=None):
+        self.location = str(location or settings.MEDIA_LOCAL_STORE_DIR)
+        self.base_url = base_url or getattr(settings, 'MEDIA_LOCAL_STORE_URL', '/media/')
+
+    def _write(self, name, data):
+        path = os.path.join(self.location, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return self.base_url + name
+
+    def save(self, name, content, folder=None, **options):
+        name = f'{folder}/{name}' if folder else name
+        data = content.read()
+        stem, ext = os.path.splitext(name)
+        with Image.open(BytesIO(data)) as image:
+            thumbnail = ImageOps.fit(image, (media.THUMBNAIL_OPTIONS['width'], media.THUMBNAIL_OPTIONS['height']))
+            buffer = BytesIO()
+            thumbnail.save(buffer, format=image.format)
+        return name, self._write(name, data), self._write(f'{stem}_thumb{ext}', buffer.getvalue())
+
+
+def get_store():
+    return import_string(getattr(settings, 'MEDIA_REMOTE_STORE', 'managements.uploads.CloudinaryStore'))()
+
+
+def prepare_image(file, max_dimension=MAX_DIMENSION):
+    """
+    Xoay ảnh theo EXIF, thu nhỏ về cạnh dài tối đa max_dimension và chuyển sang JPEG
+    (PNG nếu ảnh có kênh trong suốt). Trả về (nội dung, phần mở rộng).
+    """
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image_format, ext = 'PNG', 'png'
+        else:
+            image_format, ext = 'JPEG', 'jpg'
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, format=image_format, optimize=True)
+    buffer.seek(0)
+    return buffer, ext
+
+
+def stage_file(uploaded_file):
+    staging_dir = str(settings.MEDIA_STAGING_DIR)
+    os.makedirs(staging_dir, exist_ok=True)
+    path = os.path.join(staging_dir, uuid.uuid4().hex + os.path.splitext(uploaded_file.name)[1].lower())
+    with open(path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return path
+
+
+def enqueue_upload(instance, field, uploaded_file):
+    """
+    Ghi tạm uploaded_file và lên lịch tải lên cho instance.<field> sau khi transaction commit.
+    """
+    return enqueue_source(instance, field, stage_file(uploaded_file))
+
+
+def enqueue_source(instance, field, source):
+    """
+    Lên lịch tải lên ảnh từ source (file đã ghi tạm hoặc URL http/https, ví dụ khi nhập danh mục).
+    """
+    job = MediaUpload.objects.create(content_type=ContentType.objects.get_for_model(instance),
+                                     object_id=instance.pk, field=field, staged_path=source)
+    transaction.on_commit(lambda: submit(job.pk))
+    return job
+
+
+def is_remote(source):
+    return source.startswith(('http://', 'https://'))
+
+
+def is_allowed_url(url):
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    return parts.scheme == 'https' and any(host == allowed or host.endswith('.' + allowed) for allowed in REMOTE_HOSTS)
+
+
+class _AllowedRedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not is_allowed_url(newurl):
+            raise ValueError(f'Không tải ảnh từ {newurl}: máy chủ không được phép.')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def open_source(source):
+    if is_remote(source):
+        if not is_allowed_url(source):
+            raise ValueError(f'Không tải ảnh từ {source}: máy chủ không được phép.')
+        with build_opener(_AllowedRedirectHandler).open(source, timeout=DOWNLOAD_TIMEOUT) as response:
+            data = response.read(DOWNLOAD_MAX_BYTES + 1)
+        if len(data) > DOWNLOAD_MAX_BYTES:
+            raise ValueError(f'Ảnh lớn hơn {DOWNLOAD_MAX_BYTES} byte.')
+        return BytesIO(data)
+    return open(source, 'rb')
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='media-upload')
+        return _executor
+
+
+def submit(upload_id):
+    if UPLOAD_WORKERS <= 0:
+        return process_upload(upload_id)
+    return _get_executor().submit(_run_in_worker, upload_id)
+
+
+def _run_in_worker(upload_id):
+    try:
+        return process_upload(upload_id)
+    finally:
+        close_old_connections()
+
+
+def process_upload(upload_id, store=None):
+    """
+    Xử lý một MediaUpload; bỏ qua nếu job đang được luồng khác xử lý hoặc đã xong.
+    """
+    if not MediaUpload.objects.filter(pk=upload_id, status__in=['pending', 'failed']).update(status='processing'):
+        return None
+    job = MediaUpload.objects.select_related('content_type').get(pk=upload_id)
+    try:
+        model = job.content_type.model_class()
+        model_field = model._meta.get_field(job.field)
+        with open_source(job.staged_path) as f:
+            content, ext = prepare_image(f)
+        options = {'type': model_field.type, 'resource_type': model_field.resource_type, **model_field.options}
+        value, url, thumbnail_url = (store or get_store()).save(f'{uuid.uuid4().hex}.{ext}', content, **options)
+
+        # Ảnh tải lên sau (job mới hơn) thắng ảnh tải lên trước dù job nào xong trước
+        superseded = MediaUpload.objects.filter(content_type_id=job.content_type_id, object_id=job.object_id,
+                                                field=job.field, id__gt=job.id).exists()
+        if not superseded:
+            model._default_manager.filter(pk=job.object_id).update(**{
+                job.field: value,
+                f'{job.field}_url': url,
+                f'{job.field}_thumbnail_url': thumbnail_url,
+            })
+            if hasattr(model, 'invalidate_catalog'):
+                model.invalidate_catalog()
+        if not is_remote(job.staged_path):
+            os.remove(job.staged_path)
+        job.status, job.error = 'done', ''
+    except Exception as ex:
+        logger.exception('Không thể tải ảnh lên cho MediaUpload %s', upload_id)
+        job.status, job.error = 'failed', str(ex)
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    return job
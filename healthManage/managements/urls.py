@@ -13,6 +13,9 @@ router.register('tag', views.TagViewSet, basename='tag')
 router.register('chatmessage', views.ChatMessageViewSet, basename='chat')
 router.register('connection', views.UserConnectionViewSet, basename='connection')
 router.register('goal', views.UserGoalViewSet, basename='goal')
+router.register('anomaly', views.AnomalyEventViewSet, basename='anomaly')
+router.register('energy-balance', views.EnergyBalanceViewSet, basename='energy-balance')
+router.register('metrics', views.MetricsViewSet, basename='metrics')
 
 urlpatterns = [
     path('', include(router.urls)),
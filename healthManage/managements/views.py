@@ -1,14 +1,44 @@
+from datetime import datetime, timedelta
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, generics, status
 from .serializers import *
-from managements import paginators
+from django.http import StreamingHttpResponse
+from managements import (access, activity_import, archive, energy, export, httpcache, ingest, instrumentation,
+                         paginators, rollups, search)
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from .paginators import Pagination
+from .instrumentation import SerializerTimingMixin, timed_serialize
 from .perms import *
 from rest_framework.parsers import MultiPartParser, JSONParser
+from rest_framework.permissions import SAFE_METHODS
 
-class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
+
+class SparseFieldsMixin:
+    """
+    Với request đọc, queryset chỉ lấy các cột và quan hệ mà ?fields=/?expand= yêu cầu
+    (xem DynamicFieldsMixin.optimize_queryset).
+    """
+
+    def optimize_queryset(self, queryset):
+        serializer = self.get_serializer()
+        if self.request.method not in SAFE_METHODS or not isinstance(serializer, DynamicFieldsMixin):
+            return queryset
+        # Phân trang theo con trỏ đọc các cột sắp xếp từ bản ghi cuối trang
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return serializer.optimize_queryset(queryset, [field.lstrip('-') for field in ordering])
+
+    def filter_queryset(self, queryset):
+        return self.optimize_queryset(super().filter_queryset(queryset))
+
+
+class UserViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ViewSet, generics.CreateAPIView):
     queryset = User.objects.filter(is_active=True)
     serializer_class = UserSerializer
     pagination_class = Pagination
@@ -26,19 +56,48 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
     @action(methods=['get'], url_path='all-users', detail=False)
     def get_all_users(self, request):
         self.check_permissions(request)
-        queryset = User.objects.filter(active=True)
+        queryset = self.optimize_queryset(User.objects.filter(is_active=True).order_by('id'))
         pagination_class = paginators.Pagination()
         paginated_queryset = pagination_class.paginate_queryset(queryset, request, view=self)
-        serializer = UserSerializer(paginated_queryset, many=True)
+        serializer = self.get_serializer(paginated_queryset, many=True)
         return pagination_class.get_paginated_response(serializer.data)
 
     @action(methods=['get'], url_path='current', detail=False)
     def get_current_user(self, request):
         user = request.user
         self.check_object_permissions(request, user)
-        serializer = UserSerializer(user)
+        serializer = self.get_serializer(user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    @action(methods=['get'], url_path='export', detail=False)
+    def export_data(self, request):
+        """
+        Xuất toàn bộ dữ liệu sức khoẻ dạng luồng (không giới hạn số dòng).
+        Tham số: output=csv|ndjson, types=healthrecord,healthdiary,workoutplan,mealplan, gzip=1, user_id (coach/admin).
+        """
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in export.EXPORT_FORMATS:
+            return Response({"message": "output phải là csv hoặc ndjson."}, status=status.HTTP_400_BAD_REQUEST)
+        sources = params.get('types')
+        sources = sources.split(',') if sources else list(export.EXPORT_SOURCES)
+        if any(source not in export.EXPORT_SOURCES for source in sources):
+            return Response({"message": f"types chỉ gồm: {', '.join(export.EXPORT_SOURCES)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        user_id = params.get('user_id') or request.user.id
+        if not access.can_view_user(request.user, user_id):
+            return Response({"message": "Không có quyền xem dữ liệu của người dùng này."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        chunks = export.stream_export(int(user_id), sources, output)
+        filename = f'health-{user_id}.{output}'
+        content_type = 'text/csv; charset=utf-8' if output == 'csv' else 'application/x-ndjson; charset=utf-8'
+        if params.get('gzip') in ('1', 'true'):
+            chunks, filename, content_type = export.gzip_stream(chunks), filename + '.gz', 'application/gzip'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     @action(methods=['patch'], url_path='change-password', detail=False)
     def change_password(self, request):
         user = request.user
@@ -55,23 +114,24 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView):
     def update_info(self, request):
         user = request.user  # lấy user hiện tại
         data = request.data.copy()  # ← dòng cần thêm
-        serializer = UserSerializer(user, data=data, partial=True)
+        serializer = self.get_serializer(user, data=data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(httpcache.CachedResponseMixin, SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Activity.objects.filter(active=True)
     serializer_class = ActivitySerializer
     parser_classes = [JSONParser, MultiPartParser]
+    cache_namespace = 'activity'
 
     def get_permissions(self):
         if self.request.method in ['GET']:
             return [AllowAny()]
         # Các action chỉ cho Admin hoặc Coach: tạo, cập nhật, xóa
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'import_catalog']:
             return [IsAuthenticated(), AdminOrCoachPermission()]
         # Các action còn lại: xem danh sách, xem chi tiết, recent, search, top-calories...
         return [IsAuthenticated()]
@@ -79,15 +139,10 @@ class ActivityViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = self.queryset
 
-        # Lọc theo tên (name) của activity nếu có tham số 'q'
+        # Tìm theo name/description qua chỉ mục ActivitySearchToken nếu có tham số 'q'
         q = self.request.query_params.get('q')
         if q:
-            queryset = queryset.filter(name__icontains=q)
-
-        # Lọc theo thể loại (category_id) nếu có tham số 'category_id'
-        category_id = self.request.query_params.get('category_id')
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
+            queryset = search.search_activities(queryset, q)
 
         # Lọc theo mức calo tiêu thụ (calories_burned) nếu có tham số 'calories_min' và 'calories_max'
         calories_min = self.request.query_params.get('calories_min')
@@ -99,8 +154,42 @@ class ActivityViewSet(viewsets.ModelViewSet):
 
         return queryset
 
-class WorkoutPlanViewSet(viewsets.ModelViewSet):
-    queryset = WorkoutPlan.objects.filter(active=True)
+    @action(methods=['post'], url_path='import', detail=False)
+    def import_catalog(self, request):
+        """
+        Nhập hàng loạt activity: file CSV/JSON (multipart, trường file) hoặc JSON [{...}] / {"activities": [...]}.
+        Activity cùng tên được cập nhật; trả về số dòng tạo mới/cập nhật, tốc độ và lỗi từng dòng.
+        """
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+                rows = activity_import.parse_rows(upload.read(), file_format)
+            else:
+                rows = request.data.get('activities') if isinstance(request.data, dict) else request.data
+                if not isinstance(rows, list):
+                    raise ValueError("Cần gửi file hoặc danh sách activities.")
+        except ValueError as ex:
+            return Response({"message": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > activity_import.IMPORT_MAX_ROWS:
+            return Response({"message": f"Tối đa {activity_import.IMPORT_MAX_ROWS} dòng mỗi lần nhập."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        result = activity_import.import_activities(rows)
+        ok = result['created'] or result['updated']
+        return Response(result, status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['get'], detail=False)
+    def suggest(self, request):
+        """
+        Gợi ý khi đang gõ: tối đa 10 activity khớp tiền tố của q, chỉ trả về id và name.
+        """
+        q = request.query_params.get('q', '')
+        activities = search.search_activities(self.queryset, q, names_only=True).values('id', 'name')[:10]
+        return Response(list(activities))
+
+class WorkoutPlanViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
+    queryset = WorkoutPlan.objects.filter(active=True).select_related('user').prefetch_related('activities')
     serializer_class = WorkoutPlanSerializer
 
     def get_permissions(self):
@@ -108,7 +197,13 @@ class WorkoutPlanViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         elif self.action in ["plans_by_user"]:
             return [IsAuthenticated(), AdminOrCoachPermission()]
-        return [IsAuthenticated]
+        return [IsAuthenticated()]
+
+    def get_queryset(self):
+        return access.filter_visible(self.queryset, self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
 
     @action(methods=['post'], url_path='create-plan', detail=False)
     def create_plan(self, request):
@@ -127,31 +222,63 @@ class WorkoutPlanViewSet(viewsets.ModelViewSet):
         """
         Lấy các kế hoạch tập luyện của người dùng hiện tại.
         """
-        plans = WorkoutPlan.objects.filter(user=request.user)
-        serializer = WorkoutPlanSerializer(plans, many=True)
+        plans = self.optimize_queryset(self.get_queryset().filter(user=request.user))
+        serializer = self.get_serializer(plans, many=True)
         return Response(serializer.data)
 
     @action(methods=['get'], url_path='weekly-summary', detail=False)
     def weekly_summary(self, request):
         """
         Thống kê kế hoạch tập luyện trong tuần hiện tại.
+        Tham số ?range=week|month|quarter|year hoặc ?from=&to= (YYYY-MM-DD) để chọn khoảng thời gian khác.
         """
-        user = request.user
-        today = timezone.now().date()
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-
-        weekly_plans = WorkoutPlan.objects.filter(user=user, date__range=(start_of_week, end_of_week))
-        total_time = sum(
-            [plan.sets * plan.reps * plan.activities.count() for plan in weekly_plans if plan.sets and plan.reps])
-
-        serializer = WorkoutPlanSerializer(weekly_plans, many=True)
+        try:
+            start, end = self.get_summary_window(request)
+        except ValueError as ex:
+            return Response({"message": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        plans = self.get_queryset().filter(user=request.user, date__range=(start, end))
+        # Một truy vấn tổng hợp: JOIN với activities nên sets * reps được cộng một lần cho mỗi activity;
+        # calo tính như energy-balance (calories_burned * sets)
+        summary = plans.aggregate(
+            total_sessions=Count('id', distinct=True),
+            estimated_total_exercise_units=Coalesce(
+                Sum(F('sets') * F('reps'), filter=Q(activities__isnull=False)), Value(0)),
+            estimated_total_calories=energy.burned_calories(),
+        )
+
+        serializer = self.get_serializer(self.optimize_queryset(plans), many=True)
         return Response({
-            "total_sessions": len(weekly_plans),
-            "estimated_total_exercise_units": total_time,
+            "start": start,
+            "end": end,
+            **summary,
             "plans": serializer.data
         })
 
+    def get_summary_window(self, request):
+        params = request.query_params
+        if params.get('from') or params.get('to'):
+            start = parse_date(params.get('from') or '')
+            end = parse_date(params.get('to') or '')
+            if not start or not end or start > end:
+                raise ValueError("Khoảng thời gian không hợp lệ, dùng from=YYYY-MM-DD&to=YYYY-MM-DD.")
+            return start, end
+
+        today = timezone.now().date()
+        window = params.get('range', 'week')
+        if window == 'week':
+            start = today - timedelta(days=today.weekday())
+            return start, start + timedelta(days=6)
+        if window == 'month':
+            start = today.replace(day=1)
+            return start, (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        if window == 'quarter':
+            start = today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+            return start, (start + timedelta(days=93)).replace(day=1) - timedelta(days=1)
+        if window == 'year':
+            return today.replace(month=1, day=1), today.replace(month=12, day=31)
+        raise ValueError("range phải là week, month, quarter hoặc year.")
+
     @action(methods=['get'], url_path='plans-by-user/(?P<user_id>[^/.]+)', detail=False)
     def plans_by_user(self, request, user_id=None):
         """
@@ -161,13 +288,16 @@ class WorkoutPlanViewSet(viewsets.ModelViewSet):
             user = User.objects.get(pk=user_id)
         except User.DoesNotExist:
             return Response({"message": "Người dùng không tồn tại."}, status=status.HTTP_404_NOT_FOUND)
+        if access.is_coach(request.user) and not access.can_view_user(request.user, user.id):
+            return Response({"message": "Người dùng chưa kết nối với huấn luyện viên."},
+                            status=status.HTTP_403_FORBIDDEN)
 
-        plans = WorkoutPlan.objects.filter(user=user)
-        serializer = WorkoutPlanSerializer(plans, many=True)
+        plans = self.optimize_queryset(self.get_queryset().filter(user=user))
+        serializer = self.get_serializer(plans, many=True)
         return Response(serializer.data)
 
-class MealPlanViewSet(viewsets.ModelViewSet):
-    queryset = MealPlan.objects.filter(active=True)
+class MealPlanViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
+    queryset = MealPlan.objects.filter(active=True).select_related('user')
     serializer_class = MealPlanSerializer
 
     def get_permissions(self):
@@ -175,6 +305,12 @@ class MealPlanViewSet(viewsets.ModelViewSet):
             return [IsAuthenticated()]
         return [IsAuthenticated()]
 
+    def get_queryset(self):
+        return access.filter_visible(self.queryset, self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
     @action(methods=['post'], url_path='create-meal-plan', detail=False)
     def create_meal_plan(self, request):
         """
@@ -219,9 +355,16 @@ class MealPlanViewSet(viewsets.ModelViewSet):
 
 
 
-class HealthRecordViewSet(viewsets.ModelViewSet, generics.RetrieveAPIView):
+TREND_WINDOWS = {
+    'day': timedelta(days=30),
+    'week': timedelta(weeks=26),
+    'month': timedelta(days=365),
+}
+
+class HealthRecordViewSet(paginators.CursorModeMixin, SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet, generics.RetrieveAPIView):
     serializer_class = HealthRecordSerializer
     permission_classes = [IsAuthenticated]
+    cursor_pagination_class = paginators.HealthRecordCursorPagination
 
     def get_permissions(self):
         if self.request.user.is_staff and self.action in ['list', 'retrieve']:
@@ -233,18 +376,80 @@ class HealthRecordViewSet(viewsets.ModelViewSet, generics.RetrieveAPIView):
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return HealthRecord.objects.filter(active=True)
-
-        # Người dùng thường chỉ được xem dữ liệu của chính họ
-        return HealthRecord.objects.filter(user=self.request.user, active=True)
+        queryset = HealthRecord.objects.filter(active=True).select_related('user')
+        # Người dùng thường chỉ xem dữ liệu của chính họ, huấn luyện viên xem thêm của học viên
+        queryset = access.filter_visible(queryset, self.request.user)
+        if self.action in ('list', 'retrieve'):
+            # Số liệu cũ đã chuyển sang bảng lưu trữ vẫn đọc được như trước
+            archived = HealthRecordArchive.objects.filter(active=True).select_related('user')
+            return archive.ArchiveChain(queryset, access.filter_visible(archived, self.request.user))
+        return queryset
 
     def perform_create(self, serializer):
          serializer.save(user=self.request.user)
 
+    @action(methods=['post'], url_path='bulk', detail=False)
+    def bulk(self, request):
+        """
+        Nhập hàng loạt số liệu từ thiết bị đeo: {"records": [{...}, ...]} hoặc một mảng.
+        Trả về kết quả theo từng phần tử.
+        """
+        readings = request.data.get('records') if isinstance(request.data, dict) else request.data
+        if not isinstance(readings, list) or not readings:
+            return Response({"message": "Cần gửi danh sách records."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(readings) > ingest.BULK_MAX_RECORDS:
+            return Response({"message": f"Tối đa {ingest.BULK_MAX_RECORDS} số liệu mỗi lần gửi."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = ingest.ingest_health_records(request.user, readings)
+        created = sum(1 for r in results if r['status'] == 'created')
+        return Response({
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(methods=['get'], detail=False)
+    def trends(self, request):
+        """
+        Dữ liệu biểu đồ theo ngày/tuần/tháng, chỉ đọc từ bảng tổng hợp HealthRecordRollup.
+        Tham số: period=day|week|month, metrics=steps,bmi,..., from=, to= (YYYY-MM-DD), user_id (admin).
+        """
+        period = request.query_params.get('period', 'day')
+        if period not in TREND_WINDOWS:
+            return Response({"message": "period phải là day, week hoặc month."}, status=status.HTTP_400_BAD_REQUEST)
+
+        metrics = request.query_params.get('metrics')
+        metrics = metrics.split(',') if metrics else rollups.ROLLUP_METRICS
+        if any(m not in rollups.ROLLUP_METRICS for m in metrics):
+            return Response({"message": f"metrics chỉ gồm: {', '.join(rollups.ROLLUP_METRICS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
 
-class HealthDiaryViewSet(viewsets.ModelViewSet):
-    queryset = HealthDiary.objects.filter(active=True)
+        today = timezone.now().date()
+        try:
+            start = parse_date(request.query_params.get('from') or '') or today - TREND_WINDOWS[period]
+            end = parse_date(request.query_params.get('to') or '') or today
+        except ValueError:
+            return Response({"message": "Ngày không hợp lệ, dùng from=YYYY-MM-DD&to=YYYY-MM-DD."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.query_params.get('user_id') or request.user.id
+        if not access.can_view_user(request.user, user_id):
+            return Response({"message": "Không có quyền xem dữ liệu của người dùng này."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        points = HealthRecordRollup.objects.filter(
+            user_id=user_id, period=period, metric__in=metrics,
+            period_start__range=(rollups.period_start(period, start), end))
+        data = {metric: [] for metric in metrics}
+        with timed_serialize():
+            for point in points:
+                data[point.metric].append(HealthRecordRollupSerializer(point).data)
+        return Response({"period": period, "from": start, "to": end, "metrics": data})
+
+
+class HealthDiaryViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
+    queryset = HealthDiary.objects.filter(active=True).select_related('user')
     serializer_class = HealthDiarySerializer
     permission_classes = [IsAuthenticated]
     def get_permissions(self):
@@ -258,17 +463,84 @@ class HealthDiaryViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return HealthDiary.objects.filter(active=True)
-        return HealthDiary.objects.filter(user=self.request.user)
+        return access.filter_visible(self.queryset, self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ChatMessageViewSet(viewsets.ModelViewSet):
-    queryset = ChatMessage.objects.filter(active=True)
+class ChatMessageViewSet(paginators.CursorModeMixin, SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
+    queryset = ChatMessage.objects.filter(active=True).select_related('sender', 'receiver')
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
+    cursor_pagination_class = paginators.ChatMessageCursorPagination
+
+    def get_queryset(self):
+        # Chỉ trả về tin nhắn mà người dùng hiện tại gửi hoặc nhận
+        user = self.request.user
+        if self.action in ('list', 'retrieve'):
+            # Tách sender OR receiver thành các nhánh riêng để mỗi nhánh đọc theo chỉ mục
+            # (sender|receiver, timestamp, id) kèm LIMIT thay vì gộp rồi sắp xếp mọi tin nhắn của người dùng
+            archived = ChatMessageArchive.objects.filter(active=True).select_related('sender', 'receiver')
+            return archive.ArchiveChain(*(
+                queryset.filter(sender=user) if sent else queryset.filter(receiver=user).exclude(sender=user)
+                for queryset in (self.queryset, archived) for sent in (True, False)))
+        return self.queryset.filter(Q(sender=user) | Q(receiver=user))
+
+    def perform_create(self, serializer):
+        serializer.save(sender=self.request.user)
+
+    @action(methods=['get'], detail=False)
+    def conversations(self, request):
+        """
+        Danh sách cuộc trò chuyện: người đối thoại, tin nhắn cuối và số tin chưa đọc.
+        Gộp cả tin nhắn đã chuyển sang bảng lưu trữ nên cuộc trò chuyện cũ không bị mất.
+        """
+        me = request.user.id
+        threads = {}
+        for model in (ChatMessage, ChatMessageArchive):
+            rows = (model.objects.filter(Q(sender_id=me) | Q(receiver_id=me), active=True)
+                    .annotate(counterpart=Case(When(sender_id=me, then=F('receiver_id')), default=F('sender_id')))
+                    .values('counterpart')
+                    .annotate(last_message_id=Max('id'),
+                              unread_count=Count('id', filter=Q(receiver_id=me, is_read=False)))
+                    .order_by())
+            for row in rows:
+                thread = threads.setdefault(row['counterpart'], {**row, 'unread_count': 0})
+                thread['last_message_id'] = max(thread['last_message_id'], row['last_message_id'])
+                thread['unread_count'] += row['unread_count']
+        threads = sorted(threads.values(), key=lambda thread: -thread['last_message_id'])
+
+        paginator = paginators.Pagination()
+        page = paginator.paginate_queryset(threads, request, view=self)
+        serializer = ConversationSerializer(page, many=True, context=self.get_serializer_context())
+        expand = serializer.child.get_field_trees()[1]
+        # Chỉ JOIN bảng người dùng khi ?expand= yêu cầu thông tin đầy đủ
+        related = {*expand.get('last_message', {}), *(('sender', 'receiver') if 'user' in expand else ())}
+        last_ids = [thread['last_message_id'] for thread in page]
+        messages = ChatMessage.objects.select_related(*related).in_bulk(last_ids)
+        archived = [message_id for message_id in last_ids if message_id not in messages]
+        if archived:
+            messages.update(ChatMessageArchive.objects.select_related(*related).in_bulk(archived))
+        for thread in page:
+            thread['last_message'] = last = messages[thread['last_message_id']]
+            if 'user' in expand:
+                thread['counterpart_user'] = last.receiver if last.sender_id == me else last.sender
+        with timed_serialize():
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+
+    @action(methods=['post'], url_path='mark-read', detail=False)
+    def mark_read(self, request):
+        """
+        Đánh dấu đã đọc toàn bộ tin nhắn user_id gửi cho người dùng hiện tại (một câu lệnh UPDATE).
+        """
+        try:
+            user_id = int(request.data.get('user_id'))
+        except (TypeError, ValueError):
+            return Response({"message": "Cần user_id (số nguyên) của người đối thoại."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        updated = ChatMessage.objects.filter(sender_id=user_id, receiver=request.user, is_read=False).update(is_read=True)
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
 
     @action(methods=['post'], url_path='send-message', detail=False)
     def send_message(self, request):
@@ -289,20 +561,193 @@ class ChatMessageViewSet(viewsets.ModelViewSet):
 
         return Response({"message": "Tin nhắn đã được gửi."}, status=status.HTTP_201_CREATED)
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.filter(active=True)
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
 
-class UserGoalViewSet(viewsets.ModelViewSet):
-    queryset = UserGoal.objects.filter(active=True)
+class UserGoalViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
+    queryset = UserGoal.objects.filter(active=True).select_related('user')
     serializer_class = UserGoalSerializer
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class UserConnectionViewSet(viewsets.ModelViewSet):
-    queryset = UserConnection.objects.filter(active=True)
+    @action(methods=['get'], detail=False)
+    def progress(self, request):
+        """
+        Tiến độ các mục tiêu cân nặng, đọc từ bảng GoalProgress do lệnh project_goals tính hằng đêm.
+        Mục tiêu mới tạo xuất hiện sau lần chạy kế tiếp. Tham số user_id cho huấn luyện viên/admin.
+        """
+        user_id = request.query_params.get('user_id') or request.user.id
+        if not access.can_view_user(request.user, user_id):
+            return Response({"message": "Không có quyền xem dữ liệu của người dùng này."},
+                            status=status.HTTP_403_FORBIDDEN)
+        progress = (GoalProgress.objects.filter(user_id=int(user_id), goal__active=True)
+                    .select_related('goal').order_by('-goal_id'))
+        with timed_serialize():
+            data = GoalProgressSerializer(progress, many=True).data
+        return Response(data)
+
+class UserConnectionViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ModelViewSet):
+    queryset = UserConnection.objects.filter(active=True).select_related('user', 'coach')
     serializer_class = UserConnectionSerializer
     permission_classes = [IsAuthenticated]
+
+    def get_permissions(self):
+        if self.action == 'dashboard':
+            return [IsAuthenticated(), AdminOrCoachPermission()]
+        return super().get_permissions()
+
+    def get_queryset(self):
+        # Chỉ hai bên của kết nối (và quản trị viên) thấy kết nối đó
+        user = self.request.user
+        if access.is_admin(user):
+            return self.queryset
+        return self.queryset.filter(Q(user=user) | Q(coach=user))
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_update(self, serializer):
+        # Kết nối 'accepted' cho huấn luyện viên xem dữ liệu sức khoẻ nên chỉ học viên được đổi trạng thái
+        if serializer.instance.user_id != self.request.user.id:
+            raise PermissionDenied("Chỉ học viên mới được chấp nhận hoặc từ chối kết nối.")
+        serializer.save()
+
+    @action(methods=['get'], detail=False)
+    def dashboard(self, request):
+        """
+        Mọi học viên của huấn luyện viên kèm HealthRecord mới nhất, số kế hoạch tập tuần này và mục tiêu
+        đang theo đuổi. Số truy vấn cố định: một truy vấn học viên với các subquery tương quan (dùng chỉ mục
+        theo user), rồi một truy vấn cho HealthRecord và một cho UserGoal. Admin chọn huấn luyện viên bằng coach_id.
+        """
+        coach_id = request.user.id
+        if request.user.role == Role.Admin:
+            try:
+                coach_id = int(request.query_params.get('coach_id') or coach_id)
+            except ValueError:
+                return Response({"message": "coach_id không hợp lệ."}, status=status.HTTP_400_BAD_REQUEST)
+
+        today = timezone.now().date()
+        week_start = today - timedelta(days=today.weekday())
+        latest_record = (HealthRecord.objects.filter(user=OuterRef('pk'), active=True)
+                         .order_by('-date', '-id').values('id')[:1])
+        week_plans = (WorkoutPlan.objects.filter(user=OuterRef('pk'), active=True,
+                                                 date__range=(week_start, week_start + timedelta(days=6)))
+                      .order_by().values('user').annotate(total=Count('id')).values('total'))
+        active_goal = (UserGoal.objects.filter(Q(target_date__isnull=True) | Q(target_date__gte=today),
+                                               user=OuterRef('pk'), active=True)
+                       .order_by('-id').values('id')[:1])
+        clients = list(User.objects.filter(id__in=access.get_client_ids(coach_id), is_active=True)
+                       .only('id', 'username', 'first_name', 'last_name', 'avatar', 'avatar_thumbnail_url')
+                       .annotate(latest_record_id=Subquery(latest_record),
+                                 week_plans=Coalesce(Subquery(week_plans), Value(0)),
+                                 active_goal_id=Subquery(active_goal))
+                       .order_by('username'))
+
+        records = HealthRecord.objects.in_bulk([c.latest_record_id for c in clients if c.latest_record_id])
+        goals = UserGoal.objects.in_bulk([c.active_goal_id for c in clients if c.active_goal_id])
+        rows = [{
+            "user": client,
+            "latest_record": records.get(client.latest_record_id),
+            "week_plans": client.week_plans,
+            "active_goal": goals.get(client.active_goal_id),
+        } for client in clients]
+        with timed_serialize():
+            data = ClientDashboardSerializer(rows, many=True, context=self.get_serializer_context()).data
+        return Response({"coach": coach_id, "week_start": week_start, "clients": data})
+
+
+class AnomalyEventViewSet(SparseFieldsMixin, SerializerTimingMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Số liệu bất thường do lệnh detect_anomalies tìm ra. Huấn luyện viên xem được của các học viên.
+    Lọc theo user_id, metric=heart_rate|steps, from=, to= (YYYY-MM-DD).
+    """
+    serializer_class = AnomalyEventSerializer
+    pagination_class = paginators.AnomalyEventCursorPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = access.filter_visible(AnomalyEvent.objects.all(), self.request.user)
+        params = self.request.query_params
+        if params.get('user_id'):
+            try:
+                user_id = int(params['user_id'])
+            except ValueError:
+                raise ValidationError({"user_id": "Phải là số nguyên."})
+            if not access.can_view_user(self.request.user, user_id):
+                raise PermissionDenied("Không có quyền xem dữ liệu của người dùng này.")
+            queryset = queryset.filter(user_id=user_id)
+        if params.get('metric'):
+            queryset = queryset.filter(metric=params['metric'])
+        # So sánh trực tiếp với cột recorded_at (không dùng __date) để dùng được chỉ mục
+        try:
+            start, end = parse_date(params.get('from') or ''), parse_date(params.get('to') or '')
+        except ValueError:
+            raise ValidationError({"message": "Ngày không hợp lệ, dùng from=YYYY-MM-DD&to=YYYY-MM-DD."})
+        if start:
+            queryset = queryset.filter(recorded_at__gte=timezone.make_aware(datetime.combine(start, datetime.min.time())))
+        if end:
+            queryset = queryset.filter(
+                recorded_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), datetime.min.time())))
+        return queryset
+
+
+class EnergyBalanceViewSet(viewsets.ViewSet):
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        """
+        Calo nạp vào (MealPlan) và tiêu hao (WorkoutPlan) từng ngày.
+        Tham số: from=, to= (YYYY-MM-DD, mặc định 7 ngày gần nhất), user_id (huấn luyện viên/admin).
+        """
+        params = request.query_params
+        today = timezone.now().date()
+        try:
+            start = parse_date(params.get('from') or '') if params.get('from') else today - timedelta(days=6)
+            end = parse_date(params.get('to') or '') if params.get('to') else today
+        except ValueError:
+            start = end = None
+        if not start or not end or start > end:
+            return Response({"message": "Khoảng thời gian không hợp lệ, dùng from=YYYY-MM-DD&to=YYYY-MM-DD."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= energy.ENERGY_MAX_DAYS:
+            return Response({"message": f"Khoảng thời gian tối đa {energy.ENERGY_MAX_DAYS} ngày."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = params.get('user_id') or request.user.id
+        if not access.can_view_user(request.user, user_id):
+            return Response({"message": "Không có quyền xem dữ liệu của người dùng này."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        days = energy.daily_balance(int(user_id), start, end)
+        with timed_serialize():
+            intake = sum(day['intake'] for day in days)
+            burned = sum(day['burned'] for day in days)
+            data = {
+                "from": start,
+                "to": end,
+                "total": {"intake": intake, "burned": burned, "balance": round(intake - burned, 2)},
+                "days": days,
+            }
+        return Response(data)
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    """
+    Histogram số query, thời gian DB/serialize/render và kích thước response theo view của tiến trình
+    đang phục vụ request (xem managements.instrumentation).
+    """
+    permission_classes = [IsAuthenticated, AdminPermission]
+
+    def list(self, request):
+        with timed_serialize():
+            data = instrumentation.registry.snapshot()
+        return Response(data)
+
+    @action(methods=['post'], detail=False, url_path='reset')
+    def reset(self, request):
+        instrumentation.registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)